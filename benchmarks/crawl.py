@@ -0,0 +1,344 @@
+"""
+Offline end-to-end benchmark: every spider crawled against recorded responses.
+
+The fixtures of each spider (see benchmarks.fixtures) are served by a local HTTP
+server, and each spider runs in its own process with the project's real settings,
+middlewares and pipelines. Only the transport is swapped (FixtureDownloadHandler),
+together with politeness delays and feed exports. Reported per spider:
+pages/sec, items/sec, CPU time per item, peak RSS and the time spent inside each
+callback, and the parse time per listing page by extraction path (schema.org
+structured data or card selectors). Results are saved as JSON and compared with
+the previous run, so every performance change can be checked against a baseline.
+
+Usage: python -m benchmarks.crawl [spider ...] [--repeat 3] [--compare PATH] [--check]
+       python -m benchmarks.crawl umart sca --extraction both   # structured data vs selectors
+       python -m benchmarks.crawl impersonate --parse-pool 4    # parse in 4 worker processes
+       python -m benchmarks.crawl --record umart      # record live fixtures
+"""
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import queue
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import scrapy
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+
+from benchmarks.fixtures import FixtureStore, build_fixtures, fixture_path, start_server
+
+FIXTURES_DIR = 'benchmarks/recordings'
+RESULTS_DIR = 'benchmarks/results'
+
+# Metrics compared between runs: name -> True when higher is better
+COMPARED = {'pages_per_sec': True, 'items_per_sec': True, 'cpu_ms_per_item': False, 'peak_rss_mb': False}
+
+
+def bench_overrides(settings, server_url, mongo=False, log_level='ERROR'):
+    """
+    Settings applied on top of the project's (at cmdline priority, so they also win
+    over spider custom_settings): the transport points at the fixture server and
+    politeness delays and feed exports are off.
+    """
+    pipelines = settings.getdict('ITEM_PIPELINES')
+    overrides = {
+        'DOWNLOAD_HANDLERS': {
+            'http': 'benchmarks.fixtures.FixtureDownloadHandler',
+            'https': 'benchmarks.fixtures.FixtureDownloadHandler',
+        },
+        'FIXTURE_SERVER_URL': server_url,
+        # Per-callback time comes from the timing histograms
+        'TIMING_ENABLED': True,
+        'TIMING_PROMETHEUS_ENABLED': False,
+        'ITEM_PIPELINES': pipelines,
+        'DOWNLOAD_DELAY': 0,
+        'AUTOTHROTTLE_ENABLED': False,
+        'ROBOTSTXT_OBEY': False,
+        'HTTPCACHE_ENABLED': False,
+        'TELNETCONSOLE_ENABLED': False,
+        'CLOSESPIDER_TIMEOUT': 0,
+        'JOBDIR': None,
+        'FEEDS': {},
+        'LOG_LEVEL': log_level,
+    }
+    if mongo:
+        # In-memory Mongo: the pipeline's work is measured, not a database server's
+        overrides['MONGO_CLIENT_CLASS'] = 'mongomock.MongoClient'
+        overrides['MONGO_URI'] = 'mongodb://localhost:27017'
+    else:
+        pipelines.pop('retail_spiders.pipelines.MongoPipeline', None)
+    return overrides
+
+
+def _run_spider(name, settings, overrides, results):
+    # One process per run: a fresh reactor, and RSS/CPU that belong to this spider alone
+    import resource
+
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+
+    # Settings lose their priorities on the way to a spawned process: re-apply the overrides
+    settings = Settings(settings)
+    settings.setdict(overrides, priority='cmdline')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(name)
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    process.crawl(crawler)
+    process.start()
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    stats = crawler.stats.get_stats()
+    pages = stats.get('downloader/response_count', 0)
+    items = stats.get('item_scraped_count', 0)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    callbacks = {}
+    for key, value in stats.items():
+        if key.startswith('timing/callback/') and key.endswith('/sum'):
+            callback = key[len('timing/callback/'):-len('/sum')]
+            calls = stats.get(f'timing/callback/{callback}/count', 0)
+            callbacks[callback] = {'calls': calls, 'total_ms': round(value * 1e3, 1),
+                                   'ms_per_call': round(value * 1e3 / calls, 3) if calls else 0,
+                                   'p95_ms': round(stats.get(f'timing/callback/{callback}/p95', 0) * 1e3, 3)}
+    extraction = {}
+    for path in ('structured', 'selectors'):
+        pages_read = stats.get(f'extraction/{path}/pages', 0)
+        if pages_read:
+            extraction[path] = {'pages': pages_read,
+                                'ms_per_page': round(stats.get(f'extraction/{path}/seconds', 0) * 1e3 / pages_read, 3)}
+    parse_pool = {}
+    tasks = stats.get('parse_pool/tasks', 0)
+    if tasks:
+        parse_pool = {'tasks': tasks, 'inline': stats.get('parse_pool/inline', 0),
+                      'queue_ms_per_task': round(stats.get('parse_pool/queue_seconds', 0) * 1e3 / tasks, 3),
+                      'run_ms_per_task': round(stats.get('parse_pool/run_seconds', 0) * 1e3 / tasks, 3),
+                      'max_queue_ms': round(stats.get('parse_pool/max_queue_seconds', 0) * 1e3, 3),
+                      'max_pending': stats.get('parse_pool/max_pending', 0)}
+    results.put({
+        'pages': pages,
+        'items': items,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 1),
+        'items_per_sec': round(items / elapsed, 1),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_ms_per_item': round(cpu * 1e3 / items, 4) if items else None,
+        'peak_rss_mb': round(after.ru_maxrss / 1024, 1),  # ru_maxrss is in KiB on Linux
+        'missing_fixtures': stats.get('downloader/response_status_count/404', 0),
+        'finish_reason': stats.get('finish_reason'),
+        'callbacks': callbacks,
+        'extraction': extraction,
+        'parse_pool': parse_pool,
+    })
+
+
+def run_spider(name, settings, overrides):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=_run_spider, args=(name, settings.copy_to_dict(), overrides, results),
+                          name=f'bench-{name}')
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=5)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Benchmark of '{name}' died (exit code {process.exitcode})")
+    process.join()
+    return result
+
+
+def run_benchmark(spiders, fixtures_dir, repeat=1, mongo=False, log_level='ERROR', extraction='auto', parse_pool=0):
+    """
+    Returns {spider: result of the median run (by wall time)}. `extraction`: 'auto'
+    (structured data when a page has it), 'selectors' (structured data off), or
+    'both' (each spider also runs with it off, reported as '<spider>:selectors').
+    `parse_pool`: number of parse pool workers (0 = parse on the reactor thread).
+    """
+    store = FixtureStore()
+    for name in spiders:
+        path = fixture_path(fixtures_dir, name)
+        if not os.path.exists(path):
+            count = build_fixtures(fixtures_dir, name)
+            logging.info(f"🧪 [BENCH] No recording for '{name}': generated {count} synthetic responses in {path}")
+        store.load(path)
+    server = start_server(store)
+    settings = get_project_settings()
+    overrides = bench_overrides(settings, f'http://127.0.0.1:{server.server_port}/', mongo=mongo, log_level=log_level)
+    if parse_pool:
+        overrides.update(PARSE_POOL_ENABLED=True, PARSE_POOL_WORKERS=parse_pool)
+    variants = {'auto': [('', True)], 'selectors': [('', False)], 'both': [('', True), (':selectors', False)]}[extraction]
+
+    results = {}
+    try:
+        for name in spiders:
+            for suffix, structured in variants:
+                variant = dict(overrides, STRUCTURED_DATA_ENABLED=structured)
+                runs = sorted((run_spider(name, settings, variant) for _ in range(repeat)), key=lambda r: r['seconds'])
+                results[name + suffix] = dict(runs[len(runs) // 2], runs=len(runs),
+                                              seconds_stdev=round(statistics.pstdev(r['seconds'] for r in runs), 3))
+    finally:
+        server.shutdown()
+    if store.misses:
+        logging.warning(f"⚠️ [BENCH] {len(store.misses)} URLs had no fixture, e.g. {next(iter(store.misses))}")
+    return results
+
+
+def record(spiders, fixtures_dir, max_pages=0):
+    """Crawls the live sites once and keeps every response as the spider's fixtures."""
+    settings = get_project_settings()
+    extensions = settings.getdict('EXTENSIONS')
+    extensions['benchmarks.fixtures.FixtureRecorder'] = 900
+    pipelines = settings.getdict('ITEM_PIPELINES')
+    pipelines.pop('retail_spiders.pipelines.MongoPipeline', None)
+    overrides = {
+        'EXTENSIONS': extensions,
+        'ITEM_PIPELINES': pipelines,
+        'FIXTURE_RECORD_DIR': fixtures_dir,
+        'CLOSESPIDER_PAGECOUNT': max_pages,
+        'FEEDS': {},
+    }
+    for name in spiders:
+        result = run_spider(name, settings, overrides)
+        print(f"🎙️ {name}: recorded {result['pages']} responses ({result['finish_reason']})")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_results(results_dir, exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(results_dir, 'crawl_*.json')) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(current, baseline, tolerance):
+    """Prints the change of each metric vs the baseline. Returns the regressions found."""
+    regressions = []
+    print(f"{'spider':<12} {'metric':<16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current.items():
+        previous = baseline['spiders'].get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = ' ⚠️'
+                regressions.append((name, metric, change))
+            print(f"{name:<12} {metric:<16} {old:>10} {new:>10} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def format_results(results):
+    lines = [f"{'spider':<12} {'pages':>6} {'items':>7} {'sec':>7} {'pages/s':>8} {'items/s':>9} "
+             f"{'cpu ms/item':>11} {'rss MB':>7}  callbacks (ms/call)"]
+    for name, r in results.items():
+        callbacks = ', '.join(f"{cb} {c['ms_per_call']}" for cb, c in sorted(r['callbacks'].items()))
+        lines.append(f"{name:<12} {r['pages']:>6} {r['items']:>7} {r['seconds']:>7.2f} {r['pages_per_sec']:>8.1f} "
+                     f"{r['items_per_sec']:>9.1f} {r['cpu_ms_per_item'] or 0:>11.3f} {r['peak_rss_mb']:>7.1f}  {callbacks}")
+        if r.get('extraction'):
+            paths = ', '.join(f"{path} {e['ms_per_page']} ms/page ({e['pages']} pages)" for path, e in r['extraction'].items())
+            lines.append(f"{'':<12} extraction: {paths}")
+        if r.get('parse_pool'):
+            p = r['parse_pool']
+            lines.append(f"{'':<12} parse pool: {p['tasks']} tasks ({p['inline']} inline), queue {p['queue_ms_per_task']} ms/task "
+                         f"(max {p['max_queue_ms']}), run {p['run_ms_per_task']} ms/task, max pending {p['max_pending']}")
+        if r['missing_fixtures']:
+            lines.append(f"{'':<12} ⚠️ {r['missing_fixtures']} requests had no fixture")
+    return '\n'.join(lines)
+
+
+def format_extraction(results):
+    """Parse time per listing page of each spider, structured data vs card selectors."""
+    lines = [f"{'spider':<12} {'structured':>16} {'selectors':>16} {'change':>8}"]
+    for name, r in results.items():
+        if ':' in name:
+            continue
+        times = {**r.get('extraction', {}), **results.get(f'{name}:selectors', {}).get('extraction', {})}
+        structured, selectors = times.get('structured'), times.get('selectors')
+        if not structured:
+            lines.append(f"{name:<12} {'-':>16} {selectors['ms_per_page'] if selectors else '-':>13} ms  (structured data not used)")
+            continue
+        change = f"{structured['ms_per_page'] / selectors['ms_per_page'] - 1:>+7.1%}" if selectors else '-'
+        lines.append(f"{name:<12} {structured['ms_per_page']:>13} ms "
+                     f"{selectors['ms_per_page'] if selectors else '-':>13} ms {change:>8}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end spider benchmark.')
+    parser.add_argument('spiders', nargs='*', help='Spiders to run (default: all registered)')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='Fixture directory (missing ones are generated)')
+    parser.add_argument('--results', default=RESULTS_DIR, help='Where results are saved')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per spider; the median run is reported')
+    parser.add_argument('--mongo', action='store_true', help='Keep MongoPipeline (against mongomock)')
+    parser.add_argument('--compare', help='Results file to compare with (default: the previous run)')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Relative change reported as a regression')
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 on a regression')
+    parser.add_argument('--no-save', action='store_true', help='Do not save the results')
+    parser.add_argument('--record', action='store_true', help='Record fixtures from the live sites instead')
+    parser.add_argument('--max-pages', type=int, default=0, help='With --record: stop after this many pages')
+    parser.add_argument('--extraction', choices=('auto', 'selectors', 'both'), default='auto',
+                        help="Listing extraction: structured data when present, selectors only, or both (compared)")
+    parser.add_argument('--parse-pool', type=int, default=0, metavar='WORKERS',
+                        help='Parse pages in this many worker processes (PARSE_POOL_ENABLED)')
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    spiders = args.spiders or SpiderLoader.from_settings(get_project_settings()).list()
+    if args.record:
+        return record(spiders, args.fixtures, args.max_pages)
+
+    results = run_benchmark(spiders, args.fixtures, args.repeat, args.mongo, args.log_level, args.extraction,
+                            args.parse_pool)
+    print(format_results(results))
+    if args.extraction == 'both':
+        print(format_extraction(results))
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'scrapy': scrapy.__version__,
+        'machine': f'{platform.machine()} x{os.cpu_count()}',
+        'fixtures': os.path.abspath(args.fixtures),
+        'spiders': results,
+    }
+    path = None
+    if not args.no_save:
+        path = os.path.join(args.results, f"crawl_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.json")
+        os.makedirs(args.results, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results saved to {path}")
+
+    baseline_path = args.compare or latest_results(args.results, exclude=path)
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        print(f"📈 Compared with {baseline_path} ({baseline.get('git_revision')})")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions and args.check:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark: compiled ExtractionSpec vs the original per-product ItemLoader path.
+
+For every spider a synthetic listing page (or API payload) is built, both paths
+extract it, their items are checked for equality and the time per page is reported.
+
+Usage: python -m benchmarks.extraction
+"""
+import json
+import random
+import string
+import timeit
+
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.loader import ItemLoader
+
+from retail_spiders.items import ProductItem, parse_price_cents
+from retail_spiders.spiders.bunnings import BunningsSpider
+from retail_spiders.spiders.officeworks import OfficeworksSpider
+from retail_spiders.spiders.ple import PLEComputers
+from retail_spiders.spiders.sca import ScaSpider
+from retail_spiders.spiders.umart import UmartSpider
+
+rng = random.Random(0)
+
+
+def text(n):
+    return ''.join(rng.choices(string.ascii_letters + ' ', k=n)).strip() or 'x'
+
+
+def price():
+    return f"${rng.randint(1, 3000):,}.{rng.randint(0, 99):02d}"
+
+
+# --- Original ItemLoader implementations (as they were in the spiders) ---
+
+def loader_bunnings(records, response):
+    items = []
+    for product in records:
+        l = ItemLoader(item=ProductItem())
+        l.add_value('name', product.get('title', ''))
+        l.add_value('price', '$' + str(product.get('price', 0)))
+        l.add_value('url', response.urljoin(product.get('productroutingurl', '')))
+        l.add_value('retailer', 'Bunnings')
+        items.append(l.load_item())
+    return items
+
+
+def loader_officeworks(hits, response):
+    items = []
+    for hit in hits:
+        l = ItemLoader(item=ProductItem())
+        l.add_value('retailer', 'Officeworks')
+        l.add_value('name', hit.get('name'))
+        l.add_value('price', str(hit.get('price', 0) / 100))
+        l.add_value('url', f"https://www.officeworks.com.au/shop/officeworks/p/{hit.get('urlKeyword')}")
+        items.append(l.load_item())
+    return items
+
+
+def loader_cards(response, cards, fields, retailer):
+    items = []
+    for card in response.xpath(cards):
+        l = ItemLoader(item=ProductItem(), selector=card)
+        for name, (kind, query) in fields.items():
+            if kind == 'css':
+                l.add_css(name, query)
+            else:
+                l.add_xpath(name, query)
+        l.add_value('retailer', retailer)
+        item = l.load_item()
+        if 'url' in item:
+            item['url'] = response.urljoin(item['url'])
+        items.append(item)
+    return items
+
+
+def loader_sca(response):
+    items = []
+    for card in response.xpath('//li[contains(@class, "grid-tile")]'):
+        l = ItemLoader(item=ProductItem(), selector=card)
+        title = card.xpath('.//div[@class="product-name"]/a/@title').get()
+        title = title.replace("Go to Product: ", "") if title else None
+        l.add_value('name', title)
+        l.add_xpath('price', './/span[@class="the-price"]/text()')
+        l.add_xpath('url', './/div[@class="product-name"]/a/@href')
+        l.add_value('retailer', 'Supercheap Auto')
+        item = l.load_item()
+        if 'url' in item:
+            item['url'] = response.urljoin(item['url'])
+        items.append(item)
+    return items
+
+
+# --- Synthetic pages ---
+
+def html_response(url, cards_html):
+    body = f'<html><body><div class="nav">{text(2000)}</div><ul>{cards_html}</ul></body></html>'
+    return HtmlResponse(url, body=body.encode(), encoding='utf-8')
+
+
+def umart_page(n=100):
+    cards = ''.join(
+        f'<li class="goods_info"><div class="goods_name"><a href="/product/{i}"><span itemprop="name">{text(50)}</span></a></div>'
+        f'<span itemprop="price">{price()}</span><p>{text(200)}</p></li>' for i in range(n))
+    return html_response('https://www.umart.com.au/cpu', cards)
+
+
+def ple_page(n=60):
+    cards = ''.join(
+        f'<div class="itemGrid2TileStandard"><div class="itemGrid2TileStandardDescription"><a href="/products/{i}">{text(50)}</a></div>'
+        f'<div class="itemGrid2TileStandardPrice">\n {price()} </div><p>{text(200)}</p></div>' for i in range(n))
+    return html_response('https://www.ple.com.au/Categories/1/cpu', cards)
+
+
+def sca_page(n=60):
+    cards = ''.join(
+        f'<li class="grid-tile"><div class="product-name"><a href="/p/{i}" title="Go to Product: {text(50)}">x</a></div>'
+        f'<span class="the-price">{price()}</span><p>{text(200)}</p></li>' for i in range(n))
+    return html_response('https://www.supercheapauto.com.au/4wd-recovery', cards)
+
+
+def bunnings_records(n=36):
+    return [{'title': text(60), 'price': rng.randint(5, 900), 'productroutingurl': f'/p/{i}'} for i in range(n)]
+
+
+def officeworks_hits(n=100):
+    return [{'name': text(60), 'price': rng.randint(500, 200000), 'urlKeyword': text(20).replace(' ', '-')} for _ in range(n)]
+
+
+def cases():
+    bunnings = bunnings_records()
+    bunnings_response = TextResponse('https://www.bunnings.com.au/products/garden', body=b'')
+    hits = officeworks_hits()
+    api_response = TextResponse('https://k535caawve-dsn.algolia.net/1/indexes/*/queries', body=json.dumps({'results': [{'hits': hits}]}).encode())
+    umart, ple, sca = umart_page(), ple_page(), sca_page()
+
+    yield ('bunnings (36 records)',
+           lambda: loader_bunnings(bunnings, bunnings_response),
+           lambda: BunningsSpider.spec.extract_records(bunnings, bunnings_response))
+    yield ('officeworks (100 hits)',
+           lambda: loader_officeworks(hits, api_response),
+           lambda: OfficeworksSpider.spec.extract_records(hits, api_response))
+    yield ('umart (100 cards)',
+           lambda: loader_cards(umart, '//li[contains(@class, "goods_info")]', {
+               'name': ('xpath', './/span[@itemprop="name"]/text()'),
+               'price': ('xpath', './/span[@itemprop="price"]/text()'),
+               'url': ('xpath', './/div[@class="goods_name"]/a/@href')}, 'Umart'),
+           lambda: UmartSpider.spec.extract_cards(umart))
+    yield ('ple (60 cards)',
+           lambda: loader_cards(ple, '//div[contains(concat(" ", normalize-space(@class), " "), " itemGrid2TileStandard ")]', {
+               'name': ('css', 'div.itemGrid2TileStandardDescription a::text'),
+               'price': ('css', 'div.itemGrid2TileStandardPrice::text'),
+               'url': ('css', 'div.itemGrid2TileStandardDescription a::attr(href)')}, 'PLE Computers'),
+           lambda: PLEComputers.spec.extract_cards(ple))
+    yield ('sca (60 cards)',
+           lambda: loader_sca(sca),
+           lambda: ScaSpider.spec.extract_cards(sca))
+
+
+def same_items(loader_items, spec_items):
+    """Spec items may carry extra fields (e.g. price_cents); prices are compared as amounts."""
+    if len(loader_items) != len(spec_items):
+        return False
+    for old, new in zip(loader_items, spec_items):
+        for key, value in old.items():
+            if key == 'price':
+                if parse_price_cents(value) != parse_price_cents(new.get(key)):
+                    return False
+            elif new.get(key) != value:
+                return False
+    return True
+
+
+def main():
+    print(f"{'spider':>24} {'ItemLoader':>12} {'spec':>10} {'speedup':>8}  (ms/page)")
+    for label, loader, spec in cases():
+        assert same_items(loader(), spec()), label
+        t_loader = min(timeit.repeat(loader, number=20, repeat=3)) / 20 * 1e3
+        t_spec = min(timeit.repeat(spec, number=20, repeat=3)) / 20 * 1e3
+        print(f"{label:>24} {t_loader:>12.2f} {t_spec:>10.2f} {t_loader / t_spec:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
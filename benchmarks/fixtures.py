@@ -0,0 +1,434 @@
+"""
+Recorded responses for the offline crawl benchmark, and the local server that replays them.
+
+A fixture file (`<dir>/<spider>.jsonl.gz`) holds one JSON line per response:
+method, URL, a hash of the request body (Algolia queries are POSTs), status,
+headers and the base64 body. Responses are looked up by (method, canonical URL,
+body hash), so a spider replayed against its fixtures issues exactly the requests
+it issued while recording.
+
+Fixtures come from two places:
+* Recorded from the live sites with `python -m benchmarks.crawl --record <spider>`
+  (FixtureRecorder keeps every decoded response the spider received).
+* Built by the synthetic generators below when no recording exists. They follow
+  each retailer's real URL scheme and page shapes (listing HTML, __NEXT_DATA__,
+  Algolia multi-query JSON) and are seeded, so every machine benchmarks the same bytes.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import string
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin
+
+from scrapy import Request, signals
+from scrapy.core.downloader.handlers.base import BaseDownloadHandler
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.exceptions import NotConfigured
+from w3lib.url import canonicalize_url
+
+from retail_spiders.spiders.bunnings import BunningsSpider
+from retail_spiders.spiders.officeworks import OfficeworksSpider
+from retail_spiders.spiders.sca import ScaSpider
+from retail_spiders.spiders.umart import UmartSpider
+
+HTML = 'text/html; charset=utf-8'
+JSON = 'application/json; charset=UTF-8'
+
+# Hop-by-hop / transfer headers that no longer describe a recorded (decoded) body
+SKIP_HEADERS = {b'content-encoding', b'content-length', b'transfer-encoding', b'connection'}
+
+
+def fixture_key(method, url, body=b''):
+    return method.upper(), canonicalize_url(url), hashlib.sha1(body or b'').hexdigest()
+
+
+def fixture_path(directory, spider_name):
+    return os.path.join(directory, f'{spider_name}.jsonl.gz')
+
+
+def make_record(method, url, status, headers, body, request_body=b''):
+    """headers: {name: [values]} as str."""
+    return {
+        'method': method,
+        'url': url,
+        'body_sha1': fixture_key(method, url, request_body)[2],
+        'status': status,
+        'headers': headers,
+        'body': base64.b64encode(body).decode('ascii'),
+    }
+
+
+def write_fixtures(path, records):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+            count += 1
+    return count
+
+
+def read_fixtures(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class FixtureRecorder:
+    """
+    Extension that appends every response a live crawl receives to its fixture file.
+    Bodies are stored after the downloader middlewares ran (i.e. decompressed).
+
+    Enabled by the FIXTURE_RECORD_DIR setting (set by `benchmarks.crawl --record`).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.file = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('FIXTURE_RECORD_DIR')
+        if not directory:
+            raise NotConfigured
+        ext = cls(directory)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        path = fixture_path(self.directory, spider.name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        spider.logger.info(f"🎙️ [FIXTURES] Recording responses to {path}")
+
+    def spider_closed(self, spider):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def response_received(self, response, request, spider):
+        if self.file is None or request.meta.get('page_cache_hit'):
+            return
+        headers = {
+            name.decode('latin-1'): [v.decode('latin-1') for v in values]
+            for name, values in response.headers.items() if name.lower() not in SKIP_HEADERS
+        }
+        record = make_record(request.method, request.url, response.status, headers, response.body, request.body)
+        self.file.write(json.dumps(record) + '\n')
+
+
+# =============================================================================
+# Local stand-in server
+# =============================================================================
+
+class FixtureStore:
+    """All loaded fixtures, keyed by fixture_key. Misses are counted per URL."""
+
+    def __init__(self):
+        self.responses = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def load(self, path):
+        count = 0
+        for record in read_fixtures(path):
+            key = (record['method'].upper(), canonicalize_url(record['url']), record['body_sha1'])
+            headers = [(name, value) for name, values in record['headers'].items() for value in values]
+            self.responses[key] = (record['status'], headers, base64.b64decode(record['body']))
+            count += 1
+        return count
+
+    def get(self, method, url, body):
+        response = self.responses.get(fixture_key(method, url, body))
+        if response is None:
+            with self.lock:
+                self.misses[url] = self.misses.get(url, 0) + 1
+        return response
+
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    """Answers with the recorded response for the URL in the X-Fixture-Url header."""
+    protocol_version = 'HTTP/1.1'
+    store = None
+
+    def _serve(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        url = self.headers.get('X-Fixture-Url', '')
+        response = self.store.get(self.command, url, body)
+        if response is None:
+            status, headers, payload = 404, [('Content-Type', 'text/plain')], f'No fixture for {url}'.encode()
+        else:
+            status, headers, payload = response
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_HEAD = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(store):
+    """Serves the store on a random local port from a background thread. Returns the server."""
+    handler = type('BoundFixtureRequestHandler', (FixtureRequestHandler,), {'store': store})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FixtureDownloadHandler(BaseDownloadHandler):
+    """
+    Sends every http(s) request to the local fixture server over plain HTTP and hands
+    the response back under the original URL. Spiders, middlewares and pipelines run
+    unchanged; only the transport (TLS impersonation) is left out of the measurement.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.server_url = crawler.settings.get('FIXTURE_SERVER_URL')
+        if not self.server_url:
+            raise NotConfigured('FIXTURE_SERVER_URL is not set')
+        self.http = HTTP11DownloadHandler.from_crawler(crawler)
+
+    async def download_request(self, request):
+        local = request.replace(url=self.server_url)
+        local.headers['X-Fixture-Url'] = request.url
+        response = await self.http.download_request(local)
+        request.meta['download_latency'] = local.meta.get('download_latency')
+        return response.replace(url=request.url)
+
+    async def close(self):
+        await self.http.close()
+
+
+# =============================================================================
+# Synthetic recordings
+# =============================================================================
+
+class Synth:
+    """Seeded filler text, prices and page chrome shared by the generators."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def text(self, n):
+        return ''.join(self.rng.choices(string.ascii_letters + '     ', k=n)).strip() or 'x'
+
+    def slug(self, n=24):
+        return ''.join(self.rng.choices(string.ascii_lowercase + '-', k=n)).strip('-') or 'x'
+
+    def price(self):
+        return f"${self.rng.randint(1, 3000):,}.{self.rng.randint(0, 99):02d}"
+
+    def chrome(self, nav_links=300, scripts=20):
+        """Header navigation, inline scripts and footer: the bulk of a real retail page."""
+        nav = ''.join(f'<li><a href="/{self.slug()}">{self.text(20)}</a></li>' for _ in range(nav_links))
+        script = ''.join(f'<script>window.__cfg{i}={json.dumps(self.text(2000))};</script>' for i in range(scripts))
+        return f'<header><ul class="menu">{nav}</ul></header>{script}', f'<footer>{self.text(3000)}</footer>'
+
+    def html(self, url, content, title='Shop'):
+        head, foot = self.chrome()
+        body = f'<!DOCTYPE html><html><head><title>{title}</title></head><body>{head}<main>{content}</main>{foot}</body></html>'
+        return make_record('GET', url, 200, {'Content-Type': [HTML]}, body.encode('utf-8'))
+
+
+def normalize(url):
+    """The URL as Scrapy will send it."""
+    return Request(url).url
+
+
+def build_bunnings(synth, categories=10):
+    start = 'https://www.bunnings.com.au/products/garden'
+    page_size = 36
+    subs = [{'code': synth.slug(8), 'displayName': synth.text(18), 'internalPath': f'/products/garden/{synth.slug(16)}'}
+            for _ in range(categories)]
+    other = [{'workShopCategory': synth.text(10), 'levels': [
+        {'code': synth.slug(8), 'displayName': synth.text(18), 'internalPath': '/' + synth.slug(30)} for _ in range(40)
+    ]} for _ in range(12)]
+    navigation = {'levels': other[:6] + [{'workShopCategory': 'Garden', 'levels': subs}] + other[6:]}
+    content = [synth.text(400) for _ in range(100)]
+
+    def page(url, results=(), total=0):
+        state = {'props': {'pageProps': {'initialState': {'global': {
+            'searchResults': {'data': {'results': list(results), 'totalCount': total}},
+            'globalData': {
+                'navigation': navigation,
+                'globalConfigData': {'searchConfig': {'global': {'numberOfSearchResults': str(page_size)}}},
+                'content': content,
+            },
+        }}}}}
+        script = f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(state)}</script>'
+        return synth.html(url, f'<div id="__next"></div>{script}', 'Bunnings')
+
+    yield page(start)
+    for sub in subs:
+        first = normalize(urljoin(start, sub['internalPath'].lstrip('/') + '?page=1'))
+        total = synth.rng.randint(100, 700)
+        pages = math.ceil(total / page_size)
+        for number in range(1, pages + 1):
+            count = page_size if number < pages else total - page_size * (pages - 1)
+            results = [{'raw': {'title': synth.text(60), 'price': synth.rng.randint(5, 900),
+                                'productroutingurl': f'/{synth.slug(30)}_p{synth.rng.randint(1000000, 9999999)}',
+                                'description': synth.text(300), 'brand': synth.text(10)}} for _ in range(count)]
+            url = first if number == 1 else normalize(BunningsSpider.pagination.page_url(first, number, page_size))
+            yield page(url, results, total)
+
+
+def build_officeworks(synth, brands=6):
+    start = 'https://www.officeworks.com.au/shop/officeworks/c/technology/mobile-phones/'
+    spider = OfficeworksSpider()
+    brand_names = [synth.text(8).replace(' ', '') or 'Brand' for _ in range(brands)]
+    slugs = [f'{name.lower()}-phones-{i}' for i, name in enumerate(brand_names)]
+
+    tiles = ''.join(f'<a class="CategoryTile_tile__x1" href="/shop/officeworks/c/technology/mobile-phones/{slug}">'
+                    f'<img src="/{synth.slug()}.jpg"/><h2>{name}</h2></a>' for name, slug in zip(brand_names, slugs))
+    yield synth.html(start, f'<section>{tiles}</section>', 'Mobile Phones')
+
+    seo_paths = []
+    for i, (name, slug) in enumerate(zip(brand_names, slugs)):
+        url = normalize(urljoin(start, f'/shop/officeworks/c/technology/mobile-phones/{slug}'))
+        if i % 3 == 2:
+            # Some brands have no 'All ... Phones' tile: the spider falls back to the brand path
+            sub_tiles, seo = '', f'technology/mobile-phones/{slug}'
+        else:
+            label = f'All {name} Phones'
+            sub_tiles = f'<a class="CategoryTile_tile__x1" href="{url}/all"><h3>{label}</h3></a>'
+            seo = f'technology/mobile-phones/{slug}/{label.lower().replace(" ", "-")}'
+        sub_tiles += ''.join(f'<a class="CategoryTile_tile__x1" href="{url}/{synth.slug(10)}"><h3>{synth.text(12)}</h3></a>'
+                             for _ in range(4))
+        seo_paths.append(seo)
+        yield synth.html(url, f'<section>{sub_tiles}</section>', name)
+
+    def hits(n):
+        return [{'name': synth.text(60), 'price': synth.rng.randint(500, 200000), 'urlKeyword': synth.slug(30),
+                 'description': synth.text(500), 'brand': synth.text(8), 'objectID': synth.slug(12)} for _ in range(n)]
+
+    def api(queries, results):
+        request = spider.create_algolia_request(queries)
+        body = json.dumps({'results': results}).encode('utf-8')
+        return make_record('POST', request.url, 200, {'Content-Type': [JSON]}, body, request.body)
+
+    batch_size = OfficeworksSpider.custom_settings['ALGOLIA_BATCH_SIZE']
+    for seo in seo_paths:
+        pages = synth.rng.randint(1, 12)
+        yield api([(seo, 0)], [{'hits': hits(100), 'nbPages': pages, 'page': 0}])
+        remaining = [(seo, page) for page in range(1, pages)]
+        for i in range(0, len(remaining), batch_size):
+            batch = remaining[i:i + batch_size]
+            yield api(batch, [{'hits': hits(100 if page < pages - 1 else 37), 'nbPages': pages, 'page': page}
+                              for _, page in batch])
+
+
+def build_umart(synth, categories=12):
+    start = 'https://www.umart.com.au/pc-parts-1'
+    planner = UmartSpider.pagination
+    names = [synth.text(12) for _ in range(categories)]
+    hrefs = [f'/{synth.slug(12)}-{i}' for i in range(categories)]
+    links = ''.join(f'<div class="cat_item"><div class="cat_name"><a href="{href}">{name}</a></div></div>'
+                    for name, href in zip(names, hrefs))
+    yield synth.html(start, f'<div class="top_categories">{links}</div>', 'PC Parts')
+
+    for href in hrefs:
+        first = normalize(planner.with_page_size(urljoin(start, href) + '?mystock=1-7-6&sort=salenum&order=ASC'))
+        total = synth.rng.randint(20, 600)
+        pages = math.ceil(total / planner.max_page_size)
+        urls = [first] + [normalize(planner.page_url(first, n, planner.max_page_size)) for n in range(2, pages + 1)]
+        for number, url in enumerate(urls, 1):
+            count = planner.max_page_size if number < pages else total - planner.max_page_size * (pages - 1)
+            # Tiles carry schema.org Product microdata
+            cards = ''.join(
+                f'<li class="goods_info" itemscope itemtype="https://schema.org/Product">'
+                f'<div class="goods_img"><img src="/img/{synth.slug()}.jpg"/></div>'
+                f'<div class="goods_name"><a itemprop="url" href="/product/{synth.slug(30)}"><span itemprop="name">{synth.text(60)}</span></a></div>'
+                f'<div class="goods_price" itemprop="offers" itemscope itemtype="https://schema.org/Offer">'
+                f'<meta itemprop="priceCurrency" content="AUD"/><span itemprop="price">{synth.price()}</span></div>'
+                f'<p class="goods_desc">{synth.text(250)}</p></li>' for _ in range(count))
+            bar = ''
+            if pages > 1:
+                bar = ''.join(f'<li><a href="{u}">{n}</a></li>' for n, u in enumerate(urls, 1) if n != number)
+                if number < pages:
+                    bar += f'<li><a href="{urls[number]}">&gt;</a></li>'
+                bar = f'<ul class="page">{bar}</ul>'
+            yield synth.html(url, f'<ul class="goods_list">{cards}</ul>{bar}', 'Umart')
+
+
+def build_ple(synth, categories=30):
+    start = 'https://www.ple.com.au/CategoryGroups/11/All-Categories'
+    hrefs = [f'/Categories/{100 + i}/{synth.slug(14)}' for i in range(categories)]
+    groups = ''.join(
+        f'<div class="categoryGroupCategoryItemInner"><a href="{href}">{synth.text(14)}</a>'
+        + ''.join(f'<a href="/Categories/{synth.rng.randint(1000, 9999)}/{synth.slug(10)}">{synth.text(10)}</a>' for _ in range(3))
+        + '</div>' for href in hrefs)
+    yield synth.html(start, groups, 'All Categories')
+
+    for href in hrefs:
+        cards = ''.join(
+            f'<div class="itemGrid2TileStandard"><div class="itemGrid2TileStandardImage"><img src="/{synth.slug()}.jpg"/></div>'
+            f'<div class="itemGrid2TileStandardDescription"><a href="/products/{synth.slug(30)}">{synth.text(60)}</a></div>'
+            f'<div class="itemGrid2TileStandardPrice">\n {synth.price()} </div><p>{synth.text(250)}</p></div>'
+            for _ in range(synth.rng.randint(10, 150)))
+        yield synth.html(normalize(urljoin(start, href)), f'<div class="itemGrid2">{cards}</div>', 'PLE')
+
+
+def build_sca(synth, total=1150):
+    planner = ScaSpider.pagination
+    first = normalize(planner.with_page_size('https://www.supercheapauto.com.au/4wd-recovery'))
+    pages = math.ceil(total / planner.max_page_size)
+    urls = [first] + [normalize(planner.page_url(first, n, planner.max_page_size)) for n in range(2, pages + 1)]
+
+    def tile():
+        image, path, sku, title, label, price = (synth.slug(), synth.slug(30), synth.rng.randint(100000, 999999),
+                                                 synth.text(60), synth.text(60), synth.price())
+        html = (f'<li class="grid-tile"><div class="product-image"><img src="/{image}.jpg"/></div>'
+                f'<div class="product-name"><a href="/p/{path}/{sku}.html" title="Go to Product: {title}">{label}</a></div>'
+                f'<div class="product-pricing"><span class="the-price">{price}</span></div>'
+                f'<p>{synth.text(250)}</p></li>')
+        product = {'@type': 'Product', 'name': title, 'sku': str(sku), 'url': f'/p/{path}/{sku}.html',
+                   'offers': {'@type': 'Offer', 'price': price.lstrip('$').replace(',', ''), 'priceCurrency': 'AUD'}}
+        return html, product
+
+    for number, url in enumerate(urls, 1):
+        count = planner.max_page_size if number < pages else total - planner.max_page_size * (pages - 1)
+        tiles = [tile() for _ in range(count)]
+        cards = ''.join(html for html, _ in tiles)
+        # The listing is also published as a schema.org ItemList in JSON-LD
+        item_list = json.dumps({'@context': 'https://schema.org', '@type': 'ItemList', 'itemListElement': [
+            {'@type': 'ListItem', 'position': i, 'item': product} for i, (_, product) in enumerate(tiles, 1)]})
+        bar = ''.join(f'<li><a href="{u}">{n}</a></li>' for n, u in enumerate(urls, 1) if n != number)
+        if number < pages:
+            bar += f'<li><a class="page-next" href="{urls[number]}">Next</a></li>'
+        yield synth.html(url, f'<script type="application/ld+json">{item_list}</script>'
+                              f'<ul class="search-result-items">{cards}</ul><div class="pagination"><ul>{bar}</ul></div>', 'SCA')
+
+
+# Spider name -> generator of fixture records
+BUILDERS = {
+    'impersonate': build_bunnings,
+    'officeworks': build_officeworks,
+    'umart': build_umart,
+    'ple': build_ple,
+    'sca': build_sca,
+}
+
+
+def build_fixtures(directory, spider_name, seed=0):
+    """Writes the synthetic recording of a spider. Returns the number of responses."""
+    builder = BUILDERS.get(spider_name)
+    if builder is None:
+        raise KeyError(f"No synthetic fixtures for spider '{spider_name}'; record them with --record")
+    return write_fixtures(fixture_path(directory, spider_name), builder(Synth(f'{spider_name}-{seed}')))
@@ -0,0 +1,92 @@
+"""
+Throughput and peak-memory benchmark for the React Flight (App Router) decoder.
+
+Builds an App Router-style category page where product data is streamed as
+`self.__next_f.push([1, "..."])` chunks, then measures FlightPayload decoding
+plus the lookups BunningsSpider.parse performs.
+
+Usage: python -m benchmarks.flight
+"""
+import json
+import random
+import string
+import time
+import tracemalloc
+
+from scrapy.http import HtmlResponse
+
+from retail_spiders.hydration import FlightPayload
+
+GLOBAL = ('props', 'pageProps', 'initialState', 'global')
+CHUNK_SIZE = 2048  # Next.js flushes the stream in small pieces
+
+
+def build_flight_rows(rng, products=36, components=400):
+    def text(n):
+        return ''.join(rng.choices(string.ascii_letters + ' ', k=n))
+
+    rows = ['1:I["app/layout",["static/chunks/layout.js"],"default"]',
+            '2:HL["/_next/static/css/app.css","style"]']
+    row_id = 16
+    product_refs = []
+    for _ in range(products):
+        product = {'raw': {'title': text(60), 'price': rng.randint(5, 900),
+                           'productroutingurl': '/' + text(40), 'description': text(400)}}
+        rows.append(f'{row_id:x}:{json.dumps(product, separators=(",", ":"))}')
+        product_refs.append(f'${row_id:x}')
+        row_id += 1
+    description = text(3000)
+    rows.append(f'{row_id:x}:T{len(description.encode()):x},{description}')
+    row_id += 1
+    # Unrelated component tree that makes up the bulk of a real payload
+    for _ in range(components):
+        node = ['$', 'div', None, {'className': text(12), 'children': [text(80) for _ in range(8)]}]
+        rows.append(f'{row_id:x}:{json.dumps(node, separators=(",", ":"))}')
+        row_id += 1
+    props = {'searchResults': {'data': {'results': product_refs, 'totalCount': 1200}},
+             'globalConfigData': {'searchConfig': {'global': {'numberOfSearchResults': '36'}}}}
+    rows.insert(0, '0:' + json.dumps(['$', '$L1', None, {'children': ['$', '$L3', None, props]}], separators=(',', ':')))
+    # Text rows are length-prefixed, the rest newline-terminated
+    return ''.join(row if ':T' in row[:8] else row + '\n' for row in rows)
+
+
+def build_response():
+    rng = random.Random(0)
+    flight = build_flight_rows(rng)
+    scripts = ''.join(f'<script>self.__next_f.push({json.dumps([1, flight[i:i + CHUNK_SIZE]])})</script>'
+                      for i in range(0, len(flight), CHUNK_SIZE))
+    body = ('<html><body><div>' + ''.join(rng.choices(string.ascii_letters, k=100_000)) + '</div>'
+            '<script>(self.__next_f=self.__next_f||[]).push([0])</script>' + scripts + '</body></html>')
+    return HtmlResponse('https://www.bunnings.com.au/products/garden/x?page=1', body=body.encode(), encoding='utf-8')
+
+
+def extract(response):
+    payload = FlightPayload.from_response(response)
+    search = payload.get(*GLOBAL, 'searchResults', 'data')
+    per_page = int(payload.get(*GLOBAL, 'globalData', 'globalConfigData', 'searchConfig', 'global', 'numberOfSearchResults'))
+    return search['results'], per_page
+
+
+def main():
+    response = build_response()
+    results, per_page = extract(response)
+    assert len(results) == per_page == 36 and 'title' in results[0]['raw']
+
+    runs = 30
+    start = time.perf_counter()
+    for _ in range(runs):
+        extract(response)
+    elapsed = (time.perf_counter() - start) / runs
+
+    tracemalloc.start()
+    extract(response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    size = len(response.body)
+    print(f"page: {size // 1024}KB | {elapsed * 1e3:.2f} ms/page | "
+          f"{size / elapsed / 2**20:.1f} MB/s | peak {peak / 2**20:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
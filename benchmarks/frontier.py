@@ -0,0 +1,128 @@
+"""
+Benchmark: one spider crawled by 1 vs N worker processes through the shared frontier.
+
+A local HTTP server serves a synthetic catalogue (categories -> paginated listing
+pages of product cards). Every worker runs the same spider with FrontierScheduler on
+a throwaway SQLite frontier (the local stand-in for Redis), and the aggregate
+pages/sec and items/sec are reported for each worker count.
+
+Usage: python -m benchmarks.frontier [--workers 1 2 4] [--categories 40] [--pages 10]
+"""
+import argparse
+import functools
+import random
+import string
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import scrapy
+from scrapy.utils.project import get_project_settings
+
+from retail_spiders.extraction import ExtractionSpec, Field
+from retail_spiders.frontier import run_workers
+from retail_spiders.items import ProductItem, remove_currency_symbol
+
+CARDS_PER_PAGE = 60
+
+
+@functools.lru_cache(maxsize=None)
+def build_listing(category, page, pages):
+    rng = random.Random(category * 1000 + page)
+    cards = ''.join(
+        f'<div class="card"><a class="title" href="/p/{category}-{page}-{i}">'
+        f'{"".join(rng.choices(string.ascii_letters + " ", k=40))}</a>'
+        f'<span class="price">${rng.randint(1, 999)}.{rng.randint(0, 99):02d}</span>'
+        f'<p>{"".join(rng.choices(string.ascii_letters + " ", k=400))}</p></div>'
+        for i in range(CARDS_PER_PAGE)
+    )
+    nav = ''.join(f'<a class="page" href="/c/{category}?page={p}">{p}</a>' for p in range(1, pages + 1))
+    return f'<html><body><div class="grid">{cards}</div><nav>{nav}</nav></body></html>'.encode()
+
+
+class CatalogueHandler(BaseHTTPRequestHandler):
+    categories = 40
+    pages = 10
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/':
+            body = ''.join(f'<a class="cat" href="/c/{c}">{c}</a>' for c in range(self.categories)).encode()
+        else:
+            category = int(url.path.rsplit('/', 1)[1])
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            body = build_listing(category, page, self.pages)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FrontierBenchSpider(scrapy.Spider):
+    name = 'frontier_bench'
+    base_url = None
+
+    spec = ExtractionSpec(ProductItem, cards_css='div.card', fields={
+        'name': Field(css='a.title::text'),
+        'price': Field(css='span.price::text', convert=remove_currency_symbol),
+        'url': Field(css='a.title::attr(href)', urljoin=True),
+        'retailer': Field(value='Bench'),
+    })
+
+    async def start(self):
+        yield scrapy.Request(self.base_url, callback=self.parse_home)
+
+    def parse_home(self, response):
+        for href in response.css('a.cat::attr(href)').getall():
+            yield response.follow(href, callback=self.parse_category)
+
+    def parse_category(self, response):
+        yield from self.spec.extract_cards(response)
+        for href in response.css('a.page::attr(href)').getall():
+            yield response.follow(href, callback=self.parse_category)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--categories', type=int, default=40)
+    parser.add_argument('--pages', type=int, default=10)
+    args = parser.parse_args()
+
+    CatalogueHandler.categories = args.categories
+    CatalogueHandler.pages = args.pages
+    # Pre-render the catalogue so the (single-process) server is not the bottleneck
+    for category in range(args.categories):
+        for page in range(1, args.pages + 1):
+            build_listing(category, page, args.pages)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CatalogueHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}/'
+
+    print(f"{'workers':>8} {'pages':>7} {'items':>8} {'seconds':>8} {'pages/s':>8} {'items/s':>9} {'dupes':>6}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = get_project_settings()
+            settings.setdict({
+                'DOWNLOAD_HANDLERS': {}, 'ITEM_PIPELINES': {}, 'FEEDS': {}, 'EXTENSIONS': {},
+                'DOWNLOADER_MIDDLEWARES': {}, 'SPIDER_MIDDLEWARES': {},
+                'DOWNLOAD_DELAY': 0, 'CONCURRENT_REQUESTS_PER_DOMAIN': 32, 'LOG_LEVEL': 'ERROR',
+                'FRONTIER_URL': f'sqlite:///{tmp}/frontier.sqlite',
+            }, priority='cmdline')
+            # Workers are spawned processes: the server URL goes in as a spider argument
+            totals, counts, elapsed = run_workers(FrontierBenchSpider, workers, settings,
+                                                  spider_kwargs={'base_url': base_url})
+        pages = totals.get('downloader/response_count', 0)
+        items = totals.get('item_scraped_count', 0)
+        print(f"{workers:>8} {pages:>7} {items:>8} {elapsed:>8.1f} {pages / elapsed:>8.1f} "
+              f"{items / elapsed:>9.1f} {totals.get('frontier/duplicates', 0):>6}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
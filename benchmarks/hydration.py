@@ -0,0 +1,76 @@
+"""
+Micro-benchmark for __NEXT_DATA__ extraction on a Bunnings-shaped category page.
+
+Compares the original XPath + json.loads path against HydrationState
+(byte search + targeted subtree decoding) for the lookups BunningsSpider.parse does.
+
+Usage: python -m benchmarks.hydration
+"""
+import json
+import random
+import string
+import timeit
+
+from scrapy.http import HtmlResponse
+
+from retail_spiders.hydration import HydrationState
+
+GLOBAL = ('props', 'pageProps', 'initialState', 'global')
+
+
+def build_state(rng, products=36, nav_nodes=4000):
+    def text(n):
+        return ''.join(rng.choices(string.ascii_letters + ' ', k=n))
+
+    def node(depth):
+        children = [node(depth + 1) for _ in range(3)] if depth < 2 else []
+        return {'code': text(8), 'displayName': text(20), 'internalPath': '/' + text(30), 'levels': children}
+
+    results = [{'raw': {'title': text(60), 'price': rng.randint(5, 900), 'productroutingurl': '/' + text(40),
+                        'description': text(400)}} for _ in range(products)]
+    return {'props': {'pageProps': {'initialState': {'global': {
+        'searchResults': {'data': {'results': results, 'totalCount': 1200}},
+        'globalData': {
+            'navigation': {'levels': [node(0) for _ in range(nav_nodes // 13)]},
+            'globalConfigData': {'searchConfig': {'global': {'numberOfSearchResults': '36'}}},
+            'content': [text(500) for _ in range(600)],
+        },
+    }}}}}
+
+
+def build_response():
+    rng = random.Random(0)
+    blob = json.dumps(build_state(rng), separators=(',', ':'))
+    filler = ''.join(rng.choices(string.ascii_letters + ' <>/', k=150_000))
+    body = (f'<html><head><title>Garden</title></head><body><div id="__next">{filler}</div>'
+            f'<script id="__NEXT_DATA__" type="application/json">{blob}</script></body></html>')
+    return HtmlResponse('https://www.bunnings.com.au/products/garden/x?page=1', body=body.encode(), encoding='utf-8')
+
+
+def xpath_path(body):
+    # Fresh response each time: Scrapy caches the selector tree per response
+    response = HtmlResponse('https://www.bunnings.com.au/', body=body, encoding='utf-8')
+    data = json.loads(response.xpath('//script[@id="__NEXT_DATA__"]/text()').get())
+    props = data['props']['pageProps']['initialState']['global']
+    search = props['searchResults']['data']
+    return search['results'], int(props['globalData']['globalConfigData']['searchConfig']['global']['numberOfSearchResults'])
+
+
+def hydration_path(body):
+    response = HtmlResponse('https://www.bunnings.com.au/', body=body, encoding='utf-8')
+    state = HydrationState.from_response(response)
+    search = state.get(*GLOBAL, 'searchResults', 'data')
+    return search['results'], int(state.get(*GLOBAL, 'globalData', 'globalConfigData', 'searchConfig', 'global', 'numberOfSearchResults'))
+
+
+def main():
+    body = build_response().body
+    assert xpath_path(body) == hydration_path(body)
+    number = 30
+    for label, fn in (('xpath + json.loads', xpath_path), ('HydrationState', hydration_path)):
+        t = min(timeit.repeat(lambda: fn(body), number=number, repeat=3)) / number * 1e3
+        print(f"{label:>20}: {t:8.2f} ms/page  ({len(body) // 1024}KB page)")
+
+
+if __name__ == '__main__':
+    main()
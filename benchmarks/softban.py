@@ -0,0 +1,58 @@
+"""
+Micro-benchmark for soft-ban signature detection.
+
+Compares the original per-signature `in` scan, a single alternation regex and
+BanSignatureMatcher (full body and windowed) on synthetic Next.js-sized pages.
+
+Usage: python -m benchmarks.softban
+"""
+import random
+import re
+import string
+import timeit
+
+from retail_spiders.middlewares import BanSignatureMatcher, SoftBanMiddleware
+
+# Typical extra vendor signatures a per-domain config would add
+EXTRA_SIGNATURES = [
+    b"cf-chl-bypass",
+    b"px-captcha",
+    b"_Incapsula_Resource",
+    b"Request unsuccessful",
+    b"Please verify you are a human",
+]
+
+
+def build_page(size):
+    """A clean (non-banned) page shaped like a Next.js render: markup, then a big JSON blob."""
+    rng = random.Random(size)
+    head = b''.join(b'<script src="/_next/static/chunks/%d.js"></script>' % i for i in range(50))
+    markup = ''.join(rng.choices(string.ascii_letters + ' <>/"=', k=size // 3)).encode()
+    blob = ''.join(rng.choices(string.ascii_letters + ' ,:"{}', k=size - size // 3)).encode()
+    return (b'<html><head>' + head + b'</head><body><div id="__next">' + markup +
+            b'</div><script id="__NEXT_DATA__" type="application/json">' + blob + b'</script></body></html>')
+
+
+def bench(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    signatures = SoftBanMiddleware.BAN_SIGNATURES + EXTRA_SIGNATURES
+    regex = re.compile(b'|'.join(re.escape(sig) for sig in signatures))
+    full = BanSignatureMatcher(signatures)
+    windowed = BanSignatureMatcher(signatures, window=32 * 1024)
+
+    print(f"{'page':>8} {'any(in)':>10} {'regex':>10} {'matcher':>10} {'window32k':>10}  (µs/response)")
+    for size in (50_000, 300_000, 1_000_000):
+        body = build_page(size)
+        number = max(10, 20_000_000 // size)
+        print(f"{len(body) // 1024:>6}KB "
+              f"{bench(lambda: any(sig in body for sig in signatures), number):>10.1f} "
+              f"{bench(lambda: regex.search(body), number):>10.1f} "
+              f"{bench(lambda: full.search(body), number):>10.1f} "
+              f"{bench(lambda: windowed.search(body), number):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+"""
+Response archive: raw responses kept on disk so spiders can be re-run without the network.
+
+Layout (WARC-like) of one archive directory:
+* `responses-00000.gz`, `responses-00001.gz`, ...: append-only segments. Every
+  record is its own gzip member (the pickled request, status, headers and body),
+  so a segment is a valid .gz file and any record can be read from its offset.
+  A new segment is started per session and whenever ARCHIVE_SEGMENT_BYTES is reached.
+* `index.sqlite`: one row per record with URL, request fingerprint, callback,
+  status and (segment, offset, length).
+
+ResponseArchiveExtension records a crawl with ARCHIVE_ENABLED. Replay re-runs a
+spider's callbacks over an archive in parallel processes, with the downloader
+reading from the archive instead of the network:
+
+    python -m retail_spiders.archive impersonate archive/impersonate/2024-06-01T02-00-00 --workers 4
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+
+from scrapy import Request
+from scrapy.core.downloader.handlers.base import BaseDownloadHandler
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+
+INDEX_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS records ('
+    ' id INTEGER PRIMARY KEY, url TEXT, method TEXT, fingerprint TEXT, callback TEXT,'
+    ' status INTEGER, segment INTEGER, offset INTEGER, length INTEGER, size INTEGER, time REAL)'
+)
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f'responses-{segment:05d}.gz')
+
+
+def snapshot(request, response, spider):
+    """
+    What replay needs to rebuild both the request (with its callback) and the response.
+    Mutable parts are copied, so ArchiveWriter can pickle it on its thread while the
+    crawl goes on with the request.
+    """
+    try:
+        request_dict = request.to_dict(spider=spider)
+    except ValueError:
+        # Callback is not a spider method: keep the request, replay falls back to parse
+        request_dict = request.replace(callback=None, errback=None).to_dict(spider=spider)
+    if request_dict.get('meta'):
+        request_dict['meta'] = dict(request_dict['meta'])
+    if request_dict.get('cb_kwargs'):
+        request_dict['cb_kwargs'] = dict(request_dict['cb_kwargs'])
+    cls = type(response)
+    return {
+        'request': request_dict,
+        'url': response.url,
+        'status': response.status,
+        'headers': dict(response.headers),
+        'body': response.body,
+        'flags': list(response.flags),
+        'protocol': response.protocol,
+        'cls': f'{cls.__module__}.{cls.__qualname__}',
+    }
+
+
+def serialize(record):
+    return pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class ArchiveWriter:
+    """
+    Appends records from a background thread.
+
+    Pickling, compression (zlib releases the GIL) and index writes happen off the
+    reactor thread. The queue is bounded: `write` never blocks, it reports a full
+    queue and `put` then waits for room off the reactor (see ResponseArchiveExtension).
+    """
+    _STOP = object()
+
+    def __init__(self, directory, segment_bytes=256 * 1024 * 1024, level=6, max_pending=1000, stats=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.level = level
+        self.stats = stats
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name='archive-writer', daemon=True)
+        self.ready = threading.Event()
+        self.error = None
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+
+    def write(self, url, method, fingerprint, callback, status, record):
+        """Queues a record (see snapshot) without blocking; False when the queue is full."""
+        try:
+            self.queue.put_nowait((url, method, fingerprint, callback, status, record))
+        except queue.Full:
+            return False
+        return True
+
+    async def put(self, url, method, fingerprint, callback, status, record):
+        """Queues a record, waiting (off the reactor) while the queue is full."""
+        await asyncio.to_thread(self.queue.put, (url, method, fingerprint, callback, status, record))
+
+    def close(self):
+        """Writes everything still queued and waits for the thread to exit."""
+        if self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join()
+
+    def _run(self):
+        try:
+            # SQLite connections belong to the thread that created them
+            db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'))
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(INDEX_SCHEMA)
+            db.execute('CREATE INDEX IF NOT EXISTS records_url ON records (url)')
+            db.execute('CREATE INDEX IF NOT EXISTS records_fingerprint ON records (fingerprint)')
+            last = db.execute('SELECT MAX(segment) FROM records').fetchone()[0]
+        except sqlite3.Error as e:
+            self.error = e
+            self.ready.set()
+            return
+        # Never append to a segment of an earlier session: start a fresh one
+        segment = -1 if last is None else last
+        segment_file = None
+        self.ready.set()
+
+        pending = 0
+        while True:
+            entry = self.queue.get()
+            if entry is not self._STOP:
+                if segment_file is None or segment_file.tell() >= self.segment_bytes:
+                    if segment_file is not None:
+                        segment_file.close()
+                    segment += 1
+                    segment_file = open(segment_path(self.directory, segment), 'ab')
+                    self._inc_stat('archive/segments')
+                url, method, fingerprint, callback, status, record = entry
+                payload = serialize(record)
+                data = gzip.compress(payload, compresslevel=self.level, mtime=0)
+                offset = segment_file.tell()
+                segment_file.write(data)
+                db.execute(
+                    'INSERT INTO records (url, method, fingerprint, callback, status, segment, offset, length, size, time)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (url, method, fingerprint, callback, status, segment, offset, len(data), len(payload), time.time()),
+                )
+                pending += 1
+                self._inc_stat('archive/records')
+                self._inc_stat('archive/bytes_raw', len(payload))
+                self._inc_stat('archive/bytes_compressed', len(data))
+            # Index rows are committed once their record is on disk, in batches
+            if entry is self._STOP or pending >= 256 or self.queue.empty():
+                if segment_file is not None:
+                    segment_file.flush()
+                db.commit()
+                pending = 0
+            if entry is self._STOP:
+                if segment_file is not None:
+                    segment_file.close()
+                db.close()
+                return
+
+    def _inc_stat(self, key, count=1):
+        if self.stats:
+            self.stats.inc_value(key, count)
+
+
+class ResponseArchive:
+    """Read side of an archive directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        path = os.path.join(directory, 'index.sqlite')
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'No archive index at {path}')
+        self.db = sqlite3.connect(path)
+        self._files = {}
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def rows(self, shard=0, shards=1, callbacks=None):
+        """Yields (id, segment, offset, length) of every record in this shard, in crawl order."""
+        sql = 'SELECT id, segment, offset, length FROM records WHERE id % ? = ?'
+        args = [shards, shard]
+        if callbacks:
+            sql += f" AND callback IN ({', '.join('?' * len(callbacks))})"
+            args.extend(callbacks)
+        cursor = self.db.execute(sql + ' ORDER BY id', args)
+        while True:
+            batch = cursor.fetchmany(1000)
+            if not batch:
+                return
+            yield from batch
+
+    def lookup(self, url=None, fingerprint=None):
+        """Locations (segment, offset, length) of the records of a URL or request fingerprint, oldest first."""
+        column, value = ('url', url) if url is not None else ('fingerprint', fingerprint)
+        return self.db.execute(
+            f'SELECT segment, offset, length FROM records WHERE {column} = ? ORDER BY id', (value,)
+        ).fetchall()
+
+    def read(self, segment, offset, length):
+        """Returns the stored record at a location (see serialize)."""
+        f = self._files.get(segment)
+        if f is None:
+            f = self._files[segment] = open(segment_path(self.directory, segment), 'rb')
+        f.seek(offset)
+        return pickle.loads(gzip.decompress(f.read(length)))
+
+    def request(self, location, spider):
+        """Rebuilds the archived request, tagged with its record so the handler can serve it."""
+        record = self.read(*location)
+        request = request_from_dict(record['request'], spider=spider)
+        request.meta['archive_record'] = tuple(location)
+        return request.replace(dont_filter=True)
+
+    @staticmethod
+    def response(record, request):
+        headers = Headers(record['headers'])
+        try:
+            cls = load_object(record['cls'])
+        except (ImportError, NameError, ValueError):
+            cls = responsetypes.from_args(headers=headers, url=record['url'], body=record['body'])
+        return cls(url=record['url'], status=record['status'], headers=headers, body=record['body'],
+                   flags=record['flags'], request=request, protocol=record['protocol'])
+
+
+class ArchiveDownloadHandler(BaseDownloadHandler):
+    """Serves replayed requests from the archive at ARCHIVE_REPLAY_PATH (no network)."""
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.archive = ResponseArchive(crawler.settings.get('ARCHIVE_REPLAY_PATH'))
+
+    async def download_request(self, request):
+        location = request.meta.get('archive_record')
+        if location is None:
+            # Not a replayed request: serve the latest copy of the same request, if any
+            fingerprint = self.crawler.request_fingerprinter.fingerprint(request).hex()
+            matches = self.archive.lookup(fingerprint=fingerprint)
+            if not matches:
+                raise IgnoreRequest(f'Not in the archive: {request.url}')
+            location = matches[-1]
+        return self.archive.response(self.archive.read(*location), request)
+
+    async def close(self):
+        self.archive.close()
+
+
+class ArchiveReplaySpiderMiddleware:
+    """
+    Replaces the spider's start requests with this worker's share of the archive
+    and drops the follow-up requests callbacks yield: every archived page is
+    replayed exactly once, by whichever worker owns it.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        settings = crawler.settings
+        self.path = settings.get('ARCHIVE_REPLAY_PATH')
+        self.shard = settings.getint('ARCHIVE_REPLAY_SHARD', 0)
+        self.shards = settings.getint('ARCHIVE_REPLAY_SHARDS', 1)
+        self.callbacks = settings.getlist('ARCHIVE_REPLAY_CALLBACKS')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def process_start(self, start):
+        archive = ResponseArchive(self.path)
+        try:
+            for location in archive.rows(self.shard, self.shards, self.callbacks):
+                self.stats.inc_value('archive/replay/records')
+                yield archive.request(location[1:], self.crawler.spider)
+        finally:
+            archive.close()
+
+    def process_spider_output(self, response, result, spider):
+        for entry in result:
+            if isinstance(entry, Request):
+                self.stats.inc_value('archive/replay/requests_dropped')
+                continue
+            yield entry
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for entry in result:
+            if isinstance(entry, Request):
+                self.stats.inc_value('archive/replay/requests_dropped')
+                continue
+            yield entry
+
+
+def replay_overrides(settings, path, shard, shards, callbacks=None, output=None):
+    """Settings (cmdline priority) that turn a normal crawl into a replay of one shard."""
+    spider_middlewares = settings.getdict('SPIDER_MIDDLEWARES')
+    spider_middlewares['retail_spiders.archive.ArchiveReplaySpiderMiddleware'] = 10
+    overrides = {
+        'DOWNLOAD_HANDLERS': {
+            'http': 'retail_spiders.archive.ArchiveDownloadHandler',
+            'https': 'retail_spiders.archive.ArchiveDownloadHandler',
+        },
+        # Archived responses already went through the downloader middlewares once
+        'DOWNLOADER_MIDDLEWARES_BASE': {'scrapy.downloadermiddlewares.stats.DownloaderStats': 850},
+        'DOWNLOADER_MIDDLEWARES': {},
+        'SPIDER_MIDDLEWARES': spider_middlewares,
+        'ARCHIVE_ENABLED': False,
+        'ARCHIVE_REPLAY_PATH': path,
+        'ARCHIVE_REPLAY_SHARD': shard,
+        'ARCHIVE_REPLAY_SHARDS': shards,
+        'ARCHIVE_REPLAY_CALLBACKS': callbacks or [],
+        'PAGE_CACHE_ENABLED': False,
+        'ROBOTSTXT_OBEY': False,
+        'DOWNLOAD_DELAY': 0,
+        'AUTOTHROTTLE_ENABLED': False,
+        'CONCURRENT_REQUESTS': 64,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 64,
+        'CLOSESPIDER_TIMEOUT': 0,
+        'TELNETCONSOLE_ENABLED': False,
+        'JOBDIR': None,
+    }
+    if output:
+        root, ext = os.path.splitext(output)
+        overrides['FEEDS'] = {f'{root}-{shard}{ext or ".jsonl"}': {
+            'format': 'jsonlines', 'encoding': 'utf8', 'overwrite': True,
+            'batch_max_bytes': 0,  # One file per shard
+        }}
+    return overrides
+
+
+def _replay_worker(spider_name, settings, overrides, results):
+    # Imported here: each worker process installs its own reactor
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.settings import Settings
+
+    # Priorities are lost on the way to a spawned process: the overrides must beat spider custom_settings
+    settings = Settings(settings)
+    settings.setdict(overrides, priority='cmdline')
+    process = CrawlerProcess(settings, install_root_handler=True)
+    crawler = process.create_crawler(spider_name)
+    process.crawl(crawler)
+    process.start()
+    stats = crawler.stats.get_stats()
+    results.put({k: v for k, v in stats.items() if isinstance(v, (int, float))})
+
+
+def replay(spider_name, path, workers, settings, callbacks=None, output=None):
+    """
+    Re-runs a spider's callbacks over an archive with `workers` processes.
+    Returns (summed numeric stats of all workers, wall time in seconds).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start = time.monotonic()
+    processes = []
+    for shard in range(workers):
+        overrides = replay_overrides(settings, os.path.abspath(path), shard, workers, callbacks, output)
+        process = ctx.Process(target=_replay_worker, args=(spider_name, settings.copy_to_dict(), overrides, results),
+                              name=f'replay-{shard}')
+        process.start()
+        processes.append(process)
+
+    totals = {}
+    reported = 0
+    while reported < workers:
+        try:
+            worker_stats = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        reported += 1
+        for key, value in worker_stats.items():
+            if key.endswith(('_seconds', 'memusage/max', 'memusage/startup')):
+                continue
+            totals[key] = totals.get(key, 0) + value
+    for process in processes:
+        process.join()
+    return totals, time.monotonic() - start
+
+
+def main():
+    from scrapy.utils.project import get_project_settings
+
+    parser = argparse.ArgumentParser(description="Re-run a spider's callbacks over a response archive (no network).")
+    parser.add_argument('spider')
+    parser.add_argument('archive', help='Archive directory (see ARCHIVE_URI)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--callback', action='append', help='Only replay pages handled by this callback (repeatable)')
+    parser.add_argument('-o', '--output', help='Also write items to this JSONL file (one file per worker)')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    settings.setdict(dict(s.split('=', 1) for s in args.set), priority='cmdline')
+    logging.basicConfig(level=settings.get('LOG_LEVEL'), format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+
+    archive = ResponseArchive(args.archive)
+    records = len(archive)
+    archive.close()
+    logging.info(f"📼 [ARCHIVE] Replaying {records} responses of '{args.spider}' with {args.workers} workers")
+
+    totals, elapsed = replay(args.spider, args.archive, args.workers, settings, args.callback, args.output)
+    pages = totals.get('archive/replay/records', 0)
+    print(f"🏁 {args.spider}: replayed {pages} pages -> {totals.get('item_scraped_count', 0)} items "
+          f"in {elapsed:.1f}s ({pages / elapsed:.1f} pages/sec), "
+          f"{totals.get('archive/replay/requests_dropped', 0)} follow-up requests dropped")
+
+
+if __name__ == '__main__':
+    main()
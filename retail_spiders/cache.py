@@ -0,0 +1,147 @@
+"""
+Persistent page cache: validators, body hashes and callback output per request.
+
+One SQLite file per spider holds, for every cached request fingerprint, the
+ETag/Last-Modified validators and body hash of the last response plus everything
+its callback produced (items and follow-up requests). When a page comes back
+304 Not Modified, or with an identical body, that output is replayed instead of
+re-running the parse callback. Entries are evicted least recently used first
+once the stored payloads exceed a byte budget.
+"""
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+
+
+class CacheEntry:
+    """Validators and body hash of a cached page (the payload is loaded on demand)."""
+    __slots__ = ('key', 'etag', 'last_modified', 'body_hash')
+
+    def __init__(self, key, etag, last_modified, body_hash):
+        self.key = key
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_hash = body_hash
+
+
+def output_record(result, spider):
+    """
+    Snapshot of one callback result for dump_output: an item as (class path, copy of
+    its fields), a request via Request.to_dict (its callback must be a spider method,
+    as with JOBDIR; ValueError otherwise).
+    """
+    if isinstance(result, Request):
+        return ('request', result.to_dict(spider=spider))
+    cls = type(result)
+    return ('item', f'{cls.__module__}.{cls.__qualname__}', ItemAdapter(result).asdict())
+
+
+def dump_output(records):
+    """Serializes the output_record snapshots of a callback's output."""
+    return zlib.compress(pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def load_output(payload, spider):
+    """Rebuilds the items and requests serialized by dump_output."""
+    output = []
+    for record in pickle.loads(zlib.decompress(payload)):
+        if record[0] == 'item':
+            _, cls_path, fields = record
+            cls = load_object(cls_path)
+            output.append(fields if cls is dict else cls(fields))
+        else:
+            output.append(request_from_dict(record[1], spider=spider))
+    return output
+
+
+class PageCacheStore:
+    """
+    SQLite-backed store with size-bounded LRU eviction.
+
+    :param path: Database file.
+    :param max_bytes: Budget for stored payloads; the least recently used entries
+        are dropped once it is exceeded (0 = unbounded).
+    """
+
+    def __init__(self, path, max_bytes=0, stats=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.db = None
+        self.size = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT,'
+            ' body_hash TEXT, payload BLOB, size INTEGER, last_used REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)')
+        self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def lookup(self, key):
+        """Returns the CacheEntry for a fingerprint, or None."""
+        row = self.db.execute(
+            'SELECT etag, last_modified, body_hash FROM pages WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(key, *row)
+
+    def payload(self, key):
+        """Returns the stored callback output and marks the entry as recently used."""
+        row = self.db.execute('SELECT payload FROM pages WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute('UPDATE pages SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def store(self, key, url, etag, last_modified, body_hash, payload):
+        old = self.db.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+        self.db.execute(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, url, etag, last_modified, body_hash, payload, len(payload), time.time()),
+        )
+        self.size += len(payload) - (old[0] if old else 0)
+        self.db.commit()
+        self.evict()
+
+    def evict(self):
+        """
+        Drops least recently used entries once payloads exceed max_bytes, down to 90%
+        of the budget so eviction runs in batches rather than on every store.
+        """
+        if not self.max_bytes or self.size <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        evicted = 0
+        while self.size > target:
+            rows = self.db.execute('SELECT key, size FROM pages ORDER BY last_used LIMIT 256').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.size <= target:
+                    break
+                self.db.execute('DELETE FROM pages WHERE key = ?', (key,))
+                self.size -= size
+                evicted += 1
+        self.db.commit()
+        if self.stats:
+            self.stats.inc_value('page_cache/evicted', evicted)
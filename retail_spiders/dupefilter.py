@@ -0,0 +1,258 @@
+"""
+Compact, persistent request deduplication.
+
+* `CanonicalJsonFingerprinter`: request fingerprints that ignore the key order and
+  whitespace of JSON bodies, so the same Algolia query built twice (or by two code
+  paths) is one request. Other requests keep Scrapy's default fingerprint.
+* `BloomDupeFilter`: a scalable Bloom filter over those fingerprints, in
+  memory-mapped files under JOBDIR/requests.bloom/. Memory stays at a couple of
+  bytes per request instead of a Python set of hex strings, and resuming just maps
+  the files back in. The price is a small, bounded chance of dropping a request
+  that was never seen (DUPEFILTER_BLOOM_ERROR_RATE), reported in the crawl stats.
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+from weakref import WeakKeyDictionary
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+from scrapy.utils.python import to_unicode
+from scrapy.utils.request import RequestFingerprinter
+from w3lib.url import canonicalize_url
+
+
+class CanonicalJsonFingerprinter(RequestFingerprinter):
+    """
+    Scrapy's fingerprint, computed over a canonical form of JSON request bodies
+    (sorted keys, no insignificant whitespace). An already-canonical body gets the
+    same fingerprint as with Scrapy's fingerprinter.
+    """
+
+    def __init__(self, crawler=None):
+        super().__init__(crawler)
+        self._cache = WeakKeyDictionary()
+
+    def fingerprint(self, request):
+        body = request.body
+        if not body or not _is_json(request, body):
+            return super().fingerprint(request)
+        cached = self._cache.get(request)
+        if cached is not None:
+            return cached
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return super().fingerprint(request)
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        # Same layout as scrapy.utils.request.fingerprint, with the canonical body
+        data = {
+            'method': to_unicode(request.method),
+            'url': canonicalize_url(request.url),
+            'body': canonical.hex(),
+            'headers': {},
+        }
+        digest = self._cache[request] = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).digest()
+        return digest
+
+
+def _is_json(request, body):
+    content_type = request.headers.get('Content-Type') or b''
+    return b'json' in content_type or body[:1] in (b'{', b'[')
+
+
+class BloomStage:
+    """
+    One fixed-size Bloom filter in a memory-mapped file (or anonymous memory).
+
+    Header: magic, capacity, error rate, hash count, bit count, items added, bits set.
+    Bit positions come from double hashing two 64-bit halves of the fingerprint,
+    which is already a uniformly distributed SHA1 digest.
+    """
+    HEADER = struct.Struct('<4sQdIQQQ')
+    HEADER_SIZE = 64
+    MAGIC = b'RSBF'
+
+    def __init__(self, path, capacity, error_rate):
+        self.path = path
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        size = self.HEADER_SIZE + (bits + 7) // 8
+        fresh = path is None or not os.path.exists(path)
+        if path is None:
+            self.file = None
+            self.mm = mmap.mmap(-1, size)
+        else:
+            self.file = open(path, 'a+b')
+            if fresh:
+                self.file.truncate(size)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+        if fresh:
+            self.capacity, self.error_rate = capacity, error_rate
+            self.bits = bits
+            self.hashes = max(1, round(bits / capacity * math.log(2)))
+            self.count = self.bits_set = 0
+            self._write_header()
+        else:
+            magic, self.capacity, self.error_rate, self.hashes, self.bits, self.count, self.bits_set = \
+                self.HEADER.unpack_from(self.mm, 0)
+            if magic != self.MAGIC:
+                raise ValueError(f'{path} is not a Bloom filter file')
+
+    def _write_header(self):
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.capacity, self.error_rate, self.hashes,
+                              self.bits, self.count, self.bits_set)
+
+    def _positions(self, fp):
+        h1 = int.from_bytes(fp[:8], 'little')
+        h2 = int.from_bytes(fp[8:16], 'little') | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def __contains__(self, fp):
+        mm, offset = self.mm, self.HEADER_SIZE
+        return all(mm[offset + (p >> 3)] & (1 << (p & 7)) for p in self._positions(fp))
+
+    def add(self, fp):
+        mm, offset = self.mm, self.HEADER_SIZE
+        for p in self._positions(fp):
+            i, mask = offset + (p >> 3), 1 << (p & 7)
+            byte = mm[i]
+            if not byte & mask:
+                mm[i] = byte | mask
+                self.bits_set += 1
+        self.count += 1
+        self._write_header()
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def false_positive_rate(self):
+        """Current probability that an unseen fingerprint tests positive."""
+        return (self.bits_set / self.bits) ** self.hashes
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        if self.file is not None:
+            self.file.close()
+
+
+class ScalableBloomFilter:
+    """
+    Chain of Bloom filters that grows as requests are added: each new stage holds
+    `growth` times more items at half the previous stage's error rate, so the
+    overall false positive rate stays below `error_rate` however large the crawl gets.
+    """
+    TIGHTENING = 0.5
+
+    def __init__(self, directory, capacity, error_rate, growth=2):
+        self.directory = directory
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.stages = []
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for name in sorted(os.listdir(directory)):
+                if name.startswith('stage-') and name.endswith('.bloom'):
+                    self.stages.append(BloomStage(os.path.join(directory, name), capacity, error_rate))
+        if not self.stages:
+            self._add_stage()
+
+    def _add_stage(self):
+        i = len(self.stages)
+        capacity = self.capacity * self.growth ** i
+        error_rate = self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** i
+        path = os.path.join(self.directory, f'stage-{i:03d}.bloom') if self.directory is not None else None
+        self.stages.append(BloomStage(path, capacity, error_rate))
+
+    def add(self, fp):
+        """Adds a fingerprint; returns True if it was (probably) already present."""
+        for stage in self.stages:
+            if fp in stage:
+                return True
+        if self.stages[-1].full:
+            self._add_stage()
+        self.stages[-1].add(fp)
+        return False
+
+    def __len__(self):
+        return sum(stage.count for stage in self.stages)
+
+    @property
+    def nbytes(self):
+        return sum(len(stage.mm) for stage in self.stages)
+
+    @property
+    def false_positive_rate(self):
+        p = 1.0
+        for stage in self.stages:
+            p *= 1 - stage.false_positive_rate
+        return 1 - p
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """
+    Drop-in replacement for Scrapy's RFPDupeFilter backed by ScalableBloomFilter.
+
+    With JOBDIR the filter lives in JOBDIR/requests.bloom/ (a requests.seen file left
+    by Scrapy's dupefilter is imported on first use); without it the filter is kept
+    in anonymous memory. Stats: dupefilter/bloom/{requests,stages,bytes} and the
+    estimated false positive rate and count of wrongly filtered requests.
+    """
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, stats=None,
+                 capacity=1_000_000, error_rate=0.001):
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.stats = stats
+        directory = os.path.join(path, 'requests.bloom') if path else None
+        migrate = directory is not None and not os.path.exists(directory)
+        self.bloom = ScalableBloomFilter(directory, capacity, error_rate)
+        # Expected number of unseen requests dropped as duplicates (sum of the FPR at each check)
+        self.expected_false_positives = 0.0
+        if migrate and os.path.exists(os.path.join(path, 'requests.seen')):
+            with Path(path, 'requests.seen').open(encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self.bloom.add(bytes.fromhex(line.strip()))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            job_dir(settings),
+            settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=crawler.request_fingerprinter,
+            stats=crawler.stats,
+            capacity=settings.getint('DUPEFILTER_BLOOM_CAPACITY', 1_000_000),
+            error_rate=settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE', 0.001),
+        )
+
+    def request_seen(self, request):
+        fp = self.fingerprinter.fingerprint(request)
+        fpr = self.bloom.false_positive_rate
+        seen = self.bloom.add(fp)
+        if not seen:
+            # A new request had this chance of being mistaken for a duplicate
+            self.expected_false_positives += fpr
+        return seen
+
+    def close(self, reason):
+        if self.stats is not None:
+            self.stats.set_value('dupefilter/bloom/requests', len(self.bloom))
+            self.stats.set_value('dupefilter/bloom/stages', len(self.bloom.stages))
+            self.stats.set_value('dupefilter/bloom/bytes', self.bloom.nbytes)
+            self.stats.set_value('dupefilter/bloom/false_positive_rate', round(self.bloom.false_positive_rate, 8))
+            self.stats.set_value('dupefilter/bloom/expected_false_positives', round(self.expected_false_positives, 3))
+        self.bloom.close()
+        super().close(reason)
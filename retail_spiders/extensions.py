@@ -1,42 +1,588 @@
+import asyncio
 import logging
+import time
+from collections import deque
+
 from scrapy import signals
-from scrapy.exceptions import NotConfigured
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
+from scrapy.utils.reactor import listen_tcp
+from twisted.internet import task
+from twisted.internet.error import CannotListenError
+from twisted.web import resource
+from twisted.web.server import Site
+
+from retail_spiders.archive import ArchiveWriter, snapshot
+from retail_spiders.cache import PageCacheStore
+from retail_spiders.frontier import hold_lease
+from retail_spiders.instrumentation import Timings, instrument
+
+
+class SlidingWindow:
+    """
+    Request/failure counts over the last `window` seconds, kept in fixed-size time
+    buckets so old traffic expires without storing every request.
+    """
+    __slots__ = ('window', 'bucket', 'buckets')
+
+    def __init__(self, window, bucket):
+        self.window = window
+        self.bucket = bucket
+        self.buckets = deque()  # [bucket_start, total, failures]
+
+    def add(self, failed, now):
+        start = now - now % self.bucket
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append([start, 0, 0])
+        self.buckets[-1][1] += 1
+        self.buckets[-1][2] += failed
+
+    def fail(self, now):
+        """Turns a request already added as a success into a failure."""
+        start = now - now % self.bucket
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append([start, 0, 0])
+        self.buckets[-1][2] += 1
+
+    def counts(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            self.buckets.popleft()
+        total = sum(b[1] for b in self.buckets)
+        failures = sum(b[2] for b in self.buckets)
+        return total, failures
+
+    def clear(self):
+        self.buckets.clear()
+
+
+class DomainCircuit:
+    """Breaker state for one domain: closed -> open -> half_open -> closed (or open again)."""
+    __slots__ = ('window', 'state', 'opened_at', 'trips', 'probes_sent', 'probe_total', 'probe_failures', 'parked')
+
+    def __init__(self, window, bucket):
+        self.window = SlidingWindow(window, bucket)
+        self.state = 'closed'
+        self.opened_at = 0
+        self.trips = 0
+        self.probes_sent = 0
+        self.probe_total = 0
+        self.probe_failures = 0
+        # Requests held back while the domain is open, re-scheduled when it recovers
+        self.parked = deque()
+
 
 class CircuitBreakerExtension:
-    def __init__(self, stats, threshold):
-        self.stats = stats
+    """
+    Per-domain circuit breaker over a sliding time window.
+
+    Every CIRCUIT_BREAKER_INTERVAL seconds each domain's failure rate over the last
+    CIRCUIT_BREAKER_WINDOW seconds is evaluated. A domain above the threshold is
+    opened: its requests are parked instead of burning proxy bandwidth, while other
+    retailers keep crawling. After a cooldown it goes half-open and lets a few probe
+    requests through; healthy probes close it and release the parked requests,
+    failing probes open it again. A domain that trips CIRCUIT_BREAKER_MAX_TRIPS
+    times stops the spider, as the old breaker did.
+
+    Outcomes are recorded by CircuitBreakerMiddleware before RetryMiddleware sees
+    them, so every attempt counts; soft bans (SoftBanMiddleware) turn a 200 into
+    a failure. A probe that is re-scheduled instead of answered (redirected,
+    retried, dropped) counts as a failed probe.
+
+    Requests are parked when they are scheduled (request_scheduled), before they
+    reach the scheduler; those already queued are sent back there by
+    CircuitBreakerMiddleware. Either way no errback runs and the request isn't
+    dropped, it is crawled again on release. With FrontierScheduler, a parked
+    request's lease is not acknowledged while it waits, so it is reissued if the
+    worker dies (or stays parked longer than FRONTIER_LEASE_TIMEOUT).
+    """
+    def __init__(self, crawler, threshold):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
         self.threshold = threshold
-        self.items_scraped = 0
-    
+        self.window = settings.getfloat('CIRCUIT_BREAKER_WINDOW', 300)
+        self.bucket = settings.getfloat('CIRCUIT_BREAKER_BUCKET', 10)
+        self.interval = settings.getfloat('CIRCUIT_BREAKER_INTERVAL', 10)
+        self.min_requests = settings.getint('CIRCUIT_BREAKER_MIN_REQUESTS', 50)
+        self.cooldown = settings.getfloat('CIRCUIT_BREAKER_COOLDOWN', 120)
+        self.probes = settings.getint('CIRCUIT_BREAKER_PROBES', 5)
+        self.max_trips = settings.getint('CIRCUIT_BREAKER_MAX_TRIPS', 5)
+        self.failure_codes = {int(code) for code in settings.getlist('CIRCUIT_BREAKER_FAILURE_CODES', [403, 429, 500, 502, 503, 504])}
+        self.circuits = {}
+        self.task = None
+
     @classmethod
     def from_crawler(cls, crawler):
+        from retail_spiders.middlewares import soft_ban_detected
+
         # Get threshold from settings (default 30% failure rate)
         threshold = crawler.settings.getfloat('CIRCUIT_BREAKER_THRESHOLD', 0.3)
         if not threshold:
             raise NotConfigured
-        
-        ext = cls(crawler.stats, threshold)
-        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+
+        ext = cls(crawler, threshold)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
         crawler.signals.connect(ext.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.soft_ban, signal=soft_ban_detected)
         return ext
 
-    def item_scraped(self, item, spider):
-        self.items_scraped += 1
+    def spider_opened(self, spider):
+        # Evaluate on a timer rather than waiting for the spider to go idle
+        self.task = task.LoopingCall(self.evaluate)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
 
     def spider_idle(self, spider):
-        # We check this periodically (e.g., when spider is idle or via a LoopTask)
-        # Calculate failure rate
-        response_count = self.stats.get_value('downloader/request_count', 0)
-        error_count = (
-            self.stats.get_value('downloader/response_status_count/403', 0) + 
-            self.stats.get_value('downloader/response_status_count/429', 0) +
-            self.stats.get_value('downloader/response_status_count/500', 0)
-        )
-        
-        # Only check after a meaningful sample size
-        if response_count > 50: 
-            failure_rate = error_count / response_count
-            
-            if failure_rate > self.threshold:
-                spider.logger.critical(f"🛑 CIRCUIT BREAKER TRIPPED! Failure rate is {failure_rate:.2%}. Stopping Spider.")
-                spider.crawler.engine.close_spider(spider, 'high_failure_rate')
\ No newline at end of file
+        # Parked requests are still pending work: don't let the spider finish without them
+        if any(circuit.parked for circuit in self.circuits.values()):
+            raise DontCloseSpider
+
+    def request_scheduled(self, request, spider):
+        domain = urlparse_cached(request).hostname
+        # A probe coming back to the scheduler (retry, redirect, re-scheduled) was not answered
+        self.abandon(domain, request)
+        if self.blocked(domain):
+            self.park(domain, request)
+            # Stops the engine from handing it to the scheduler, without dropping it
+            raise IgnoreRequest(f"Circuit open for {domain}, request parked")
+
+    def circuit(self, domain):
+        circuit = self.circuits.get(domain)
+        if circuit is None:
+            circuit = self.circuits[domain] = DomainCircuit(self.window, self.bucket)
+        return circuit
+
+    # --- Called by CircuitBreakerMiddleware ---
+
+    def allow(self, domain, request):
+        """Whether `request` may be downloaded now; half-open probes are tagged."""
+        request.meta.pop('circuit_probe', None)
+        circuit = self.circuit(domain)
+        if circuit.state == 'closed':
+            return True
+        if circuit.state == 'half_open' and circuit.probes_sent < self.probes:
+            circuit.probes_sent += 1
+            # Only these decide the half-open state, not responses to requests sent before it
+            request.meta['circuit_probe'] = circuit.trips
+            return True
+        return False
+
+    def blocked(self, domain):
+        """Whether requests to `domain` have to wait: open, or half-open with every probe sent."""
+        circuit = self.circuits.get(domain)
+        if circuit is None:
+            return False
+        return circuit.state == 'open' or (circuit.state == 'half_open' and circuit.probes_sent >= self.probes)
+
+    def park(self, domain, request):
+        self.circuit(domain).parked.append(request)
+        hold_lease(self.crawler, request)
+        self.stats.inc_value('circuit_breaker/parked')
+
+    def record(self, domain, failed, request):
+        circuit = self.circuit(domain)
+        circuit.window.add(failed, time.monotonic())
+        probe = self._is_probe(circuit, request)
+        if probe:
+            circuit.probe_total += 1
+            circuit.probe_failures += failed
+        # SoftBanMiddleware, next in line, may still find the response is a block page
+        request.meta['circuit_recorded'] = (probe, failed)
+
+    def abandon(self, domain, request):
+        """Counts a probe that won't be answered (dropped or re-scheduled) as failed."""
+        circuit = self.circuits.get(domain)
+        if circuit is not None and self._is_probe(circuit, request):
+            circuit.probe_total += 1
+            circuit.probe_failures += 1
+
+    def soft_ban(self, request, response, spider, signature):
+        probe, failed = request.meta.pop('circuit_recorded', (False, True))
+        if failed:
+            return
+        circuit = self.circuit(urlparse_cached(request).hostname)
+        circuit.window.fail(time.monotonic())
+        if probe and circuit.state == 'half_open':
+            circuit.probe_failures += 1
+
+    @staticmethod
+    def _is_probe(circuit, request):
+        # Tags from an earlier half-open period (or none) don't count
+        return request.meta.pop('circuit_probe', None) == circuit.trips and circuit.state == 'half_open'
+
+    def is_failure(self, status):
+        return status in self.failure_codes
+
+    # --- Periodic evaluation ---
+
+    def evaluate(self):
+        now = time.monotonic()
+        for domain, circuit in self.circuits.items():
+            if circuit.state == 'closed':
+                total, failures = circuit.window.counts(now)
+                # Only check after a meaningful sample size
+                if total >= self.min_requests and failures / total > self.threshold:
+                    self.trip(domain, circuit, failures / total, now)
+
+            elif circuit.state == 'open':
+                if now - circuit.opened_at >= self.cooldown:
+                    circuit.state = 'half_open'
+                    circuit.probes_sent = circuit.probe_total = circuit.probe_failures = 0
+                    logging.info(f"🟡 CIRCUIT BREAKER: {domain} half-open, sending {self.probes} probe requests.")
+                    self.release(circuit, self.probes)
+
+            # Decide once every probe that went out has come back
+            elif circuit.state == 'half_open' and circuit.probe_total and circuit.probe_total >= circuit.probes_sent:
+                failure_rate = circuit.probe_failures / circuit.probe_total
+                if failure_rate > self.threshold:
+                    self.trip(domain, circuit, failure_rate, now)
+                else:
+                    circuit.state = 'closed'
+                    circuit.window.clear()
+                    logging.info(f"🟢 CIRCUIT BREAKER: {domain} recovered. Resuming {len(circuit.parked)} parked requests.")
+                    self.release(circuit)
+
+            self.stats.set_value(f'circuit_breaker/{domain}/state', circuit.state)
+
+    def trip(self, domain, circuit, failure_rate, now):
+        circuit.state = 'open'
+        circuit.opened_at = now
+        circuit.trips += 1
+        self.stats.inc_value(f'circuit_breaker/{domain}/trips')
+        logging.warning(f"🛑 CIRCUIT BREAKER: {domain} failure rate is {failure_rate:.2%}. Pausing domain for {self.cooldown:.0f}s.")
+
+        if self.max_trips and circuit.trips >= self.max_trips:
+            spider = self.crawler.spider
+            spider.logger.critical(f"🛑 CIRCUIT BREAKER TRIPPED! {domain} failed {circuit.trips} times. Stopping Spider.")
+            deferred_from_coro(self.crawler.engine.close_spider_async(reason='high_failure_rate'))
+
+    def release(self, circuit, limit=None):
+        """Re-schedules parked requests (all of them, or the first `limit`)."""
+        count = len(circuit.parked) if limit is None else min(limit, len(circuit.parked))
+        for _ in range(count):
+            request = circuit.parked.popleft()
+            self.crawler.engine.crawl(request.replace(dont_filter=True))
+
+
+class DomainController:
+    """AIMD state for one download slot (normally one domain)."""
+    __slots__ = ('window', 'delay', 'latencies', 'responses', 'errors')
+
+    def __init__(self, window, delay):
+        self.window = window
+        self.delay = delay
+        self.latencies = []
+        self.responses = 0
+        self.errors = 0
+
+
+class AdaptiveConcurrencyExtension:
+    """
+    Finds each retailer's real capacity instead of relying on static settings.
+
+    Every ADAPTIVE_CONCURRENCY_INTERVAL seconds, per download slot:
+    * Healthy (p95 latency under target, error rate under limit): the concurrency
+      window grows by one and the delay shrinks (additive increase).
+    * Congested (429s, soft bans reported by SoftBanMiddleware, or slow p95): the
+      window is cut by ADAPTIVE_CONCURRENCY_DECREASE and the delay doubles
+      (multiplicative decrease).
+    The result is written straight to Scrapy's downloader slot and exposed in stats.
+    """
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = settings.getfloat('ADAPTIVE_CONCURRENCY_INTERVAL', 5)
+        self.start_window = settings.getint('ADAPTIVE_CONCURRENCY_START', 2)
+        self.min_window = settings.getint('ADAPTIVE_CONCURRENCY_MIN', 1)
+        self.max_window = settings.getint('ADAPTIVE_CONCURRENCY_MAX', settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'))
+        self.decrease = settings.getfloat('ADAPTIVE_CONCURRENCY_DECREASE', 0.5)
+        self.target_latency = settings.getfloat('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', 2.0)
+        self.max_error_rate = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE', 0.05)
+        self.min_samples = settings.getint('ADAPTIVE_CONCURRENCY_MIN_SAMPLES', 10)
+        self.min_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_DELAY', 10)
+        self.backoff_codes = {int(code) for code in settings.getlist('ADAPTIVE_CONCURRENCY_BACKOFF_CODES', [429, 503])}
+        self.controllers = {}
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        from retail_spiders.middlewares import soft_ban_detected
+
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.soft_ban, signal=soft_ban_detected)
+        return ext
+
+    def spider_opened(self, spider):
+        self.task = task.LoopingCall(self.adjust)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+
+    def controller(self, request):
+        key = request.meta.get('download_slot')
+        if key is None:
+            return None, None
+        slot = self.crawler.engine.downloader.slots.get(key)
+        controller = self.controllers.get(key)
+        if controller is None and slot is not None:
+            # Start small and let the domain prove it can take more
+            controller = self.controllers[key] = DomainController(self.start_window, slot.delay)
+            self.apply(key, controller)
+        return key, controller
+
+    def response_received(self, response, request, spider):
+        _, controller = self.controller(request)
+        if controller is None:
+            return
+        controller.responses += 1
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            controller.latencies.append(latency)
+        if response.status in self.backoff_codes:
+            controller.errors += 1
+
+    def soft_ban(self, request, response, spider, signature):
+        _, controller = self.controller(request)
+        if controller is not None:
+            controller.errors += 1
+
+    def adjust(self):
+        for key, controller in self.controllers.items():
+            if controller.responses < self.min_samples and not controller.errors:
+                continue  # Not enough evidence either way yet
+
+            latencies = sorted(controller.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0
+            error_rate = controller.errors / max(controller.responses, 1)
+
+            if (controller.errors and error_rate > self.max_error_rate) or p95 > self.target_latency:
+                # Multiplicative decrease
+                controller.window = max(self.min_window, int(controller.window * self.decrease))
+                controller.delay = min(self.max_delay, max(controller.delay * 2, self.min_delay))
+                self.stats.inc_value(f'adaptive_concurrency/{key}/backoffs')
+            else:
+                # Additive increase
+                controller.window = min(self.max_window, controller.window + 1)
+                controller.delay = max(min(self.min_delay, controller.delay), controller.delay * 0.8)
+
+            self.stats.set_value(f'adaptive_concurrency/{key}/p95_latency', round(p95, 3))
+            controller.latencies = []
+            controller.responses = controller.errors = 0
+            self.apply(key, controller)
+
+    def apply(self, key, controller):
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.concurrency = controller.window
+            slot.delay = controller.delay
+        self.stats.set_value(f'adaptive_concurrency/{key}/window', controller.window)
+        self.stats.set_value(f'adaptive_concurrency/{key}/delay', round(controller.delay, 3))
+
+
+class PageCacheExtension:
+    """
+    Owns the persistent page cache (see retail_spiders.cache) for the crawl.
+
+    PageCacheMiddleware sends conditional requests and replays cached output on a
+    304 or an unchanged body; PageCacheSpiderMiddleware records what each freshly
+    parsed page produced. The store lives at PAGE_CACHE_DIR/<spider>.sqlite and
+    is capped at PAGE_CACHE_MAX_BYTES.
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.dir = data_path(crawler.settings.get('PAGE_CACHE_DIR', 'page_cache'), createdir=True)
+        self.max_bytes = crawler.settings.getint('PAGE_CACHE_MAX_BYTES', 0)
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PAGE_CACHE_ENABLED'):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.store = PageCacheStore(f'{self.dir}/{spider.name}.sqlite', self.max_bytes, self.stats)
+        self.store.open()
+        self.stats.set_value('page_cache/size_bytes', self.store.size)
+
+    def spider_closed(self, spider, reason):
+        if self.store is not None:
+            self.stats.set_value('page_cache/size_bytes', self.store.size)
+            self.store.close()
+
+
+class ResponseArchiveExtension:
+    """
+    Records every downloaded response into a response archive (see retail_spiders.archive)
+    so the crawl can later be re-extracted offline with `python -m retail_spiders.archive`.
+
+    One archive directory per run (ARCHIVE_URI); responses are captured after the
+    downloader middlewares, i.e. decompressed and exactly as the callbacks saw them.
+    When the writer falls behind, the engine is paused (not the reactor) until the
+    records waiting for room in its queue are in.
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.uri = crawler.settings.get('ARCHIVE_URI', 'archive/%(name)s/%(time)s')
+        self.segment_bytes = crawler.settings.getint('ARCHIVE_SEGMENT_BYTES', 256 * 1024 * 1024)
+        self.level = crawler.settings.getint('ARCHIVE_COMPRESSION_LEVEL', 6)
+        self.max_pending = crawler.settings.getint('ARCHIVE_MAX_PENDING', 1000)
+        self.writer = None
+        self.waiting = set()  # Records waiting for room in the writer's queue
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ARCHIVE_ENABLED'):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        path = self.uri % {'name': spider.name, 'time': time.strftime('%Y-%m-%dT%H-%M-%S')}
+        self.writer = ArchiveWriter(path, self.segment_bytes, self.level, self.max_pending, self.stats)
+        self.writer.open()
+        spider.logger.info(f"📼 [ARCHIVE] Recording responses to {path}")
+
+    async def spider_closed(self, spider, reason):
+        if self.writer is not None:
+            if self.waiting:
+                await asyncio.gather(*self.waiting)
+            # The thread writes what is still queued: wait for it without blocking the reactor
+            await asyncio.to_thread(self.writer.close)
+            self.writer = None
+
+    def response_received(self, response, request, spider):
+        if self.writer is None:
+            return
+        if 'page_cache_hit' in request.meta:
+            # Replayed from the page cache: there is no fresh body to keep
+            self.stats.inc_value('archive/skipped')
+            return
+        callback = request.callback.__name__ if callable(request.callback) else 'parse'
+        fingerprint = self.crawler.request_fingerprinter.fingerprint(request).hex()
+        entry = (request.url, request.method, fingerprint, callback, response.status, snapshot(request, response, spider))
+        if self.writer.write(*entry):
+            return
+        # Queue full: wait for room off the reactor, and stop new downloads meanwhile
+        self.stats.inc_value('archive/backpressure_waits')
+        if not self.waiting:
+            self.crawler.engine.pause()
+        put = asyncio.ensure_future(self.writer.put(*entry))
+        self.waiting.add(put)
+        put.add_done_callback(self._put_done)
+
+    def _put_done(self, put):
+        self.waiting.discard(put)
+        if not self.waiting and self.crawler.engine is not None:
+            self.crawler.engine.unpause()
+
+
+class MetricsResource(resource.Resource):
+    """GET /metrics (any path, really): the crawl's histograms and stats as Prometheus text."""
+    isLeaf = True
+
+    def __init__(self, render):
+        super().__init__()
+        self.render_metrics = render
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.render_metrics().encode('utf-8')
+
+
+class TimingExtension:
+    """
+    Latency histograms for the crawl's hot paths (see retail_spiders.instrumentation):
+    * download: `download_latency` per download slot (domain)
+    * callback: each spider callback (timed by TimingSpiderMiddleware)
+    * downloader_middleware: each middleware's process_request/process_response/process_exception
+    * pipeline: each item pipeline's process_item
+
+    Summaries go to the stats every TIMING_STATS_INTERVAL seconds and at close.
+    With TIMING_PROMETHEUS_ENABLED, the histograms are served in Prometheus text
+    format on TIMING_PROMETHEUS_HOST, first free port of TIMING_PROMETHEUS_PORT.
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.timings = Timings()
+        self.interval = crawler.settings.getfloat('TIMING_STATS_INTERVAL', 30)
+        self.prometheus = crawler.settings.getbool('TIMING_PROMETHEUS_ENABLED')
+        self.host = crawler.settings.get('TIMING_PROMETHEUS_HOST', '127.0.0.1')
+        self.portrange = [int(p) for p in crawler.settings.getlist('TIMING_PROMETHEUS_PORT', [9410, 9450])]
+        self.task = None
+        self.port = None
+        self.spider_name = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('TIMING_ENABLED'):
+            raise NotConfigured
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        self.spider_name = spider.name
+        # The engine has built its middleware managers by now: wrap their hot methods
+        engine = self.crawler.engine
+        for method_name in ('process_request', 'process_response', 'process_exception'):
+            instrument(engine.downloader.middleware, method_name, 'downloader_middleware', self.timings,
+                       lambda method: f'{type(method.__self__).__name__}.{method.__name__}')
+        instrument(engine.scraper.itemproc, 'process_item', 'pipeline', self.timings,
+                   lambda method: type(method.__self__).__name__)
+
+        self.task = task.LoopingCall(self.timings.export_stats, self.stats)
+        self.task.start(self.interval, now=False)
+
+        if self.prometheus:
+            site = Site(MetricsResource(lambda: self.timings.render_prometheus(self.spider_name, self.stats)))
+            try:
+                self.port = listen_tcp(self.portrange, self.host, site)
+            except CannotListenError:
+                logging.warning(f"⚠️ [TIMING] No free port in {self.portrange} for the metrics endpoint")
+            else:
+                address = self.port.getHost()
+                logging.info(f"📈 [TIMING] Prometheus metrics on http://{address.host}:{address.port}/metrics")
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        if self.port is not None:
+            self.port.stopListening()
+            self.port = None
+        self.timings.export_stats(self.stats)
+        for line in self.timings.summary():
+            logging.info(f"⏱️  [TIMING] {line}")
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            slot = request.meta.get('download_slot') or urlparse_cached(request).hostname
+            self.timings.observe('download', slot, latency)
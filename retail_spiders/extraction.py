@@ -0,0 +1,172 @@
+"""
+Declarative, precompiled extraction specs.
+
+A spec maps each ProductItem field to a selector (XPath/CSS) or JSON path plus an
+optional converter. Selectors are compiled to lxml XPath objects once, at import
+time, and evaluated straight on the lxml tree, so a page of cards is turned into
+items in one tight loop without building an ItemLoader (and its processor chains)
+per product.
+
+Values follow the same rules as the ItemLoader path they replace: the converter is
+applied to every candidate value and the first non-empty result wins (TakeFirst).
+
+Listing pages that publish their products as schema.org structured data are read
+from it instead (`extract_listing`, see retail_spiders.structured); the selectors
+remain the fallback.
+"""
+import time
+
+from lxml import etree
+from parsel.csstranslator import css2xpath
+
+from retail_spiders import structured as structured_data
+
+
+class Field:
+    """
+    How to obtain one item field.
+
+    :param xpath: XPath relative to the card element.
+    :param css: CSS selector (parsel's ::text / ::attr() supported), compiled to XPath.
+    :param path: Key path into a JSON record, e.g. ('raw', 'title').
+    :param value: A constant.
+    :param convert: Callable applied to each candidate value.
+    :param urljoin: Make the result absolute against the response URL.
+    :param default: Used when nothing was found.
+    """
+    __slots__ = ('xpath', 'path', 'value', 'convert', 'urljoin', 'default')
+
+    def __init__(self, xpath=None, css=None, path=None, value=None, convert=None, urljoin=False, default=None):
+        if css is not None:
+            xpath = css2xpath(css)
+        self.xpath = etree.XPath(xpath) if xpath is not None else None
+        self.path = path
+        self.value = value
+        self.convert = convert
+        self.urljoin = urljoin
+        self.default = default
+
+
+class ExtractionSpec:
+    """
+    A compiled set of fields for one spider.
+
+    :param item_class: Item type to produce (ProductItem for every retailer).
+    :param cards: XPath or CSS (see ``cards_css``) selecting the product cards of a listing page.
+    """
+
+    def __init__(self, item_class, fields, cards=None, cards_css=None):
+        self.item_class = item_class
+        self.fields = tuple(fields.items())
+        if cards_css is not None:
+            cards = css2xpath(cards_css)
+        self.cards = etree.XPath(cards) if cards is not None else None
+        self.card_count = etree.XPath(f'count({cards})') if cards is not None else None
+        # Constant fields (e.g. the retailer) also apply to items read from structured data
+        self.constants = {name: field.value for name, field in self.fields
+                          if field.value is not None and field.xpath is None and field.path is None}
+
+    def extract_listing(self, response, values=None, stats=None, structured=True):
+        """
+        Batch API for HTML listing pages: every product of the page in one pass.
+
+        1. JSON-LD, when it describes every card completely (cheaper than the selectors).
+        2. The card selectors (extract_cards).
+        3. Microdata, then OpenGraph, when the selectors found no card (e.g. the
+           layout classes changed, or a search redirected to a product page).
+
+        `structured=False` (STRUCTURED_DATA_ENABLED) skips steps 1 and 3. With `stats`,
+        extraction/{structured,selectors}/{pages,seconds} and
+        extraction/structured/<syntax> record which path read each page.
+        """
+        start = time.perf_counter()
+        syntaxes = structured_data.detect(response.body) if structured else ()
+        items, syntax = self._extract_structured(response, [s for s in syntaxes if s in structured_data.PREFERRED], values)
+        if items is None:
+            items = self.extract_cards(response, values)
+            if not items:
+                fallback = [s for s in syntaxes if s not in structured_data.PREFERRED]
+                items, syntax = self._extract_structured(response, fallback, values)
+                items = items or []
+        path = 'structured' if syntax else 'selectors'
+        if stats is not None:
+            stats.inc_value(f'extraction/{path}/pages')
+            stats.inc_value(f'extraction/{path}/seconds', time.perf_counter() - start)
+            if syntax:
+                stats.inc_value(f'extraction/structured/{syntax}')
+        return items
+
+    def _extract_structured(self, response, syntaxes, values):
+        # The first syntax whose products are all complete and cover every card wins
+        if not syntaxes:
+            return None, None
+        root = response.selector.root
+        cards = self.card_count(root) if self.card_count is not None else 0
+        for syntax in syntaxes:
+            products = structured_data.extract_products(syntax, root)
+            if not products or len(products) < cards:
+                continue
+            rows = [structured_data.product_values(product, response) for product in products]
+            if None in rows:
+                continue
+            base = dict(values) if values else {}
+            base.update(self.constants)
+            return [self.item_class(base, **row) for row in rows], syntax
+        return None, None
+
+    def extract_cards(self, response, values=None):
+        """
+        Batch API: extracts every card of an HTML listing page at once.
+        `values` are set on every item (e.g. the category of the listing).
+        """
+        root = response.selector.root
+        return [self.extract_element(card, response, values) for card in self.cards(root)]
+
+    def extract_element(self, element, response, values=None):
+        """Builds one item from an lxml element (e.g. a product card)."""
+        values = dict(values) if values else {}
+        for name, field in self.fields:
+            if field.xpath is not None:
+                candidates = field.xpath(element)
+            else:
+                candidates = (field.value,)
+            self._set(values, name, field, candidates, response)
+        return self.item_class(values)
+
+    def extract_records(self, records, response, values=None):
+        """Batch API: extracts one item per JSON record (e.g. API hits), see extract_cards for `values`."""
+        return [self.extract_record(record, response, values) for record in records]
+
+    def extract_record(self, record, response, values=None):
+        """Builds one item from a decoded JSON record."""
+        values = dict(values) if values else {}
+        for name, field in self.fields:
+            if field.path is not None:
+                value = record
+                for key in field.path:
+                    value = value.get(key) if isinstance(value, dict) else None
+                candidates = (value,)
+            else:
+                candidates = (field.value,)
+            self._set(values, name, field, candidates, response)
+        return self.item_class(values)
+
+    @staticmethod
+    def _set(values, name, field, candidates, response):
+        convert = field.convert
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            if convert is not None:
+                candidate = convert(str(candidate) if isinstance(candidate, etree._ElementUnicodeResult) else candidate)
+            if candidate is not None and candidate != '':
+                break
+        else:
+            candidate = field.default
+            if candidate is None:
+                return
+        if isinstance(candidate, etree._ElementUnicodeResult):
+            candidate = str(candidate)
+        if field.urljoin:
+            candidate = response.urljoin(candidate)
+        values[name] = candidate
@@ -0,0 +1,270 @@
+"""
+Compressed, size-rotated and columnar feed exports.
+
+* `ZstdPlugin`: feed postprocessing plugin streaming the output through zstd
+  (Scrapy ships `GzipPlugin`, `LZMAPlugin` and `Bz2Plugin`; zstd compresses JSONL
+  about as well as lzma at gzip-like speed).
+* `RotatingFeedExporter`: drop-in replacement for Scrapy's FeedExporter that also
+  starts a new file once the current one reaches `batch_max_bytes` (measured on
+  disk, i.e. after compression).
+* `ParquetItemExporter` / `ArrowItemExporter`: buffer items into column batches and
+  write them as Parquet row groups / Arrow IPC record batches, typed from the
+  `arrow_type` metadata of the ProductItem fields.
+
+zstandard and pyarrow are optional: a feed using them fails to open with a clear
+error when they are not installed; every other feed keeps working.
+"""
+import logging
+import re
+from datetime import datetime, timezone
+
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import BaseItemExporter
+from scrapy.extensions.feedexport import FeedExporter
+from scrapy.utils.misc import load_object
+
+try:
+    import zstandard
+except ImportError:  # Only needed for ZstdPlugin
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Only needed for the Parquet/Arrow exporters
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+
+class ZstdPlugin:
+    """
+    Compresses the feed with zstd, one frame per file.
+
+    Accepted feed options: `zstd_level` (default 3), `zstd_threads` (default 0,
+    compress in the calling thread; -1 uses one thread per CPU).
+    """
+
+    def __init__(self, file, feed_options):
+        if zstandard is None:
+            raise NotConfigured('ZstdPlugin requires the zstandard package')
+        self.file = file
+        self.feed_options = feed_options
+        compressor = zstandard.ZstdCompressor(
+            level=feed_options.get('zstd_level', 3),
+            threads=feed_options.get('zstd_threads', 0),
+        )
+        self.zstdfile = compressor.stream_writer(file, closefd=False)
+
+    def write(self, data):
+        return self.zstdfile.write(data)
+
+    def close(self):
+        self.zstdfile.close()
+
+
+class RotatingFeedExporter(FeedExporter):
+    """
+    FeedExporter with size-based rotation.
+
+    A feed with `batch_max_bytes` (or FEED_EXPORT_BATCH_MAX_BYTES) is closed and a
+    new batch started once its file reaches that size. Like `batch_item_count`, the
+    URI must contain %(batch_id)d or %(batch_time)s. Compressors buffer internally,
+    so a file may overshoot the limit by one compression block.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        for uri_template, options in list(self.feeds.items()):
+            missing = _missing_dependency(options, self.exporters)
+            if missing:
+                # Fail the feed once at startup instead of on every scraped item
+                logger.error(f"❌ [FEEDS] Skipping feed {uri_template}: {missing}")
+                del self.feeds[uri_template]
+                del self.filters[uri_template]
+
+    def _settings_are_valid(self):
+        for uri_template, options in self.feeds.items():
+            if self._max_bytes(options) and not re.search(r'%\(batch_time\)s|%\(batch_id\)', uri_template):
+                logger.error(f"❌ [FEEDS] %(batch_time)s or %(batch_id)d must be in the feed URI ({uri_template}) "
+                             f"when batch_max_bytes is set")
+                return False
+        return super()._settings_are_valid()
+
+    def _max_bytes(self, options):
+        return options.get('batch_max_bytes', self.settings.getint('FEED_EXPORT_BATCH_MAX_BYTES'))
+
+    def item_scraped(self, item, spider):
+        super().item_scraped(item, spider)
+        slots = []
+        for slot in self.slots:
+            max_bytes = self._max_bytes(self.feeds[slot.uri_template])
+            if max_bytes and slot.itemcount and _written(slot) >= max_bytes:
+                uri_params = self._get_uri_params(spider, self.feeds[slot.uri_template]['uri_params'], slot)
+                self._pending_close_coros.append(self._close_slot(slot, spider))
+                slot = self._start_new_batch(
+                    batch_id=slot.batch_id + 1,
+                    uri=slot.uri_template % uri_params,
+                    feed_options=self.feeds[slot.uri_template],
+                    spider=spider,
+                    uri_template=slot.uri_template,
+                )
+            slots.append(slot)
+        self.slots = slots
+
+
+def _missing_dependency(options, exporters):
+    postprocessing = [load_object(plugin) for plugin in options.get('postprocessing') or ()]
+    if ZstdPlugin in postprocessing and zstandard is None:
+        return 'zstd compression requires the zstandard package'
+    exporter = exporters.get(options.get('format'))
+    if exporter is not None and issubclass(exporter, ColumnarItemExporter) and pyarrow is None:
+        return f"the {options['format']} format requires the pyarrow package"
+    return None
+
+
+def _written(slot):
+    # PostProcessingManager.tell() reports the underlying (compressed) file position
+    try:
+        return slot.file.tell() if slot.file is not None else 0
+    except (OSError, ValueError):  # stdout and other unseekable storages never rotate
+        return 0
+
+
+def _to_string(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+# arrow_type metadata -> (pyarrow type factory, value converter)
+ARROW_TYPES = {
+    'string': (lambda: pyarrow.string(), _to_string),
+    'int64': (lambda: pyarrow.int64(), int),
+    'float64': (lambda: pyarrow.float64(), float),
+    'bool': (lambda: pyarrow.bool_(), bool),
+    'timestamp': (lambda: pyarrow.timestamp('us', tz='UTC'), _to_timestamp),
+    'string_list': (lambda: pyarrow.list_(pyarrow.string()), lambda values: [_to_string(v) for v in values]),
+}
+
+
+def item_columns(item_class, fields=None):
+    """
+    (name, arrow_type) of each column for a scrapy Item class, typed from the
+    fields' `arrow_type` metadata (string when absent). `fields` restricts and
+    orders the columns (FEED_EXPORT_FIELDS).
+    """
+    names = list(fields) if fields else list(item_class.fields)
+    return [(name, item_class.fields.get(name, {}).get('arrow_type', 'string')) for name in names]
+
+
+def item_schema(item_class, fields=None):
+    """pyarrow schema of a scrapy Item class, one nullable column per field."""
+    return pyarrow.schema([pyarrow.field(name, ARROW_TYPES[arrow_type][0]())
+                           for name, arrow_type in item_columns(item_class, fields)])
+
+
+class ColumnarItemExporter(BaseItemExporter):
+    """
+    Buffers items column by column and hands `batch_size` rows at a time to
+    `write_batch`. Values that don't convert to their column's type are stored as
+    null (and counted) rather than failing the whole batch.
+
+    Exporter options (FEEDS item_export_kwargs): `item_class` (default ProductItem),
+    `batch_size` (rows per row group / record batch, default 10000).
+    """
+
+    def __init__(self, file, item_class='retail_spiders.items.ProductItem', batch_size=10000, **kwargs):
+        if pyarrow is None:
+            raise NotConfigured(f'{type(self).__name__} requires the pyarrow package')
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.batch_size = batch_size
+        fields = self.fields_to_export
+        if isinstance(fields, dict):
+            fields = list(fields)  # Column renaming isn't supported, only selection
+        item_class = load_object(item_class)
+        self.schema = item_schema(item_class, fields)
+        self.converters = [ARROW_TYPES[arrow_type][1] for _, arrow_type in item_columns(item_class, fields)]
+        self.columns = [[] for _ in self.schema]
+        self.rows = 0
+        self.coerced = 0
+        self.writer = None
+
+    def export_item(self, item):
+        values = dict(self._get_serialized_fields(item, default_value=None))
+        for column, field, convert in zip(self.columns, self.schema, self.converters):
+            value = values.get(field.name)
+            if value is not None:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError):
+                    value = None
+                    self.coerced += 1
+            column.append(value)
+        self.rows += 1
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def serialize_field(self, field, name, value):
+        # Keep native values: the column converters type them
+        serializer = field.get('serializer')
+        return serializer(value) if serializer else value
+
+    def flush(self):
+        if not self.rows:
+            return
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(self.columns, self.schema)],
+            schema=self.schema,
+        )
+        if self.writer is None:
+            self.writer = self.open_writer()
+        self.write_batch(batch)
+        self.columns = [[] for _ in self.schema]
+        self.rows = 0
+
+    def finish_exporting(self):
+        self.flush()
+        if self.writer is None:
+            self.writer = self.open_writer()  # Empty feeds still get a valid file with the schema
+        self.writer.close()
+        if self.coerced:
+            logger.warning(f"⚠️ [FEEDS] {self.coerced} values did not match their column type and were stored as null")
+
+    def open_writer(self):
+        raise NotImplementedError
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+
+class ParquetItemExporter(ColumnarItemExporter):
+    """Parquet file, one row group per batch. Extra option: `compression` (default 'zstd')."""
+
+    def __init__(self, file, compression='zstd', **kwargs):
+        self.compression = compression
+        super().__init__(file, **kwargs)
+
+    def open_writer(self):
+        return pyarrow.parquet.ParquetWriter(self.file, self.schema, compression=self.compression)
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
+
+
+class ArrowItemExporter(ColumnarItemExporter):
+    """Arrow IPC (Feather v2) file, one record batch per batch."""
+
+    def open_writer(self):
+        return pyarrow.ipc.new_file(self.file, self.schema)
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
@@ -0,0 +1,569 @@
+"""
+Shared crawl frontier: several worker processes (or nodes) crawling one spider.
+
+`FrontierScheduler` replaces Scrapy's in-memory scheduler with a queue every worker
+pulls from. Requests are serialized with Request.to_dict, fingerprinted into a shared
+"seen" set (so dupefiltering is global) and handed out under a lease: a worker that
+dies without acknowledging its requests has them reissued to the others once the
+lease expires.
+
+Backends are selected by FRONTIER_URL scheme through FRONTIER_BACKENDS:
+`SQLiteFrontier` for one machine (also the local stand-in for tests) and
+`RedisFrontier` for several nodes on any Redis-compatible server.
+
+Usage: python -m retail_spiders.frontier bunnings --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import queue
+import sqlite3
+import time
+from weakref import WeakKeyDictionary
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+
+try:
+    import redis
+except ImportError:  # Only needed for RedisFrontier
+    redis = None
+
+# Crawler -> its FrontierScheduler, for the acknowledging middlewares
+_schedulers = WeakKeyDictionary()
+
+
+class SQLiteFrontier:
+    """
+    Frontier in a single SQLite file, shared by processes on one machine.
+
+    Writers serialize on the database lock (BEGIN IMMEDIATE), so every lease is
+    atomic across processes. WAL mode keeps readers from blocking the writer.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen (fp BLOB PRIMARY KEY) WITHOUT ROWID')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT, priority INTEGER, data BLOB,'
+            ' owner TEXT, lease_until REAL DEFAULT 0)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS queue_order ON queue (priority DESC, id)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)')
+
+    @classmethod
+    def from_url(cls, url):
+        # sqlite:///relative/path.sqlite or sqlite:////absolute/path.sqlite
+        return cls(url.split('://', 1)[1][1:])
+
+    def reset(self):
+        with self._transaction():
+            self.db.execute('DELETE FROM seen')
+            self.db.execute('DELETE FROM queue')
+            self.db.execute('DELETE FROM counters')
+
+    def push(self, entries):
+        """
+        Adds (fingerprint, priority, data, dont_filter) entries; returns how many were
+        queued (the rest were already seen).
+        """
+        queued = 0
+        with self._transaction():
+            for fp, priority, data, dont_filter in entries:
+                new = self.db.execute('INSERT OR IGNORE INTO seen VALUES (?)', (fp,)).rowcount
+                if new or dont_filter:
+                    self.db.execute('INSERT INTO queue (priority, data) VALUES (?, ?)', (priority, data))
+                    queued += 1
+        return queued
+
+    def lease(self, owner, count, timeout):
+        """
+        Leases up to `count` entries (highest priority first) for `timeout` seconds.
+        Returns (entries, reissued): [(entry_id, data)] and how many of them had
+        an expired lease from another worker.
+        """
+        now = time.time()
+        with self._transaction():
+            rows = self.db.execute(
+                'SELECT id, data, owner FROM queue WHERE lease_until < ? ORDER BY priority DESC, id LIMIT ?',
+                (now, count),
+            ).fetchall()
+            self.db.executemany(
+                'UPDATE queue SET owner = ?, lease_until = ? WHERE id = ?',
+                [(owner, now + timeout, row[0]) for row in rows],
+            )
+        return [(row[0], row[1]) for row in rows], sum(1 for row in rows if row[2] is not None)
+
+    def ack(self, entry_ids):
+        with self._transaction():
+            self.db.executemany('DELETE FROM queue WHERE id = ?', [(i,) for i in entry_ids])
+            self.db.execute(
+                'INSERT INTO counters VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                ('done', len(entry_ids)),
+            )
+
+    def release(self, entry_ids):
+        """Returns leased entries to the queue straight away (graceful shutdown)."""
+        with self._transaction():
+            self.db.executemany(
+                'UPDATE queue SET owner = NULL, lease_until = 0 WHERE id = ?', [(i,) for i in entry_ids]
+            )
+
+    def counts(self):
+        now = time.time()
+        queued, leased = self.db.execute(
+            'SELECT COALESCE(SUM(lease_until < ?), 0), COALESCE(SUM(lease_until >= ?), 0) FROM queue', (now, now)
+        ).fetchone()
+        done = self.db.execute("SELECT value FROM counters WHERE name = 'done'").fetchone()
+        seen = self.db.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+        return {'queued': queued, 'leased': leased, 'seen': seen, 'done': done[0] if done else 0}
+
+    def close(self):
+        self.db.close()
+
+    def _transaction(self):
+        return _Transaction(self.db)
+
+
+class _Transaction:
+    __slots__ = ('db',)
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        # Take the write lock up front so concurrent leases never interleave
+        self.db.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+# KEYS: queue, leases, data, score | ARGV: now, lease_until, count
+REDIS_LEASE = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('ZADD', KEYS[1], redis.call('HGET', KEYS[4], id), id)
+end
+local ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[3]) - 1)
+local out = {#expired}
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZADD', KEYS[2], ARGV[2], id)
+    table.insert(out, id)
+    table.insert(out, redis.call('HGET', KEYS[3], id))
+end
+return out
+"""
+
+
+class RedisFrontier:
+    """
+    Frontier on a Redis-compatible server, for workers spread over several nodes.
+
+    Keys (under `prefix`): a set of seen fingerprints, a sorted set of queued entry ids
+    (scored by priority, FIFO within a priority), a sorted set of leased ids scored by
+    lease expiry, and hashes with each entry's data and score. Leasing (including the
+    reissue of expired leases) runs as one Lua script, so it is atomic.
+    """
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+        self.keys = {name: f'{prefix}:{name}' for name in ('seen', 'queue', 'leases', 'data', 'score', 'seq', 'done')}
+        self._lease = client.register_script(REDIS_LEASE)
+
+    @classmethod
+    def from_url(cls, url):
+        if redis is None:
+            raise NotConfigured('RedisFrontier requires the redis package')
+        # redis://host:6379/0#prefix (the fragment names the crawl, default 'frontier')
+        url, _, prefix = url.partition('#')
+        return cls(redis.Redis.from_url(url), prefix or 'frontier')
+
+    def reset(self):
+        self.client.delete(*self.keys.values())
+
+    def push(self, entries):
+        k = self.keys
+        pipe = self.client.pipeline()
+        for fp, _, _, _ in entries:
+            pipe.sadd(k['seen'], fp)
+        added = pipe.execute()
+
+        entries = [e for e, new in zip(entries, added) if new or e[3]]
+        if not entries:
+            return 0
+        first = self.client.incrby(k['seq'], len(entries)) - len(entries) + 1
+        pipe = self.client.pipeline()
+        for seq, (_, priority, data, _) in enumerate(entries, first):
+            # Zero-padded ids keep members of equal score in FIFO order
+            entry_id = f'{seq:015d}'
+            pipe.hset(k['data'], entry_id, data)
+            pipe.hset(k['score'], entry_id, -priority)
+            pipe.zadd(k['queue'], {entry_id: -priority})
+        pipe.execute()
+        return len(entries)
+
+    def lease(self, owner, count, timeout):
+        k = self.keys
+        now = time.time()
+        out = self._lease(keys=[k['queue'], k['leases'], k['data'], k['score']], args=[now, now + timeout, count])
+        reissued, flat = out[0], out[1:]
+        return [(flat[i].decode(), flat[i + 1]) for i in range(0, len(flat), 2)], reissued
+
+    def ack(self, entry_ids):
+        k = self.keys
+        pipe = self.client.pipeline()
+        pipe.zrem(k['leases'], *entry_ids)
+        pipe.hdel(k['data'], *entry_ids)
+        pipe.hdel(k['score'], *entry_ids)
+        pipe.incrby(k['done'], len(entry_ids))
+        pipe.execute()
+
+    def release(self, entry_ids):
+        k = self.keys
+        scores = self.client.hmget(k['score'], entry_ids)
+        pipe = self.client.pipeline()
+        pipe.zrem(k['leases'], *entry_ids)
+        pipe.zadd(k['queue'], {i: float(s) for i, s in zip(entry_ids, scores) if s is not None})
+        pipe.execute()
+
+    def counts(self):
+        k = self.keys
+        pipe = self.client.pipeline()
+        pipe.zcard(k['queue'])
+        pipe.zcard(k['leases'])
+        pipe.scard(k['seen'])
+        pipe.get(k['done'])
+        queued, leased, seen, done = pipe.execute()
+        return {'queued': queued, 'leased': leased, 'seen': seen, 'done': int(done or 0)}
+
+    def close(self):
+        self.client.close()
+
+
+def open_frontier(settings, spider_name):
+    """Builds the backend configured by FRONTIER_URL / FRONTIER_BACKENDS for a spider."""
+    url = settings.get('FRONTIER_URL') % {'name': spider_name}
+    scheme = url.split('://', 1)[0]
+    backends = settings.getdict('FRONTIER_BACKENDS')
+    if scheme not in backends:
+        raise NotConfigured(f'No frontier backend registered for {scheme!r}')
+    return load_object(backends[scheme]).from_url(url)
+
+
+class FrontierScheduler:
+    """
+    Scrapy scheduler backed by a shared frontier.
+
+    * Enqueued requests are buffered and pushed in batches of FRONTIER_BATCH_SIZE;
+      the shared seen-set drops duplicates found by any worker.
+    * Requests are leased in batches for FRONTIER_LEASE_TIMEOUT seconds and acknowledged
+      once finished: after their callback has produced all its output (see
+      FrontierSpiderMiddleware), when they fail or are dropped (FrontierMiddleware,
+      request_dropped), or when a retry/redirect replacing them is pushed as a new entry.
+      A worker that dies mid-parse leaves its leases to be reissued.
+    * The spider stays open while any worker still holds leases, since their
+      responses may add more pages.
+
+    Enable with SCHEDULER = 'retail_spiders.frontier.FrontierScheduler' (the worker
+    launcher below does it for you).
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.fingerprinter = crawler.request_fingerprinter
+        self.worker_id = settings.get('FRONTIER_WORKER_ID') or f'{os.uname().nodename}:{os.getpid()}'
+        self.lease_timeout = settings.getfloat('FRONTIER_LEASE_TIMEOUT', 300)
+        self.batch_size = settings.getint('FRONTIER_BATCH_SIZE', 16)
+        self.frontier = None
+        self.spider = None
+        self.outgoing = []   # Buffered pushes
+        self.leased = []     # Leased requests not handed to the engine yet
+        self.active = set()  # Entry ids handed to the engine and not finished yet
+        self.held = set()    # Active ids held back outside the engine (e.g. parked by the circuit breaker)
+        self.acks = []
+        self._busy_until = 0
+        self._busy = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = cls(crawler)
+        crawler.signals.connect(scheduler.request_dropped, signal=signals.request_dropped)
+        _schedulers[crawler] = scheduler
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        self.frontier = open_frontier(self.crawler.settings, spider.name)
+
+    def close(self, reason):
+        self.flush()
+        if self.leased:
+            # Hand unstarted work back to the other workers straight away
+            self.frontier.release([entry_id for entry_id, _ in self.leased])
+            self.stats.inc_value('frontier/released', len(self.leased))
+            self.leased = []
+        self.frontier.close()
+
+    def has_pending_requests(self):
+        if self.leased or self.outgoing:
+            return True
+        if len(self.active) > len(self.held) and self._engine_idle():
+            # Nothing is downloading or being parsed, so these finished on a path no hook
+            # sees (e.g. an exception raised in a process_response); don't wait on them
+            finished = self.active - self.held
+            self.stats.inc_value('frontier/acked_idle', len(finished))
+            self.acks.extend(finished)
+            self.active -= finished
+            self.flush()
+        # Polling the backend on every engine tick would be wasteful
+        now = time.monotonic()
+        if now >= self._busy_until:
+            counts = self.frontier.counts()
+            self._busy = bool(counts['queued'] or counts['leased'])
+            self._busy_until = now + 1
+        return self._busy
+
+    def enqueue_request(self, request):
+        # Retries and redirects carry the lease of the request they replace, which is
+        # finished now; they become new entries
+        parent = request.meta.pop('frontier_id', None)
+        if parent is not None:
+            self._ack(parent)
+        data = pickle.dumps(request.to_dict(spider=self.spider), protocol=pickle.HIGHEST_PROTOCOL)
+        fp = self.fingerprinter.fingerprint(request)
+        self.outgoing.append((fp, request.priority, data, request.dont_filter))
+        if len(self.outgoing) >= self.batch_size:
+            self.flush()
+        return True
+
+    def next_request(self):
+        if not self.leased:
+            self.flush()
+            entries, reissued = self.frontier.lease(self.worker_id, self.batch_size, self.lease_timeout)
+            if not entries:
+                return None
+            self.leased = entries[::-1]
+            self.stats.inc_value('frontier/leased', len(entries))
+            if reissued:
+                self.stats.inc_value('frontier/reissued', reissued)
+
+        entry_id, data = self.leased.pop()
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        request.meta['frontier_id'] = entry_id
+        self.active.add(entry_id)
+        self.stats.inc_value('scheduler/dequeued/frontier')
+        return request
+
+    def ack(self, request):
+        """Acknowledges a request this worker has finished with (idempotent)."""
+        entry_id = request.meta.get('frontier_id')
+        if entry_id is not None:
+            self._ack(entry_id)
+
+    def hold(self, request):
+        """Keeps a request's lease out of the idle acknowledgement until it is crawled again."""
+        entry_id = request.meta.get('frontier_id')
+        if entry_id in self.active:
+            self.held.add(entry_id)
+
+    def request_dropped(self, request, spider):
+        self.ack(request)
+
+    def _ack(self, entry_id):
+        if entry_id not in self.active:
+            return
+        self.active.discard(entry_id)
+        self.held.discard(entry_id)
+        self.acks.append(entry_id)
+        if len(self.acks) >= self.batch_size:
+            self.flush()
+
+    def _engine_idle(self):
+        engine = self.crawler.engine
+        return engine is not None and not engine.downloader.active and engine.scraper.slot.is_idle()
+
+    def flush(self):
+        """Pushes buffered requests and acknowledgements to the backend."""
+        if self.outgoing:
+            queued = self.frontier.push(self.outgoing)
+            self.stats.inc_value('scheduler/enqueued/frontier', queued)
+            self.stats.inc_value('frontier/duplicates', len(self.outgoing) - queued)
+            self.outgoing = []
+            self._busy_until = 0
+        if self.acks:
+            self.frontier.ack(self.acks)
+            self.stats.inc_value('frontier/acked', len(self.acks))
+            self.acks = []
+
+
+def _acknowledge(crawler, request):
+    scheduler = _schedulers.get(crawler)
+    if scheduler is not None:
+        scheduler.ack(request)
+
+
+def hold_lease(crawler, request):
+    """
+    For components that hold a request back outside the engine (e.g. the circuit
+    breaker's parked requests): its lease stays unacknowledged until the request is
+    scheduled again, so it is reissued if this worker dies meanwhile.
+    """
+    scheduler = _schedulers.get(crawler)
+    if scheduler is not None:
+        scheduler.hold(request)
+
+
+def _uses_frontier(settings):
+    return issubclass(load_object(settings.get('SCHEDULER')), FrontierScheduler)
+
+
+class FrontierSpiderMiddleware:
+    """
+    Acknowledges a leased request once its callback has produced all its output, or
+    raised. Placed outermost, so the output of every other middleware is done too.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not _uses_frontier(crawler.settings):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_spider_output(self, response, result):
+        try:
+            yield from result
+        finally:
+            _acknowledge(self.crawler, response.request)
+
+    async def process_spider_output_async(self, response, result):
+        try:
+            async for entry in result:
+                yield entry
+        finally:
+            _acknowledge(self.crawler, response.request)
+
+    def process_spider_exception(self, response, exception):
+        _acknowledge(self.crawler, response.request)
+        return None
+
+
+class FrontierMiddleware:
+    """
+    Acknowledges leased requests that fail in the downloader: IgnoreRequest raised by
+    a middleware's process_request (offsite, parked, ...) or an error no middleware
+    retried. Placed first, so its process_exception runs after every other one.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not _uses_frontier(crawler.settings):
+            raise NotConfigured
+        return cls(crawler)
+
+    def process_exception(self, request, exception):
+        _acknowledge(self.crawler, request)
+        return None
+
+
+def _run_worker(spider, settings, spider_kwargs, results):
+    # Imported here: each worker process installs its own reactor
+    from scrapy.crawler import CrawlerProcess
+
+    process = CrawlerProcess(settings, install_root_handler=True)
+    crawler = process.create_crawler(spider)
+    process.crawl(crawler, **spider_kwargs)
+    process.start()
+    stats = crawler.stats.get_stats()
+    results.put({k: v for k, v in stats.items() if isinstance(v, (int, float))})
+
+
+def run_workers(spider, workers, settings, resume=False, spider_kwargs=None):
+    """
+    Crawls one spider (name or class) with `workers` processes sharing a frontier.
+    Returns (summed numeric stats of all workers, frontier counts, wall time in seconds).
+    """
+    spider_name = spider if isinstance(spider, str) else spider.name
+    frontier = open_frontier(settings, spider_name)
+    if not resume:
+        frontier.reset()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start = time.monotonic()
+    processes = []
+    for i in range(workers):
+        worker_settings = settings.copy()
+        worker_settings.set('SCHEDULER', 'retail_spiders.frontier.FrontierScheduler')
+        worker_settings.set('FRONTIER_WORKER_ID', f'{spider_name}-{i}')
+        process = ctx.Process(target=_run_worker, args=(spider, worker_settings.copy_to_dict(), spider_kwargs or {}, results))
+        process.start()
+        processes.append(process)
+
+    totals = {}
+    reported = 0
+    while reported < workers:
+        try:
+            worker_stats = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break  # A worker died without reporting; its leases were reissued
+            continue
+        reported += 1
+        for key, value in worker_stats.items():
+            # Timestamps and per-worker gauges don't add up meaningfully
+            if key.endswith(('_seconds', 'memusage/max', 'memusage/startup')):
+                continue
+            totals[key] = totals.get(key, 0) + value
+    for process in processes:
+        process.join()
+    elapsed = time.monotonic() - start
+
+    counts = frontier.counts()
+    frontier.close()
+    return totals, counts, elapsed
+
+
+def main():
+    from scrapy.utils.project import get_project_settings
+
+    parser = argparse.ArgumentParser(description='Run one spider across several worker processes.')
+    parser.add_argument('spider')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--frontier', help='Overrides FRONTIER_URL, e.g. redis://host:6379/0#bunnings')
+    parser.add_argument('--resume', action='store_true', help='Keep the existing frontier instead of starting fresh')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    if args.frontier:
+        settings.set('FRONTIER_URL', args.frontier, priority='cmdline')
+    settings.setdict(dict(s.split('=', 1) for s in args.set), priority='cmdline')
+
+    totals, counts, elapsed = run_workers(args.spider, args.workers, settings, args.resume)
+    pages = totals.get('downloader/response_count', 0)
+    print(f"🏁 {args.spider}: {args.workers} workers, {pages} pages, {totals.get('item_scraped_count', 0)} items "
+          f"in {elapsed:.1f}s ({pages / elapsed:.1f} pages/sec)")
+    print(f"📊 Frontier: {counts}")
+
+
+if __name__ == '__main__':
+    main()
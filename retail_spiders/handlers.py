@@ -1,51 +1,297 @@
-from scrapy.http import HtmlResponse
+import logging
+import time
+from collections import OrderedDict
+
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from curl_cffi import CurlInfo
 from curl_cffi.requests import AsyncSession
 
+logger = logging.getLogger(__name__)
+
+
+def domain_setting(mapping, host, default=None):
+    """Value for the most specific domain in `mapping` matching `host` (www.x.com, then x.com, ...)."""
+    while host:
+        if host in mapping:
+            return mapping[host]
+        host = host.partition('.')[2]
+    return default
+
+
+class StopMarkers(object):
+    """
+    Finds a sequence of markers, in order, in a body that arrives chunk by chunk
+    (e.g. 'id="__NEXT_DATA__"' then '</script>'). Only the last len(marker) - 1
+    bytes are carried over between chunks, so a marker split across two chunks is
+    still found without rescanning the body.
+    """
+    __slots__ = ('markers', 'index', 'tail')
+
+    def __init__(self, markers):
+        self.markers = [m.encode('utf-8') if isinstance(m, str) else m for m in markers]
+        self.index = 0
+        self.tail = b''
+
+    def feed(self, chunk):
+        """Returns True once every marker has been seen."""
+        window = self.tail + chunk if self.tail else chunk
+        start = 0
+        while self.index < len(self.markers):
+            marker = self.markers[self.index]
+            found = window.find(marker, start)
+            if found < 0:
+                self.tail = window[max(start, len(window) - len(marker) + 1):]
+                return False
+            start = found + len(marker)
+            self.index += 1
+        return True
+
+
+class PooledSession(object):
+    """
+    A long-lived AsyncSession plus the bookkeeping the pool needs to decide
+    when it is safe to evict it.
+    """
+    __slots__ = ('session', 'in_flight', 'last_used')
+
+    def __init__(self, session):
+        self.session = session
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+
 # CHANGE: Inherit from 'object', not 'HTTPDownloadHandler'
 class CurlCffiDownloadHandler(object):
-    
+    """
+    Download handler backed by curl_cffi.
+
+    Sessions are pooled per (impersonation profile, host, proxy) so requests to
+    the same retailer reuse TCP/TLS connections (keep-alive + HTTP/2) instead of
+    paying a fresh handshake on every page.
+
+    In streaming mode the body is read chunk by chunk: transfers are aborted once
+    they exceed the domain's max size, or cut short once the domain's stop markers
+    have been seen (the response is then flagged 'download_stopped').
+    """
+
     lazy = False
-    
-    def __init__(self, settings):
+
+    def __init__(self, settings, stats=None):
         self.settings = settings
-        self.impersonate_target = "chrome120"
+        self.stats = stats
+        self.impersonate_target = settings.get('CURL_CFFI_IMPERSONATE', 'chrome120')
+
+        # Pool configuration
+        # 'pooled' reuses sessions per key, 'request' restores one session per request
+        self.isolation = settings.get('CURL_CFFI_SESSION_ISOLATION', 'pooled')
+        self.pool_size = settings.getint('CURL_CFFI_POOL_SIZE', 16)
+        self.max_clients = settings.getint('CURL_CFFI_MAX_CLIENTS', 16)
+        self.idle_timeout = settings.getfloat('CURL_CFFI_SESSION_IDLE_TIMEOUT', 120)
+        # Cookies are dropped after every response unless explicitly kept,
+        # so pooling does not turn into session tracking.
+        self.keep_cookies = settings.getbool('CURL_CFFI_SESSION_KEEP_COOKIES', False)
+
+        # Streaming configuration
+        self.streaming = settings.getbool('CURL_CFFI_STREAMING', True)
+        self.default_maxsize = settings.getint('DOWNLOAD_MAXSIZE')
+        self.maxsize_by_domain = settings.getdict('CURL_CFFI_MAXSIZE_BY_DOMAIN')
+        self.stop_markers = settings.getdict('CURL_CFFI_STOP_MARKERS')
+
+        # key -> PooledSession, ordered from least to most recently used
+        self._sessions = OrderedDict()
 
     # Scrapy standard: handlers are often created via from_crawler
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(crawler.settings)
+        return cls(crawler.settings, crawler.stats)
 
-    async def download_request(self, request, spider):
+    async def download_request(self, request):
         # 1. Convert Headers
         curl_headers = {}
         # Safely convert headers (some might be non-string bytes)
         for k, v in request.headers.items():
             curl_headers[k.decode('utf-8')] = v[0].decode('utf-8')
 
+        impersonate = request.meta.get('impersonate') or self.impersonate_target
+        proxy = request.meta.get('proxy')
+
         # 2. Execute Request
-        # We create a fresh session for every request to ensure isolation
-        async with AsyncSession(impersonate=self.impersonate_target) as session:
-            
-            response = await session.request(
-                method=request.method,
-                url=request.url,
-                headers=curl_headers,
-                data=request.body,
-                cookies=request.cookies,
-                allow_redirects=request.meta.get('dont_redirect', True) == False,
-                timeout=30
-            )
-
-            # 3. Return Scrapy Response
-            return HtmlResponse(
-                url=request.url,
-                status=response.status_code,
-                headers=dict(response.headers),
-                body=response.content,
-                encoding='utf-8',
-                request=request
-            )
-
-    # Scrapy calls this when the spider finishes to clean up resources
-    def close(self):
-        pass
\ No newline at end of file
+        start = time.monotonic()
+        if self.isolation == 'request' or request.meta.get('curl_cffi_isolate'):
+            # Opt-out: a throwaway session for requests that must not share state
+            async with self._new_session(impersonate, proxy) as session:
+                response, body, flags = await self._send(session, request, curl_headers, start)
+        else:
+            key = (impersonate, urlparse_cached(request).netloc, proxy)
+            pooled = await self._acquire(key)
+            try:
+                response, body, flags = await self._send(pooled.session, request, curl_headers, start)
+            finally:
+                self._release(pooled)
+
+        self._record_connection(response)
+
+        # 3. Return Scrapy Response
+        # Keep repeated headers (Set-Cookie, Link, ...); curl already decoded the body
+        headers = Headers(response.headers.multi_items())
+        headers.pop('Content-Encoding', None)
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return respcls(
+            url=request.url,
+            status=response.status_code,
+            headers=headers,
+            body=body,
+            flags=flags,
+            request=request
+        )
+
+    async def _send(self, session, request, curl_headers, start):
+        """Returns (curl response, body, response flags)."""
+        response = await session.request(
+            method=request.method,
+            url=request.url,
+            headers=curl_headers,
+            data=request.body,
+            cookies=request.cookies,
+            allow_redirects=request.meta.get('dont_redirect', True) == False,
+            timeout=30,
+            stream=self.streaming,
+        )
+        # Same meaning as Scrapy's handlers: time until the response headers arrived
+        request.meta['download_latency'] = time.monotonic() - start
+        try:
+            if self.streaming:
+                body, flags = await self._read_body(response, request)
+            else:
+                body, flags = response.content, []
+        finally:
+            if not self.keep_cookies:
+                session.cookies.clear()
+        return response, body, flags
+
+    async def _read_body(self, response, request):
+        host = urlparse_cached(request).hostname or ''
+        maxsize = request.meta.get('download_maxsize',
+                                   domain_setting(self.maxsize_by_domain, host, self.default_maxsize))
+        markers = request.meta.get('stop_markers', domain_setting(self.stop_markers, host))
+        scanner = StopMarkers(markers) if markers else None
+
+        # Without stop markers a too-large declared length is cancelled before reading anything
+        expected = response.headers.get('Content-Length')
+        if maxsize and scanner is None and expected and expected.isdigit() and int(expected) > maxsize:
+            await self._abort(response)
+            self._too_large(request, int(expected), maxsize)
+
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_content():
+            chunks.append(chunk)
+            received += len(chunk)
+            if maxsize and received > maxsize:
+                await self._abort(response)
+                self._too_large(request, received, maxsize)
+            if scanner is not None and scanner.feed(chunk):
+                await self._abort(response)
+                self._inc_stat('curl_cffi/response/stopped_early')
+                self._inc_stat('curl_cffi/response/stopped_early_bytes', received)
+                return b''.join(chunks), ['download_stopped']
+        # One copy from curl's chunks into the response body
+        return b''.join(chunks), []
+
+    async def _abort(self, response):
+        # Makes curl's write callback fail, which ends the transfer and closes its connection
+        response.quit_now.set()
+        await response.aclose()
+
+    def _too_large(self, request, size, maxsize):
+        self._inc_stat('curl_cffi/response/maxsize_exceeded')
+        logger.warning(f"⚠️ [CURL] Cancelled {request.url}: {size} bytes exceeds the max size of {maxsize}")
+        raise IgnoreRequest(f'Response of {request.url} exceeds {maxsize} bytes')
+
+    def _new_session(self, impersonate, proxy):
+        return AsyncSession(
+            impersonate=impersonate,
+            proxy=proxy,
+            max_clients=self.max_clients,
+            # NUM_CONNECTS == 0 means the transfer rode on an existing connection
+            curl_infos=[CurlInfo.NUM_CONNECTS],
+        )
+
+    async def _acquire(self, key):
+        await self._evict()
+
+        pooled = self._sessions.get(key)
+        if pooled is None:
+            impersonate, _, proxy = key
+            pooled = PooledSession(self._new_session(impersonate, proxy))
+            self._sessions[key] = pooled
+            self._inc_stat('curl_cffi/session/created')
+        else:
+            self._sessions.move_to_end(key)
+            self._inc_stat('curl_cffi/session/reused')
+
+        pooled.in_flight += 1
+        self._set_stat('curl_cffi/session/open', len(self._sessions))
+        return pooled
+
+    def _release(self, pooled):
+        pooled.in_flight -= 1
+        pooled.last_used = time.monotonic()
+
+    async def _evict(self):
+        """
+        Closes sessions that have been idle too long, then trims the least
+        recently used idle sessions until we are back under POOL_SIZE.
+        Sessions with in-flight requests are never evicted.
+        """
+        # Each close awaits, so another _acquire may evict or reuse a session of this
+        # snapshot meanwhile: _close_session re-checks it before removing it
+        now = time.monotonic()
+        for key, pooled in list(self._sessions.items()):
+            if now - pooled.last_used > self.idle_timeout:
+                await self._close_session(key, 'idle', pooled)
+
+        # Leave room for the session about to be created
+        for key, pooled in list(self._sessions.items()):
+            if len(self._sessions) < self.pool_size:
+                break
+            await self._close_session(key, 'lru', pooled)
+
+    async def _close_session(self, key, reason, expected=None):
+        """
+        Removes and closes the session of `key`. With `expected`, only if that session
+        is still the pooled one and idle; the check and the removal run without an
+        await in between, so a download can never pick up a session being closed.
+        """
+        pooled = self._sessions.get(key)
+        if pooled is None or (expected is not None and (pooled is not expected or pooled.in_flight)):
+            return
+        del self._sessions[key]
+        await pooled.session.close()
+        self._inc_stat(f'curl_cffi/session/evicted/{reason}')
+
+    def _record_connection(self, response):
+        num_connects = response.infos.get(CurlInfo.NUM_CONNECTS)
+        if num_connects is None:
+            return
+        if num_connects == 0:
+            self._inc_stat('curl_cffi/connection/reused')
+        else:
+            self._inc_stat('curl_cffi/connection/new', num_connects)
+
+    def _inc_stat(self, key, count=1):
+        if self.stats:
+            self.stats.inc_value(key, count)
+
+    def _set_stat(self, key, value):
+        if self.stats:
+            self.stats.set_value(key, value)
+
+    # Scrapy calls this when the engine stops to clean up resources
+    async def close(self):
+        # Drain the pool so no curl handles or sockets outlive the crawl
+        for key in list(self._sessions):
+            await self._close_session(key, 'shutdown')
@@ -0,0 +1,408 @@
+"""
+Helpers for reading framework hydration state (e.g. Next.js `__NEXT_DATA__`)
+straight from the raw response body.
+
+The script is located with a byte search, so no lxml tree is ever built, and
+values are decoded lazily: `HydrationState.get()` decodes only the subtree that
+holds the requested path whenever it can, instead of the whole multi-MB blob.
+`FlightPayload` offers the same path API for App Router pages that stream their
+state as React Flight chunks.
+"""
+import base64
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up, the stdlib decoder is used otherwise
+    orjson = None
+
+
+def loads(data):
+    """Decodes JSON bytes/str with orjson when installed, falling back to the stdlib."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def find_script(body, script_id):
+    """
+    Returns the raw contents of `<script id="{script_id}">` as bytes, or None.
+    Works directly on `response.body`; nothing is parsed as HTML.
+    """
+    script_id = script_id.encode('utf-8') if isinstance(script_id, str) else script_id
+    for marker in (b'id="' + script_id + b'"', b"id='" + script_id + b"'"):
+        pos = body.find(marker)
+        if pos == -1:
+            continue
+        # Make sure the attribute belongs to a <script> tag
+        tag_start = body.rfind(b'<', 0, pos)
+        if tag_start == -1 or body[tag_start:tag_start + 7].lower() != b'<script':
+            continue
+        content_start = body.find(b'>', pos)
+        content_end = body.find(b'</script>', content_start)
+        if content_start == -1 or content_end == -1:
+            return None
+        return body[content_start + 1:content_end]
+    return None
+
+
+class HydrationState:
+    """
+    Lazily decoded view over a hydration JSON blob.
+
+    `get('props', 'pageProps', ...)` anchors on the deepest key of the path that
+    occurs exactly once in the blob and decodes only the value after it, once a
+    backward scan from that key has read the keys of the objects enclosing it and
+    they match the rest of the path. When no key is unique, or the enclosing keys
+    are further back than SCAN_LIMIT characters (a large sibling sits in between),
+    it falls back to decoding the whole document once and walking the path.
+    """
+    __slots__ = ('raw', '_text', '_data')
+
+    _decoder = json.JSONDecoder()
+
+    # Characters the ancestor check scans back before giving up on the anchor
+    SCAN_LIMIT = 16 * 1024
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._text = None
+        self._data = None
+
+    @classmethod
+    def from_response(cls, response, script_id='__NEXT_DATA__'):
+        """Builds the state from a response, or returns None if the script is missing."""
+        raw = find_script(response.body, script_id)
+        if not raw:
+            return None
+        return cls(raw)
+
+    @property
+    def data(self):
+        """The fully decoded document (decoded once, on first access)."""
+        if self._data is None:
+            self._data = loads(self.raw)
+        return self._data
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.raw.decode('utf-8')
+        return self._text
+
+    def get(self, *path):
+        """Returns the value at `path`. Raises KeyError if it does not exist."""
+        if self._data is None:
+            for depth in range(len(path) - 1, -1, -1):
+                anchor = self._unique_key(path[depth])
+                if anchor is None:
+                    continue
+                ancestors = path[:depth]
+                matches = self._ancestors_match(anchor, ancestors) if all(isinstance(k, str) for k in ancestors) else None
+                if matches is None:
+                    break  # Can't tell cheaply: decode everything
+                if not matches:
+                    # The only occurrence of the key lives elsewhere in the document
+                    raise KeyError(path[depth])
+                subtree, _ = self._decoder.raw_decode(self.text, self._value_start(anchor, path[depth]))
+                return self._walk(subtree, path[depth + 1:])
+        return self._walk(self.data, path)
+
+    def _unique_key(self, key):
+        """Index of `"key":`, if that key occurs exactly once."""
+        if not isinstance(key, str):
+            return None
+        text = self.text
+        needle = json.dumps(key) + ':'
+        pos = text.find(needle)
+        if pos == -1 or text.find(needle, pos + 1) != -1:
+            return None
+        # An escaped quote means the match sits inside a string value
+        if pos and text[pos - 1] == '\\':
+            return None
+        return pos
+
+    def _value_start(self, pos, key):
+        text = self.text
+        value_start = pos + len(json.dumps(key)) + 1
+        while text[value_start] in ' \t\r\n':
+            value_start += 1
+        return value_start
+
+    def _ancestors_match(self, pos, ancestors):
+        """
+        Whether the key at `pos` sits at `ancestors` from the root, read by scanning
+        back through the enclosing objects' keys. None when that takes more than
+        SCAN_LIMIT characters.
+        """
+        text = self.text
+        limit = pos - self.SCAN_LIMIT
+        i = pos - 1
+        for key in reversed(ancestors):
+            i = self._enclosing_start(i, limit)
+            if i is None or i < 0:
+                return None if i is None else False
+            if text[i] == '[':
+                return False
+            # `"key":{`: step back over the colon to the key naming this object
+            i -= 1
+            while i >= 0 and text[i] in ' \t\r\n':
+                i -= 1
+            if i < 0 or text[i] != ':':
+                return False
+            i -= 1
+            while i >= 0 and text[i] in ' \t\r\n':
+                i -= 1
+            if i < 0 or text[i] != '"':
+                return False
+            start = self._string_start(i)
+            if json.loads(text[start:i + 1]) != key:
+                return False
+            i = start - 1
+        # The outermost key must belong to the root object
+        i = self._enclosing_start(i, limit)
+        if i is None:
+            return None
+        return i >= 0 and text[i] == '{' and not text[:i].strip()
+
+    def _enclosing_start(self, i, limit):
+        """
+        Index of the `{`/`[` opening the container that holds position `i` (-1 for
+        none), scanning backwards over strings and nested containers.
+        """
+        text = self.text
+        depth = 0
+        while i >= 0:
+            if i < limit:
+                return None
+            c = text[i]
+            if c == '"':
+                i = self._string_start(i) - 1
+                continue
+            if c in '}]':
+                depth += 1
+            elif c in '{[':
+                if not depth:
+                    return i
+                depth -= 1
+            i -= 1
+        return -1
+
+    def _string_start(self, end):
+        """Index of the opening quote of the string whose closing quote is at `end`."""
+        text = self.text
+        start = text.rfind('"', 0, end)
+        while start > 0:
+            backslashes = 0
+            while text[start - 1 - backslashes] == '\\':
+                backslashes += 1
+            if not backslashes % 2:
+                break
+            start = text.rfind('"', 0, start)
+        return start
+
+    @staticmethod
+    def _walk(value, path):
+        for key in path:
+            try:
+                value = value[key]
+            except (TypeError, IndexError):
+                raise KeyError(key)
+        return value
+
+
+# Rows whose payload is length-prefixed (`<id>:<tag><hex length>,<data>`) rather than newline-terminated
+FLIGHT_LENGTH_PREFIXED_TAGS = frozenset(b'TAOoUSsLlGgMmV')
+
+FLIGHT_REFERENCE = re.compile(r'\$[L@]?([0-9a-f]+)((?::[^:]+)*)')
+
+FLIGHT_CONSTANTS = {
+    '$undefined': None,
+    '$NaN': float('nan'),
+    '$Infinity': float('inf'),
+    '$-Infinity': float('-inf'),
+    '$-0': -0.0,
+}
+
+
+class FlightPayload:
+    """
+    Incremental decoder for React Flight (RSC) payloads used by the Next.js 13+ App Router,
+    where `__NEXT_DATA__` is replaced by `self.__next_f.push([1, "..."])` chunks.
+
+    Chunks are fed as they are found and split into rows (`<hex id>:<json>`), which are
+    kept as raw bytes until a lookup needs them. References between rows (`$1`, `$L1`,
+    `$@1`, `$1:props:children`) are resolved lazily, only along the path being read.
+
+    `get(*path)` mirrors HydrationState.get: the longest suffix of the path that exists
+    in the payload wins, so `get('props', 'pageProps', ..., 'searchResults', 'data')`
+    still finds `searchResults` when it arrives as component props instead of page props.
+    A suffix needs at least MIN_SUFFIX keys (the whole path when shorter): a lone generic
+    key such as `data` would match unrelated rows, so a missing path raises KeyError.
+    """
+
+    MIN_SUFFIX = 2
+
+    def __init__(self):
+        self.rows = {}
+        self._buffer = bytearray()
+        self._decoded = {}
+
+    @classmethod
+    def from_response(cls, response):
+        """Builds the payload from every `self.__next_f.push(...)` chunk, or returns None."""
+        payload = cls()
+        for chunk in iter_flight_chunks(response.body):
+            payload.feed_chunk(chunk)
+        return payload if payload.rows else None
+
+    def feed_chunk(self, chunk):
+        """Feeds one decoded `self.__next_f.push` argument (e.g. `[1, "0:[...]\\n"]`)."""
+        kind = chunk[0]
+        if kind == 1:
+            self.feed(chunk[1].encode('utf-8'))
+        elif kind == 3:
+            # Binary data is pushed base64-encoded
+            self.feed(base64.b64decode(chunk[1]))
+        # 0 (bootstrap) and 2 (form state) carry no row data
+
+    def feed(self, data):
+        """Appends raw Flight bytes and splits off every complete row."""
+        buffer = self._buffer
+        buffer += data
+        pos = 0
+        size = len(buffer)
+
+        while pos < size:
+            colon = buffer.find(b':', pos)
+            if colon == -1:
+                break
+            row_id = buffer[pos:colon].decode('ascii')
+            tag = buffer[colon + 1] if colon + 1 < size else None
+            if tag is None:
+                break
+
+            if tag in FLIGHT_LENGTH_PREFIXED_TAGS:
+                comma = buffer.find(b',', colon + 2)
+                if comma == -1:
+                    break
+                length = int(buffer[colon + 2:comma], 16)
+                end = comma + 1 + length
+                if end > size:
+                    break
+                self.rows[row_id] = (tag, bytes(buffer[comma + 1:end]))
+                pos = end
+            else:
+                newline = buffer.find(b'\n', colon)
+                if newline == -1:
+                    break
+                self.rows[row_id] = (None, bytes(buffer[colon + 1:newline]))
+                pos = newline + 1
+
+        del buffer[:pos]
+
+    def row(self, row_id):
+        """Decodes (once) and returns the value of a row."""
+        if row_id in self._decoded:
+            return self._decoded[row_id]
+        tag, raw = self.rows[row_id]
+        if tag == ord('T'):
+            value = raw.decode('utf-8')
+        elif tag is not None:
+            value = raw  # Binary typed-array rows are returned as bytes
+        elif raw[:1].isalpha() and raw[:1] not in (b't', b'f', b'n'):
+            # Tagged JSON rows: I (module), E (error), HL/HS (hints), D (debug) ...
+            start = 2 if raw[:1] == b'H' else 1
+            value = loads(raw[start:])
+        else:
+            value = loads(raw)
+        self._decoded[row_id] = value
+        return value
+
+    def resolve(self, value):
+        """Resolves a single `$`-prefixed reference or special value; other values pass through."""
+        if not isinstance(value, str) or not value.startswith('$'):
+            return value
+        if value.startswith('$$'):
+            return value[1:]
+        if value in FLIGHT_CONSTANTS:
+            return FLIGHT_CONSTANTS[value]
+        if value.startswith('$n'):
+            return int(value[2:])
+        if value.startswith('$D'):
+            return value[2:]
+        match = FLIGHT_REFERENCE.fullmatch(value)
+        if not match or match.group(1) not in self.rows:
+            return value
+        target = self.row(match.group(1))
+        for key in match.group(2).split(':')[1:]:
+            target = self.resolve(target[int(key) if isinstance(target, list) else key])
+        return self.resolve(target)
+
+    def resolve_deep(self, value, _seen=None):
+        """Resolves every reference inside a decoded value (cycles are left as references)."""
+        seen = _seen or set()
+        if isinstance(value, str):
+            if value in seen:
+                return value
+            resolved = self.resolve(value)
+            if resolved is value:
+                return value
+            return self.resolve_deep(resolved, seen | {value})
+        if isinstance(value, dict):
+            return {k: self.resolve_deep(v, seen) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.resolve_deep(v, seen) for v in value]
+        return value
+
+    def get(self, *path):
+        """Returns the fully resolved value at the longest matching suffix of `path`."""
+        for depth in range(max(len(path) - self.MIN_SUFFIX, 0) + 1 if path else 0):
+            for holder in self._dicts_with_key(path[depth]):
+                try:
+                    value = self._walk(holder, path[depth:])
+                except KeyError:
+                    continue
+                return self.resolve_deep(value)
+        raise KeyError(path[-1] if path else None)
+
+    def _dicts_with_key(self, key):
+        """Yields decoded dicts that carry `key`, scanning only rows whose raw bytes mention it."""
+        needle = json.dumps(key).encode('utf-8') + b':'
+        for row_id, (tag, raw) in self.rows.items():
+            if tag is not None or needle not in raw:
+                continue
+            stack = [self.row(row_id)]
+            while stack:
+                value = stack.pop()
+                if isinstance(value, dict):
+                    if key in value:
+                        yield value
+                    stack.extend(reversed(list(value.values())))
+                elif isinstance(value, list):
+                    stack.extend(reversed(value))
+
+    def _walk(self, value, path):
+        for key in path:
+            try:
+                value = self.resolve(value[key])
+            except (TypeError, IndexError):
+                raise KeyError(key)
+        return value
+
+
+def iter_flight_chunks(body):
+    """Yields the decoded argument of every `self.__next_f.push(...)` call in the body, in order."""
+    marker = b'self.__next_f.push('
+    decoder = HydrationState._decoder
+    pos = body.find(marker)
+    while pos != -1:
+        start = pos + len(marker)
+        end = body.find(b')</script>', start)
+        if end == -1:
+            return
+        # Arguments are JSON.stringify output, so a JSON decoder reads them as-is
+        chunk, _ = decoder.raw_decode(body[start:end].decode('utf-8'))
+        yield chunk
+        pos = body.find(marker, end)
@@ -0,0 +1,217 @@
+"""
+Hot-path latency histograms: download time, spider callbacks, downloader middlewares
+and item pipelines.
+
+Each (stage, name) pair, e.g. ('callback', 'parse_api') or ('pipeline', 'MongoPipeline'),
+gets a fixed-bucket histogram: observing a sample is a bisect and two increments,
+cheap enough to leave on for every crawl. TimingExtension publishes summaries
+(count, total, p50/p95/p99, max) to the crawler stats under timing/<stage>/<name>/
+and serves every histogram in Prometheus text format while the crawl runs.
+"""
+import inspect
+import logging
+import time
+import types
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from twisted.internet.defer import Deferred
+
+# Upper bounds (seconds) of the histogram buckets; a final +Inf bucket is implied
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimated by linear interpolation inside the bucket holding the q-th sample."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (target - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class Timings:
+    """All histograms of one crawl, keyed by (stage, name)."""
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.histograms = {}
+
+    def histogram(self, stage, name):
+        key = (stage, name)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.bounds)
+        return histogram
+
+    def observe(self, stage, name, seconds):
+        self.histogram(stage, name).observe(seconds)
+
+    def export_stats(self, stats):
+        for (stage, name), h in list(self.histograms.items()):
+            if not h.count:
+                continue
+            prefix = f'timing/{stage}/{name}'
+            stats.set_value(f'{prefix}/count', h.count)
+            stats.set_value(f'{prefix}/sum', round(h.sum, 6))
+            stats.set_value(f'{prefix}/p50', round(h.quantile(0.5), 6))
+            stats.set_value(f'{prefix}/p95', round(h.quantile(0.95), 6))
+            stats.set_value(f'{prefix}/p99', round(h.quantile(0.99), 6))
+            stats.set_value(f'{prefix}/max', round(h.max, 6))
+
+    def summary(self, limit=5):
+        """Log lines for the stages' most expensive entries (by total time)."""
+        lines = []
+        for stage in sorted({stage for stage, _ in self.histograms}):
+            entries = sorted(((name, h) for (s, name), h in self.histograms.items() if s == stage and h.count),
+                             key=lambda entry: entry[1].sum, reverse=True)
+            for name, h in entries[:limit]:
+                lines.append(f"{stage}/{name}: n={h.count} p50={h.quantile(0.5) * 1e3:.2f}ms "
+                             f"p95={h.quantile(0.95) * 1e3:.2f}ms total={h.sum:.2f}s")
+        return lines
+
+    def render_prometheus(self, spider_name, stats=None):
+        """Prometheus text exposition (format 0.0.4) of every histogram plus the numeric crawler stats."""
+        spider = _label(spider_name)
+        lines = [
+            '# HELP retail_spiders_duration_seconds Time spent per crawl stage (download, callback, middleware, pipeline).',
+            '# TYPE retail_spiders_duration_seconds histogram',
+        ]
+        for (stage, name), h in list(self.histograms.items()):
+            if not h.count:
+                continue
+            labels = f'spider="{spider}",stage="{_label(stage)}",name="{_label(name)}"'
+            cumulative = 0
+            for bound, n in zip(self.bounds, h.counts):
+                cumulative += n
+                lines.append(f'retail_spiders_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'retail_spiders_duration_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'retail_spiders_duration_seconds_sum{{{labels}}} {h.sum}')
+            lines.append(f'retail_spiders_duration_seconds_count{{{labels}}} {h.count}')
+        if stats is not None:
+            lines.append('# HELP retail_spiders_stat Numeric Scrapy stats of the running crawl.')
+            lines.append('# TYPE retail_spiders_stat gauge')
+            for key, value in list(stats.get_stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and not key.startswith('timing/'):
+                    lines.append(f'retail_spiders_stat{{spider="{spider}",key="{_label(key)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+async def _observe_awaitable(awaitable, histogram, start):
+    try:
+        return await awaitable
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def timed(method, histogram):
+    """
+    Wraps a middleware/pipeline method so each call is observed in `histogram`.
+    Coroutines and Deferreds are timed until they complete.
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        if isinstance(result, Deferred):
+            def observe(value):
+                histogram.observe(time.perf_counter() - start)
+                return value
+            return result.addBoth(observe)
+        if inspect.isawaitable(result):
+            return _observe_awaitable(result, histogram, start)
+        histogram.observe(time.perf_counter() - start)
+        return result
+
+    wrapper.__wrapped__ = method
+    wrapper.__name__ = method.__name__
+    wrapper.__qualname__ = method.__qualname__
+    wrapper.__module__ = method.__module__
+    return wrapper
+
+
+class StepTimer:
+    """
+    Accumulates the time a coroutine actually runs. Each step between two
+    suspensions is timed; time spent suspended in an await (e.g. waiting for the
+    parse pool or a download) is not, since other work runs on the reactor meanwhile.
+    """
+    __slots__ = ('elapsed',)
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    @types.coroutine
+    def run(self, awaitable):
+        """Awaits `awaitable`, driving it step by step."""
+        steps = awaitable.__await__()
+        value, error = None, None
+        while True:
+            start = time.perf_counter()
+            try:
+                yielded = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.elapsed += time.perf_counter() - start
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:  # Cancellation reaches the awaitable too
+                value, error = None, e
+
+
+def instrument(manager, method_name, stage, timings, label):
+    """
+    Replaces every `method_name` registered in a Scrapy middleware manager by a
+    timed wrapper. `label(method)` names the histogram. Returns how many were wrapped.
+
+    Scrapy has no public hook for this: it relies on the manager's `methods` and on
+    `_mw_methods_requiring_spider` (Scrapy 2.14), which decides whether a method gets
+    the deprecated spider argument. If a Scrapy upgrade changes either, nothing is
+    wrapped and a warning is logged, rather than calling methods with wrong arguments.
+    """
+    all_methods = getattr(manager, 'methods', None)
+    # Methods still taking the deprecated spider argument are tracked by identity
+    requiring_spider = getattr(manager, '_mw_methods_requiring_spider', None)
+    if not isinstance(all_methods, Mapping) or not isinstance(requiring_spider, set):
+        logging.warning(f"⚠️ [TIMING] {type(manager).__name__} internals changed (Scrapy upgrade?): "
+                        f"{stage} timings are disabled")
+        return 0
+    methods = all_methods.get(method_name) or ()
+    wrapped = 0
+    for i, method in enumerate(methods):
+        if not callable(method):
+            continue
+        timed_method = timed(method, timings.histogram(stage, label(method)))
+        if method in requiring_spider:
+            requiring_spider.add(timed_method)
+        methods[i] = timed_method
+        wrapped += 1
+    return wrapped
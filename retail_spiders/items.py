@@ -3,15 +3,63 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
 import scrapy
 from itemloaders.processors import TakeFirst, MapCompose
 
+PRICE_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
 def remove_currency_symbol(value):
     # This function cleans input before it's stored
     if value:
         return value.replace('$', '').replace(',', '').strip()
     return value
 
+def parse_price_cents(value):
+    """
+    Parses any retailer price format into integer cents.
+    '$1,299.95' -> 129995, '19.9' -> 1990, 12.5 -> 1250, 42 -> 4200, '-5.00' -> -500
+    (the sign is kept so QA can reject it). Returns None if unparseable.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        value = repr(value)  # Avoid binary float error: 0.29 * 100 != 29
+    match = PRICE_NUMBER.search(remove_currency_symbol(str(value)))
+    if not match:
+        return None
+    try:
+        return int((Decimal(match.group()) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        return None
+
+def to_cents(value):
+    """
+    Validates a value that is already in cents (e.g. Algolia's 'price'): 1299 -> 1299,
+    1299.0 or '1299' -> 1299, 1299.5 -> 1300. Returns None if it is not a number.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    try:
+        return int(Decimal(repr(value) if isinstance(value, float) else str(value).strip())
+                   .quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):  # Also NaN/Infinity
+        return None
+
+def format_cents(cents):
+    # 129995 -> '1299.95' (integer maths, no float round-trip); JSON floats such as 1299.0 are accepted
+    cents = to_cents(cents)
+    if cents is None:
+        return None
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
 class ProductItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
@@ -29,4 +77,23 @@ class ProductItem(scrapy.Item):
     )
     
     # 4. The URL (So you can click through to verify)
-    url = scrapy.Field(output_processor=TakeFirst())
\ No newline at end of file
+    url = scrapy.Field(output_processor=TakeFirst())
+
+    # 5. Normalized pricing (filled by the spider or PriceNormalizationPipeline)
+    # arrow_type types the column in Parquet/Arrow feeds (retail_spiders.feeds); other fields are strings
+    # Integer cents so QA, storage and history aggregation compare numbers, not strings
+    price_cents = scrapy.Field(arrow_type='int64')
+    currency = scrapy.Field()
+    # Optional pre-discount price, where the retailer shows one
+    was_price = scrapy.Field(input_processor=MapCompose(remove_currency_symbol), output_processor=TakeFirst())
+    was_price_cents = scrapy.Field(arrow_type='int64')
+    on_sale = scrapy.Field(arrow_type='bool')
+
+    # 6. Identity and listing context: DedupPipeline keys on sku (or url) and merges
+    # the categories a product was listed under into one item
+    sku = scrapy.Field()
+    categories = scrapy.Field(arrow_type='string_list')
+
+    # 7. Storage metadata (set by MongoPipeline)
+    scraped_at = scrapy.Field(arrow_type='timestamp')
+    spider = scrapy.Field()
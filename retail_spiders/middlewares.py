@@ -3,10 +3,21 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+from scrapy import Request, signals
+import hashlib
 import logging
+import time
 from datetime import datetime
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.python import to_bytes
+
+from retail_spiders.cache import dump_output, load_output, output_record
+from retail_spiders.instrumentation import StepTimer
+
+# Sent by SoftBanMiddleware with (request, response, spider, signature) when a soft ban is detected
+soft_ban_detected = object()
 
 class RetailSpidersSpiderMiddleware:
     """
@@ -49,10 +60,47 @@ class RetailSpidersSpiderMiddleware:
 
 
 
+class BanSignatureMatcher:
+    """
+    Precompiled set of ban signatures, built once per spider/domain.
+
+    Each signature is located with bytes.find (a vectorised two-way search in C)
+    rather than one alternation regex: on 200-500KB Next.js pages the regex
+    engine benchmarks several times slower (see benchmarks/softban.py).
+    An optional window restricts the scan to the first and last N bytes, which
+    is where block pages and challenge scripts live.
+    """
+    __slots__ = ('signatures', 'window')
+
+    def __init__(self, signatures, window=0):
+        # dict.fromkeys de-duplicates while keeping priority order
+        self.signatures = tuple(dict.fromkeys(to_bytes(sig) for sig in signatures))
+        self.window = window
+
+    def search(self, body):
+        """Returns the first signature found in the body, or None."""
+        size = len(body)
+        if not self.window or size <= 2 * self.window:
+            ranges = ((0, size),)
+        else:
+            ranges = ((0, self.window), (size - self.window, size))
+
+        for sig in self.signatures:
+            for start, end in ranges:
+                if body.find(sig, start, end) != -1:
+                    return sig
+        return None
+
+
 class SoftBanMiddleware(RetryMiddleware):
     """
     Custom Retry Middleware to catch 'Soft Bans' where the site returns 200 OK
     but the content is actually a block/captcha page.
+
+    Signatures are the built-in BAN_SIGNATURES plus SOFT_BAN_SIGNATURES,
+    SOFT_BAN_DOMAIN_SIGNATURES (per domain, subdomains included) and an optional
+    spider 'ban_signatures' attribute. They are compiled into a matcher once per
+    (spider, host) and cached.
     """
     
     # Text snippets that indicate a ban
@@ -63,19 +111,306 @@ class SoftBanMiddleware(RetryMiddleware):
         b"automated access is prohibited"
     ]
 
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.extra_signatures = settings.getlist('SOFT_BAN_SIGNATURES')
+        self.domain_signatures = settings.getdict('SOFT_BAN_DOMAIN_SIGNATURES')
+        self.scan_window = settings.getint('SOFT_BAN_SCAN_WINDOW', 0)
+        self._matchers = {}
+
+    def get_matcher(self, spider, host):
+        key = (spider.name, host)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            signatures = self.BAN_SIGNATURES + self.extra_signatures + list(getattr(spider, 'ban_signatures', []))
+            for domain, domain_sigs in self.domain_signatures.items():
+                if host == domain or host.endswith('.' + domain):
+                    signatures += domain_sigs
+            matcher = self._matchers[key] = BanSignatureMatcher(signatures, self.scan_window)
+        return matcher
+
     def process_response(self, request, response, spider):
+        if request.meta.get('dont_retry', False):
+            return response
+
         # Check if the response matches any ban signatures
-        if any(sig in response.body for sig in self.BAN_SIGNATURES):
+        matcher = self.get_matcher(spider, urlparse_cached(request).hostname or '')
+        sig = matcher.search(response.body)
+        if sig is not None:
             reason = 'Soft Ban Detected'
             spider.logger.warning(f"🛡️ SOFT BAN: Retrying {request.url}...")
+            self.crawler.stats.inc_value(f"softban/signature/{sig.decode('utf-8', 'replace')}")
+            # Let throttling components back off on this domain
+            self.crawler.signals.send_catch_log(
+                soft_ban_detected, request=request, response=response, spider=spider, signature=sig
+            )
             
-            # Triggers riggers the standard Scrapy retry logic
-            return self._retry(request, reason, spider) or response
+            # Triggers the standard Scrapy retry logic
+            return self._retry(request, reason) or response
 
         # Check for empty JSON responses (common in API scraping)
-        if 'application/json' in response.headers.get('Content-Type', b'').decode():
+        if b'application/json' in response.headers.get('Content-Type', b''):
             if not response.body or len(response.body) < 10:
                 reason = 'Empty JSON Response'
-                return self._retry(request, reason, spider) or response
+                self.crawler.stats.inc_value('softban/empty_json')
+                return self._retry(request, reason) or response
+
+        return response
+
+
+class CircuitBreakerMiddleware:
+    """
+    Network-side half of CircuitBreakerExtension.
+    Reports every response/exception per domain. Ordered above RetryMiddleware and
+    SoftBanMiddleware (550), so it sees each attempt before it is retried. Requests for domains whose breaker
+    is open are sent back to the engine, which parks them when they are scheduled
+    again, so they don't occupy download slots while paused (and no errback runs).
+    """
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from retail_spiders.extensions import CircuitBreakerExtension
+
+        for ext in crawler.extensions.middlewares:
+            if isinstance(ext, CircuitBreakerExtension):
+                return cls(ext)
+        raise NotConfigured('CircuitBreakerExtension is not enabled')
+
+    def process_request(self, request, spider):
+        domain = urlparse_cached(request).hostname
+        if not self.breaker.allow(domain, request):
+            # Already seen by the dupefilter: it has to get through the scheduler again on release
+            return request.replace(dont_filter=True)
+        return None
+
+    def process_response(self, request, response, spider):
+        self.breaker.record(urlparse_cached(request).hostname, self.breaker.is_failure(response.status), request)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        domain = urlparse_cached(request).hostname
+        # IgnoreRequest (offsite, too large, ...) is not a failure of the site, but an unanswered probe
+        if isinstance(exception, IgnoreRequest):
+            self.breaker.abandon(domain, request)
+        else:
+            self.breaker.record(domain, True, request)
+        return None
+
+
+class PageCacheMiddleware:
+    """
+    Network-side half of PageCacheExtension.
+
+    Requests for pages already in the cache carry If-None-Match / If-Modified-Since.
+    When the site answers 304, or returns a body whose hash matches the cached one,
+    the response is routed to `replay` instead of the spider callback, which
+    re-emits the items and follow-up requests recorded last time. Sits after
+    HttpCompressionMiddleware (590) so bodies are hashed decompressed, and works
+    with any download handler since it only touches headers and the body.
+
+    Opt out per request with meta={'page_cache': False}.
+    """
+
+    def __init__(self, cache, crawler):
+        self.cache = cache
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.fingerprinter = crawler.request_fingerprinter
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from retail_spiders.extensions import PageCacheExtension
+
+        for ext in crawler.extensions.middlewares:
+            if isinstance(ext, PageCacheExtension):
+                return cls(ext, crawler)
+        # Disabled by default (PAGE_CACHE_ENABLED): no warning on every crawl
+        raise NotConfigured
+
+    def process_request(self, request, spider):
+        if not request.meta.get('page_cache', True):
+            return None
+        key = self.fingerprinter.fingerprint(request).hex()
+        request.meta['page_cache_key'] = key
+
+        entry = self.cache.store.lookup(key)
+        if entry is None or request.method != 'GET':
+            return None
+        # Revalidate instead of refetching
+        if entry.etag and b'If-None-Match' not in request.headers:
+            request.headers['If-None-Match'] = entry.etag
+        if entry.last_modified and b'If-Modified-Since' not in request.headers:
+            request.headers['If-Modified-Since'] = entry.last_modified
+        if b'If-None-Match' in request.headers or b'If-Modified-Since' in request.headers:
+            self.stats.inc_value('page_cache/conditional_requests')
+        return None
+
+    def process_response(self, request, response, spider):
+        key = request.meta.get('page_cache_key')
+        if key is None or response.status not in (200, 304):
+            return response
+
+        if response.status == 304:
+            payload = self.cache.store.payload(key)
+            if payload is None:
+                # Entry was evicted while the request was in flight: fetch it in full
+                self.stats.inc_value('page_cache/refetched')
+                headers = request.headers.copy()
+                headers.pop(b'If-None-Match', None)
+                headers.pop(b'If-Modified-Since', None)
+                return request.replace(headers=headers, dont_filter=True, meta=dict(request.meta, page_cache=False))
+            return self.replay_response(request, response, payload, 'not_modified')
+
+        body_hash = hashlib.blake2b(response.body, digest_size=16).hexdigest()
+        entry = self.cache.store.lookup(key)
+        if entry is not None and entry.body_hash == body_hash:
+            payload = self.cache.store.payload(key)
+            if payload is not None:
+                return self.replay_response(request, response, payload, 'unchanged')
+
+        # Fresh content: PageCacheSpiderMiddleware records what the callback produces
+        self.stats.inc_value('page_cache/miss')
+        request.meta['page_cache_pending'] = {
+            'etag': self._header(response, b'ETag'),
+            'last_modified': self._header(response, b'Last-Modified'),
+            'body_hash': body_hash,
+        }
+        return response
+
+    def replay_response(self, request, response, payload, reason):
+        self.stats.inc_value(f'page_cache/hit/{reason}')
+        meta = dict(request.meta, page_cache_hit=reason, handle_httpstatus_list=[304])
+        meta.pop('page_cache_pending', None)
+        response.request = request.replace(
+            callback=self.replay, errback=None, cb_kwargs={'payload': payload}, meta=meta
+        )
+        return response
+
+    def replay(self, response, payload):
+        """Callback used instead of the spider's: re-emits the cached output."""
+        output = load_output(payload, self.crawler.spider)
+        for result in output:
+            if isinstance(result, Request):
+                self.stats.inc_value('page_cache/replayed_requests')
+            else:
+                self.stats.inc_value('page_cache/replayed_items')
+        return output
+
+    @staticmethod
+    def _header(response, name):
+        value = response.headers.get(name)
+        return value.decode('latin-1') if value else None
+
+
+class PageCacheSpiderMiddleware:
+    """
+    Spider-side half of PageCacheExtension: records the items and requests a
+    callback produced for a freshly downloaded page, once it has finished.
+    Placed closest to the spider so the raw callback output is stored: each result
+    is copied as it is yielded, before pipelines fill in or change its fields.
+    """
+
+    def __init__(self, cache, crawler):
+        self.cache = cache
+        self.crawler = crawler
+        self.stats = crawler.stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from retail_spiders.extensions import PageCacheExtension
+
+        for ext in crawler.extensions.middlewares:
+            if isinstance(ext, PageCacheExtension):
+                return cls(ext, crawler)
+        # Disabled by default (PAGE_CACHE_ENABLED): no warning on every crawl
+        raise NotConfigured
+
+    def process_spider_output(self, response, result, spider):
+        pending = response.meta.get('page_cache_pending')
+        if pending is None or 'page_cache_hit' in response.meta:
+            yield from result
+            return
+        output = []
+        for entry in result:
+            output = self.snapshot(output, entry, spider)
+            yield entry
+        self.record(response, pending, output)
+
+    async def process_spider_output_async(self, response, result, spider):
+        pending = response.meta.get('page_cache_pending')
+        if pending is None or 'page_cache_hit' in response.meta:
+            async for entry in result:
+                yield entry
+            return
+        output = []
+        async for entry in result:
+            output = self.snapshot(output, entry, spider)
+            yield entry
+        self.record(response, pending, output)
+
+    def snapshot(self, output, entry, spider):
+        """Adds the record of `entry` to `output`; None once an entry can't be recorded."""
+        if output is None:
+            return None
+        try:
+            output.append(output_record(entry, spider))
+        except ValueError:
+            # e.g. a request callback that is not a spider method
+            self.stats.inc_value('page_cache/unserializable')
+            return None
+        return output
+
+    def record(self, response, pending, output):
+        if output is None:
+            return
+        self.cache.store.store(response.meta['page_cache_key'], response.url, payload=dump_output(output), **pending)
+        self.stats.inc_value('page_cache/stored')
+
+
+class TimingSpiderMiddleware:
+    """
+    Times each spider callback for TimingExtension. Placed closest to the spider, it
+    only counts the time spent producing each result (the callback's own parsing),
+    not what later middlewares and pipelines do with it. Async callbacks are timed
+    while they run: their awaits (e.g. `offload` to the parse pool, which has its own
+    parse_pool histograms) are excluded.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from retail_spiders.extensions import TimingExtension
+
+        for ext in crawler.extensions.middlewares:
+            if isinstance(ext, TimingExtension):
+                return cls(ext.timings)
+        raise NotConfigured
+
+    def callback_name(self, response):
+        callback = response.request.callback if response.request is not None else None
+        return getattr(callback, '__name__', None) or 'parse'
+
+    def process_spider_output(self, response, result, spider):
+        elapsed = 0.0
+        start = time.perf_counter()
+        for entry in result:
+            elapsed += time.perf_counter() - start
+            yield entry
+            start = time.perf_counter()
+        self.timings.observe('callback', self.callback_name(response), elapsed + time.perf_counter() - start)
 
-        return response
\ No newline at end of file
+    async def process_spider_output_async(self, response, result, spider):
+        timer = StepTimer()
+        entries = aiter(result)
+        while True:
+            try:
+                entry = await timer.run(anext(entries))
+            except StopAsyncIteration:
+                break
+            yield entry
+        self.timings.observe('callback', self.callback_name(response), timer.elapsed)
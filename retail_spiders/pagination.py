@@ -0,0 +1,93 @@
+"""
+Reusable pagination planning ("pagination explosion").
+
+Once page 1 of a listing tells us how big it is, every remaining page is queued
+at once instead of following next-page links one response at a time.
+"""
+import math
+
+import scrapy
+from w3lib.url import add_or_replace_parameter
+
+
+def max_page_number(texts):
+    """Largest integer among pagination link texts (e.g. ['1', '2', '7', '>']), or None."""
+    numbers = [int(t.strip()) for t in texts if t and t.strip().isdigit()]
+    return max(numbers) if numbers else None
+
+
+class PaginationPlanner:
+    """
+    Computes and enqueues the remaining pages of a category listing.
+
+    :param page_param: Query parameter selecting the page (e.g. 'page', or 'start' for offsets).
+    :param size_param: Query parameter setting the page size (e.g. 'pagesize', 'sz').
+    :param max_page_size: Largest page size to ask for. The size actually honoured is
+        measured from the number of cards on page 1.
+    :param offset: True when page_param is an item offset (start=0, 60, ...) instead of a page number.
+
+    Falls back to following the next-page link when neither a total item count nor a
+    page count can be extracted.
+    """
+
+    def __init__(self, page_param='page', size_param=None, max_page_size=None, offset=False):
+        self.page_param = page_param
+        self.size_param = size_param
+        self.max_page_size = max_page_size
+        self.offset = offset
+
+    def with_page_size(self, url):
+        """Returns the URL asking for the largest page size (use it for page 1)."""
+        if self.size_param and self.max_page_size:
+            return add_or_replace_parameter(url, self.size_param, str(self.max_page_size))
+        return url
+
+    def page_url(self, url, page, page_size):
+        """URL of a 1-based page number."""
+        value = (page - 1) * page_size if self.offset else page
+        return add_or_replace_parameter(url, self.page_param, str(value))
+
+    def plan(self, response, callback, stats, category, meta=None, total_items=None,
+             total_pages=None, items_on_page=0, next_page=None):
+        """
+        Returns the requests to schedule after parsing one listing page.
+
+        On the first page, every remaining page is planned at once when the listing size
+        is known. Otherwise (or for sites without totals) the next-page link is followed.
+        Pages planned by an earlier explosion return nothing, except the last one, which
+        keeps following next-page links in case the page count was under-reported.
+        """
+        stats.inc_value(f'pagination/{category}/pages_fetched')
+        mode = response.meta.get('pagination_mode')
+        if mode == 'explode' and response.meta.get('page') != response.meta.get('planned_pages'):
+            return []
+
+        meta = dict(meta or {})
+        if mode is None:
+            # Page 1 itself counts as planned
+            stats.inc_value(f'pagination/{category}/pages_planned')
+            # Page size actually honoured: whatever page 1 returned, capped by what we asked for
+            page_size = items_on_page or self.max_page_size or 1
+            if self.max_page_size:
+                page_size = min(page_size, self.max_page_size)
+            if total_pages is None and total_items is not None:
+                total_pages = math.ceil(total_items / page_size)
+
+            if total_pages is not None:
+                stats.inc_value(f'pagination/{category}/pages_planned', max(total_pages - 1, 0))
+                meta['pagination_mode'] = 'explode'
+                meta['planned_pages'] = total_pages
+                return [
+                    scrapy.Request(self.page_url(response.url, page, page_size),
+                                   callback=callback, meta=dict(meta, page=page))
+                    for page in range(2, total_pages + 1)
+                ]
+
+        # Totals unknown: fall back to walking next-page links
+        if not next_page:
+            return []
+        stats.inc_value(f'pagination/{category}/pages_planned')
+        page = response.meta.get('page', 1) + 1
+        meta.pop('planned_pages', None)
+        return [response.follow(next_page, callback=callback,
+                                meta=dict(meta, page=page, pagination_mode='follow'))]
@@ -0,0 +1,182 @@
+"""
+Process pool for CPU-heavy parsing.
+
+Callbacks run on the reactor thread: while a multi-MB `__NEXT_DATA__` page is
+decoded or a listing's lxml tree is walked, no other response is handled and the
+downloader stalls. With PARSE_POOL_ENABLED, async callbacks hand the response to
+a pool of worker processes instead:
+
+    page = await offload(self.crawler, extract_search_page, response, category)
+
+`extract_search_page(response, stats, *args)` is a pure, module-level function: it
+gets a rebuilt response (URL, status, body, encoding) and a stats sink, and returns
+plain data (item dicts, pagination hints) that is pickled back. The callback turns
+that into items and requests on the reactor. Without the pool, or for bodies under
+PARSE_POOL_MIN_BYTES, the same function runs inline with the crawler's stats.
+
+Stats: parse_pool/{tasks,inline,bytes}, parse_pool/{queue,run}_seconds and their
+max_ peaks, parse_pool/max_pending. With TimingExtension the queue and run times
+also go to the parse_pool/queue and parse_pool/<function> histograms.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib import import_module
+from weakref import WeakKeyDictionary
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import TextResponse
+
+logger = logging.getLogger(__name__)
+
+# Crawler -> its running ParsePool
+_pools = WeakKeyDictionary()
+
+
+class TaskStats:
+    """Stats sink of a task run in a worker; the deltas are applied to the crawler's stats."""
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = {}
+
+    def inc_value(self, key, count=1, start=0):
+        self.values[key] = self.values.get(key, start) + count
+
+
+def _preload(modules):
+    # Import the spider's module (and with it lxml, extruct, ...) before the first task
+    for module in modules:
+        import_module(module)
+
+
+def _run_task(func, cls, url, status, body, encoding, args):
+    started = time.time()
+    if issubclass(cls, TextResponse):
+        response = cls(url=url, status=status, body=body, encoding=encoding)
+    else:
+        response = cls(url=url, status=status, body=body)
+    stats = TaskStats()
+    result = func(response, stats, *args)
+    return started, time.time(), result, stats.values
+
+
+class ParsePool:
+    """
+    Extension owning the worker processes (spawned, never forked from the reactor).
+
+    Settings: PARSE_POOL_ENABLED, PARSE_POOL_WORKERS (0 = one per CPU),
+    PARSE_POOL_MIN_BYTES, PARSE_POOL_MAX_TASKS_PER_CHILD (0 = never recycle).
+    A crashed worker (e.g. killed for memory) breaks the pool: it is rebuilt and the
+    page is parsed inline.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.workers = settings.getint('PARSE_POOL_WORKERS', 0) or os.cpu_count() or 1
+        self.min_bytes = settings.getint('PARSE_POOL_MIN_BYTES', 64 * 1024)
+        self.max_tasks_per_child = settings.getint('PARSE_POOL_MAX_TASKS_PER_CHILD', 0) or None
+        self.executor = None
+        self.modules = ()
+        self.timings = None
+        self.pending = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PARSE_POOL_ENABLED'):
+            raise NotConfigured
+        pool = cls(crawler)
+        crawler.signals.connect(pool.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(pool.spider_closed, signal=signals.spider_closed)
+        _pools[crawler] = pool
+        return pool
+
+    def spider_opened(self, spider):
+        from retail_spiders.extensions import TimingExtension
+
+        for ext in self.crawler.extensions.middlewares:
+            if isinstance(ext, TimingExtension):
+                self.timings = ext.timings
+        self.modules = (type(spider).__module__,)
+        self.executor = self._start()
+        # Boot every worker now, while the first pages download, not when they need parsing
+        for _ in range(self.workers):
+            self.executor.submit(int)
+        logger.info(f"🧵 [PARSE POOL] {self.workers} worker processes for {spider.name}")
+
+    def spider_closed(self, spider, reason):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        _pools.pop(self.crawler, None)
+
+    def _start(self):
+        # Workers only ever import modules: spawn them rather than fork a process running a reactor
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_preload,
+            initargs=(self.modules,),
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+
+    async def run(self, func, response, *args):
+        """Runs func(response, stats, *args) in a worker and returns its result."""
+        body = response.body
+        encoding = response.encoding if isinstance(response, TextResponse) else None
+        self.pending += 1
+        self.stats.max_value('parse_pool/max_pending', self.pending)
+        submitted = time.time()
+        executor = self.executor
+        try:
+            started, finished, result, deltas = await asyncio.get_running_loop().run_in_executor(
+                executor, _run_task, func, type(response), response.url, response.status, body, encoding, args)
+        except BrokenProcessPool:
+            # Every task in flight sees the same breakage: only the first one replaces the
+            # pool, the others must not shut down the replacement (and its new tasks)
+            if self.executor is executor:
+                logger.error(f"❌ [PARSE POOL] A worker died while parsing {response.url}; restarting the pool")
+                self.stats.inc_value('parse_pool/broken')
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._start()
+            return self.inline(func, response, args)
+        finally:
+            self.pending -= 1
+        for key, value in deltas.items():
+            self.stats.inc_value(key, value)
+        queued, ran = max(started - submitted, 0.0), finished - started
+        self.stats.inc_value('parse_pool/tasks')
+        self.stats.inc_value('parse_pool/bytes', len(body))
+        self.stats.inc_value('parse_pool/queue_seconds', queued)
+        self.stats.inc_value('parse_pool/run_seconds', ran)
+        self.stats.max_value('parse_pool/max_queue_seconds', queued)
+        self.stats.max_value('parse_pool/max_run_seconds', ran)
+        if self.timings is not None:
+            self.timings.observe('parse_pool', 'queue', queued)
+            self.timings.observe('parse_pool', func.__name__, ran)
+        return result
+
+    def inline(self, func, response, args):
+        self.stats.inc_value('parse_pool/inline')
+        return func(response, self.stats, *args)
+
+
+async def offload(crawler, func, response, *args):
+    """
+    Runs the pure extraction function `func(response, stats, *args)` in the crawl's
+    ParsePool, or inline when the pool is off or the body is small. `func` must be a
+    module-level function, and its arguments and result picklable.
+    """
+    pool = _pools.get(crawler)
+    if pool is None or pool.executor is None:
+        return func(response, crawler.stats, *args)
+    if len(response.body) < pool.min_bytes:
+        return pool.inline(func, response, args)
+    return await pool.run(func, response, *args)
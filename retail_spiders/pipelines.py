@@ -1,8 +1,181 @@
 from datetime import datetime, timezone
 from scrapy.exceptions import DropItem
+from scrapy.utils.misc import load_object
 from itemadapter import ItemAdapter
-import pymongo
+from retail_spiders.items import parse_price_cents
+from pymongo import InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+import asyncio
+import hashlib
 import logging
+import queue
+import threading
+import time
+from weakref import WeakKeyDictionary
+
+# Crawler -> its DedupPipeline, for MongoPipeline to apply the category merges
+_dedups = WeakKeyDictionary()
+
+
+class MongoBulkWriter:
+    """
+    Moves MongoDB writes off the reactor thread.
+
+    Operations are queued from the crawl and drained by a background thread
+    that groups them per collection and flushes with unordered bulk writes
+    whenever BATCH_SIZE operations are buffered or FLUSH_INTERVAL seconds pass.
+    The queue is bounded so a slow database pushes back on the crawl instead of
+    growing memory without limit.
+
+    One writer can serve several spiders run in the same process (see
+    shared_mongo): `bind` routes each collection's stats to its own crawler.
+    The thread only counts; the counts reach the stats from the reactor, in
+    `submit` and `publish_stats`.
+    """
+    _STOP = object()
+    _DRAIN = object()
+
+    def __init__(self, db, batch_size=500, flush_interval=5.0, max_pending=5000, stats=None):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        # collection name -> stats collector of the spider writing to it
+        self.collection_stats = {}
+        # (collection name, stat) -> count, gathered by the writer thread
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name='mongo-writer', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    async def submit(self, collection_name, operation):
+        """Queues a write, waiting (off the reactor) while the queue is full."""
+        entry = (collection_name, operation)
+        if self.counts:
+            self.publish_stats()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self._inc_stat(collection_name, 'mongo/backpressure_waits')
+            await asyncio.to_thread(self.queue.put, entry)
+
+    def bind(self, collection_name, stats):
+        self.collection_stats[collection_name] = stats
+
+    def publish_stats(self):
+        """Applies the writer thread's counts to the crawl stats; call from the reactor."""
+        with self.counts_lock:
+            counts, self.counts = self.counts, {}
+        for (collection_name, key), count in counts.items():
+            self._inc_stat(collection_name, key, count)
+
+    def drain(self):
+        """Flushes everything queued so far and waits for it, leaving the thread running."""
+        done = threading.Event()
+        self.queue.put((self._DRAIN, done))
+        done.wait()
+
+    def close(self):
+        """Flushes everything still buffered and waits for the thread to exit."""
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+    def _run(self):
+        buffers = {}
+        pending = 0
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                entry = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                entry = None
+
+            if entry is self._STOP:
+                self._flush(buffers)
+                return
+
+            if entry is not None and entry[0] is self._DRAIN:
+                self._flush(buffers)
+                pending = 0
+                entry[1].set()
+                continue
+
+            if entry is not None:
+                collection_name, operation = entry
+                buffers.setdefault(collection_name, []).append(operation)
+                pending += 1
+
+            if pending >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(buffers)
+                pending = 0
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, buffers):
+        for collection_name, operations in buffers.items():
+            if not operations:
+                continue
+            try:
+                # Unordered: one bad document does not block the rest of the batch
+                result = self.db[collection_name].bulk_write(operations, ordered=False)
+                self._count(collection_name, 'mongo/documents_written', result.inserted_count)
+                self._count(collection_name, 'mongo/documents_updated', result.upserted_count + result.modified_count)
+            except BulkWriteError as e:
+                details = e.details
+                self._count(collection_name, 'mongo/documents_written', details.get('nInserted', 0))
+                self._count(collection_name, 'mongo/documents_updated', details.get('nUpserted', 0) + details.get('nModified', 0))
+                self._count(collection_name, 'mongo/write_errors', len(details.get('writeErrors', [])))
+                logging.error(f"⚠️ MONGO: {len(details.get('writeErrors', []))} write errors in batch for '{collection_name}'")
+            except PyMongoError as e:
+                self._count(collection_name, 'mongo/write_errors', len(operations))
+                logging.error(f"⚠️ MONGO: Failed to write batch of {len(operations)} to '{collection_name}': {e}")
+            except Exception as e:
+                # e.g. bson.errors.InvalidDocument: lose this batch, never the thread (submit/close would hang)
+                self._count(collection_name, 'mongo/write_errors', len(operations))
+                logging.exception(f"⚠️ MONGO: Unexpected error writing batch of {len(operations)} to '{collection_name}': {e}")
+            self._count(collection_name, 'mongo/batches_written')
+        buffers.clear()
+
+    def _count(self, collection_name, key, count=1):
+        with self.counts_lock:
+            self.counts[(collection_name, key)] = self.counts.get((collection_name, key), 0) + count
+
+    def _inc_stat(self, collection_name, key, count=1):
+        stats = self.collection_stats.get(collection_name, self.stats)
+        if stats:
+            stats.inc_value(key, count)
+
+
+# (client class, uri, database, batch settings) -> (client, writer), one per process
+_shared_mongo = {}
+
+
+def shared_mongo(client_class, mongo_uri, mongo_db, batch_size, flush_interval, max_pending):
+    """
+    Returns the process-wide (client, MongoBulkWriter) for a database, creating it on
+    first use. Lets several spiders run in one process share a connection pool and
+    a writer thread; close_shared_mongo() shuts them down once the process is done.
+    """
+    key = (client_class, mongo_uri, mongo_db, batch_size, flush_interval, max_pending)
+    if key not in _shared_mongo:
+        client = client_class(mongo_uri)
+        writer = MongoBulkWriter(client[mongo_db], batch_size=batch_size, flush_interval=flush_interval,
+                                 max_pending=max_pending)
+        writer.start()
+        _shared_mongo[key] = (client, writer)
+    return _shared_mongo[key]
+
+
+def close_shared_mongo():
+    """Flushes and closes every shared writer and client of this process."""
+    while _shared_mongo:
+        _, (client, writer) = _shared_mongo.popitem()
+        writer.close()
+        client.close()
+
 
 class MongoPipeline:
     """
@@ -10,10 +183,38 @@ class MongoPipeline:
     
     Instead of updating existing records, we insert every scrape as a new document.
     This allows for historical price tracking and trend analysis over time.
+
+    In 'buffered' write mode, documents are handed to a MongoBulkWriter and
+    inserted in batches from a background thread instead of one blocking
+    insert_one per item.
+
+    In 'changes' storage mode, a history row is only written when a product's
+    name/price hash differs from the last run. A '<spider>_latest' collection
+    (keyed by URL) holds the current state and seeds that hash index at startup.
+
+    With MONGO_SHARED_WRITER (set by the run-all orchestrator), spiders running in the
+    same process share one client and buffered writer instead of opening their own.
     """
-    def __init__(self, mongo_uri, mongo_db):
+    # Bumped whenever content_hash changes; older 'latest' documents are rehashed on load
+    HASH_VERSION = 2
+
+    def __init__(self, mongo_uri, mongo_db, client_class='pymongo.MongoClient', write_mode='single',
+                 storage_mode='append', batch_size=500, flush_interval=5.0, max_pending=5000, stats=None,
+                 shared=False):
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
+        self.client_class = load_object(client_class)
+        self.write_mode = write_mode
+        self.storage_mode = storage_mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stats = stats
+        self.shared = shared
+        self.writer = None
+        # url -> 8-byte digest of the last stored name/price ('changes' mode only)
+        self.last_seen = {}
+        self.unchanged_urls = set()
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -24,14 +225,28 @@ class MongoPipeline:
         return cls(
             mongo_uri=crawler.settings.get('MONGO_URI'),
             mongo_db=crawler.settings.get('MONGO_DATABASE', 'retailer_data'),
+            # Swap for 'mongomock.MongoClient' to run without a live mongod
+            client_class=crawler.settings.get('MONGO_CLIENT_CLASS', 'pymongo.MongoClient'),
+            write_mode=crawler.settings.get('MONGO_WRITE_MODE', 'single'),
+            storage_mode=crawler.settings.get('MONGO_STORAGE_MODE', 'append'),
+            batch_size=crawler.settings.getint('MONGO_BATCH_SIZE', 500),
+            flush_interval=crawler.settings.getfloat('MONGO_FLUSH_INTERVAL', 5.0),
+            max_pending=crawler.settings.getint('MONGO_MAX_PENDING', 5000),
+            stats=crawler.stats,
+            shared=crawler.settings.getbool('MONGO_SHARED_WRITER', False),
         )
 
     def open_spider(self, spider):
         """
         Initializes the database connection when the spider starts.
         """
-        self.client = pymongo.MongoClient(self.mongo_uri)
+        if self.shared:
+            self.client, self.writer = shared_mongo(self.client_class, self.mongo_uri, self.mongo_db,
+                                                    self.batch_size, self.flush_interval, self.max_pending)
+        else:
+            self.client = self.client_class(self.mongo_uri)
         self.db = self.client[self.mongo_db]
+        self.opened_at = datetime.now(timezone.utc)
 
          # Dynamic collection name based on spider
         self.collection_name = f'{spider.name}_products' 
@@ -40,10 +255,90 @@ class MongoPipeline:
         self.db[self.collection_name].create_index("name")
         logging.info(f"🔗 MONGO: Connected to DB '{self.mongo_db}' -> Collection '{self.collection_name}'")
 
-    def close_spider(self, spider):
+        if self.storage_mode == 'changes':
+            self.latest_collection_name = f'{spider.name}_latest'
+            self.db[self.collection_name].create_index("url")
+            self.load_last_seen()
+
+        if self.shared:
+            self.writer.bind(self.collection_name, self.stats)
+            if self.storage_mode == 'changes':
+                self.writer.bind(self.latest_collection_name, self.stats)
+            logging.info("📦 MONGO: Using the shared process writer")
+        elif self.write_mode == 'buffered':
+            self.writer = MongoBulkWriter(
+                self.db,
+                batch_size=self.batch_size,
+                flush_interval=self.flush_interval,
+                max_pending=self.max_pending,
+                stats=self.stats,
+            )
+            self.writer.start()
+            logging.info(f"📦 MONGO: Buffered writes enabled (batch={self.batch_size}, interval={self.flush_interval}s)")
+
+    def load_last_seen(self):
+        """
+        Builds the in-memory change index from the 'latest' collection.
+        Only the URL and hash are projected, so this stays cheap on large catalogs.
+        Documents hashed by an older content_hash are rehashed from their stored
+        name/price once, so an upgrade doesn't make every product look changed.
+        """
+        latest = self.db[self.latest_collection_name]
+        cursor = latest.find({'hash_version': self.HASH_VERSION}, {'_id': 1, 'hash': 1})
+        self.last_seen = {doc['_id']: bytes(doc['hash']) for doc in cursor if 'hash' in doc}
+
+        outdated = latest.find({'hash_version': {'$ne': self.HASH_VERSION}},
+                               {'_id': 1, 'name': 1, 'price': 1, 'price_cents': 1})
+        migrations = []
+        for doc in outdated:
+            digest = self.last_seen[doc['_id']] = self.content_hash(doc)
+            migrations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'hash': digest, 'hash_version': self.HASH_VERSION}}))
+        for i in range(0, len(migrations), self.batch_size):
+            latest.bulk_write(migrations[i:i + self.batch_size], ordered=False)
+        if migrations:
+            logging.info(f"🗂️ MONGO: Rehashed {len(migrations)} products stored by an older version")
+        if self.stats:
+            self.stats.set_value('mongo/last_seen_loaded', len(self.last_seen))
+        logging.info(f"🗂️ MONGO: Loaded {len(self.last_seen)} known products from '{self.latest_collection_name}'")
+
+    @staticmethod
+    def content_hash(adapter):
+        """Compact digest of the fields whose change is worth a history row (an item or a stored document)."""
+        # Integer cents: documents stored before prices were normalized only have the 'price' string
+        cents = adapter.get('price_cents')
+        if cents is None:
+            cents = parse_price_cents(adapter.get('price'))
+        key = f"{cents}\x1f{adapter.get('name')}"
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+
+    async def write(self, collection_name, operation):
+        if self.writer:
+            await self.writer.submit(collection_name, operation)
+        else:
+            self.db[collection_name].bulk_write([operation])
+
+    async def close_spider(self, spider):
+        # Every pipeline's close_spider runs concurrently; DedupPipeline never clears its index,
+        # so its merges are complete here whichever finishes first
+        dedup = _dedups.get(spider.crawler)
+        if dedup is not None:
+            await self.merge_categories(dedup.category_merges())
+        if self.unchanged_urls:
+            await self.touch_unchanged()
+        if self.shared:
+            # Other spiders keep using the writer: only make sure our writes are flushed
+            await asyncio.to_thread(self.writer.drain)
+            self.writer.publish_stats()
+            self.writer = None
+            return
+        if self.writer:
+            # Final flush happens on the writer thread; wait for it without blocking the reactor
+            await asyncio.to_thread(self.writer.close)
+            self.writer.publish_stats()
+            self.writer = None
         self.client.close()
 
-    def process_item(self, item, spider):
+    async def process_item(self, item, spider):
         adapter = ItemAdapter(item)
         
         # Add timestamp for history tracking
@@ -52,24 +347,206 @@ class MongoPipeline:
         # Add spider name for easier querying
         adapter['spider'] = spider.name
 
+        if self.storage_mode == 'changes':
+            await self.store_if_changed(adapter)
+            return item
+
         # Insert into the specific collection for this spider
-        self.db[self.collection_name].insert_one(adapter.asdict())
+        if self.writer:
+            await self.writer.submit(self.collection_name, InsertOne(adapter.asdict()))
+        else:
+            self.db[self.collection_name].insert_one(adapter.asdict())
         
         return item
 
+    async def store_if_changed(self, adapter):
+        url = adapter.get('url')
+        doc = adapter.asdict()
+        if not url:
+            # Nothing to key on; fall back to plain history
+            await self.write(self.collection_name, InsertOne(doc))
+            return
+
+        digest = self.content_hash(adapter)
+        if self.last_seen.get(url) == digest:
+            # Unchanged: no history row, just remember to bump 'last_seen' in bulk at close
+            self.unchanged_urls.add(url)
+            if self.stats:
+                self.stats.inc_value('mongo/unchanged')
+            return
+
+        self.last_seen[url] = digest
+        if self.stats:
+            self.stats.inc_value('mongo/changed')
+        # Copy before inserting: the driver adds an ObjectId '_id' to inserted documents
+        latest = dict(doc, hash=digest, hash_version=self.HASH_VERSION, last_seen=doc['scraped_at'])
+        await self.write(self.collection_name, InsertOne(doc))
+        await self.write(self.latest_collection_name, UpdateOne({'_id': url}, {'$set': latest}, upsert=True))
+
+    async def merge_categories(self, merges):
+        """Sets the full category list on the documents written this run for products seen in several listings."""
+        count = 0
+        for field, value, categories in merges:
+            update = {'$set': {'categories': categories}}
+            await self.write(self.collection_name, UpdateMany({field: value, 'scraped_at': {'$gte': self.opened_at}}, update))
+            if self.storage_mode == 'changes':
+                await self.write(self.latest_collection_name, UpdateMany({field: value}, update))
+            count += 1
+        if count and self.stats:
+            self.stats.set_value('mongo/categories_merged', count)
+
+    async def touch_unchanged(self):
+        """Marks unchanged products as seen this run with a handful of update_many calls."""
+        now = datetime.now(timezone.utc)
+        urls = list(self.unchanged_urls)
+        for i in range(0, len(urls), self.batch_size):
+            chunk = urls[i:i + self.batch_size]
+            await self.write(self.latest_collection_name, UpdateMany({'_id': {'$in': chunk}}, {'$set': {'last_seen': now}}))
+        self.unchanged_urls = set()
+
+class PriceNormalizationPipeline:
+    """
+    Parses every retailer's price format into integer cents exactly once.
+
+    Spiders reading numeric JSON (Bunnings, Officeworks) set 'price_cents' themselves;
+    for HTML spiders the cleaned 'price' string is parsed here. Downstream stages
+    (QA, Mongo) only ever compare numbers.
+    """
+    def __init__(self, currency, stats=None):
+        self.currency = currency
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get('PRICE_CURRENCY', 'AUD'), crawler.stats)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+
+        if adapter.get('price_cents') is None:
+            cents = parse_price_cents(adapter.get('price'))
+            if cents is not None:
+                adapter['price_cents'] = cents
+            elif adapter.get('price') and self.stats:
+                self.stats.inc_value('price/unparsed')
+
+        if adapter.get('was_price_cents') is None and adapter.get('was_price'):
+            was_cents = parse_price_cents(adapter.get('was_price'))
+            if was_cents is not None:
+                adapter['was_price_cents'] = was_cents
+
+        if adapter.get('was_price_cents') is not None and adapter.get('price_cents') is not None:
+            adapter['on_sale'] = adapter['was_price_cents'] > adapter['price_cents']
+
+        if adapter.get('currency') is None:
+            adapter['currency'] = self.currency
+
+        return item
+
 class QualityAssurancePipeline:
     """
     Enforces Data Contracts to ensure no corrupt or invalid data ever reaches the database.
+    Runs after PriceNormalizationPipeline, so prices are already integer cents.
     """
     def process_item(self, item, spider):
         # Critical Field Check
-        if not item.get('price'):
+        if item.get('price_cents') is None:
             spider.crawler.stats.inc_value('data_quality/missing_price')
             raise DropItem(f"❌ DATA QUALITY: Item {item.get('name')} missing price.")
 
         # Logic Check (Price must be positive)
-        if item['price'] <= 0:
+        if item['price_cents'] <= 0:
             spider.crawler.stats.inc_value('data_quality/invalid_price')
             raise DropItem(f"❌ DATA QUALITY: Item {item.get('name')} has zero/negative price.")
 
-        return item
\ No newline at end of file
+        return item
+
+class DedupPipeline:
+    """
+    Lets each product through once per run.
+
+    Listings overlap (Officeworks brand tiles vs "All phones", Bunnings sub-categories
+    sharing products), so the same product is scraped several times. The first copy
+    continues down the pipeline; later copies are dropped before Mongo, and the
+    categories they were listed under are merged into the first copy's record:
+    MongoPipeline applies the merged lists when it closes (category_merges).
+
+    Runs after QA, so only a copy that passed it marks the product as seen: a first
+    copy dropped for a bad price doesn't cost the product its later, valid copies.
+
+    The index holds an 8-byte digest of each product's key (the first non-empty of
+    DEDUP_KEY_FIELDS) and the ids of its categories, so a large catalog costs a few MB.
+    """
+    def __init__(self, key_fields=('sku', 'url'), stats=None):
+        self.key_fields = tuple(key_fields)
+        self.stats = stats
+        # digest -> category id, frozenset of ids once a product has several, or None
+        self.seen = {}
+        self.category_ids = {}
+        self.categories = []
+        # digest -> (key field, value) of products whose categories grew after they were emitted
+        self.merged = {}
+        self.duplicates = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(crawler.settings.getlist('DEDUP_KEY_FIELDS', ['sku', 'url']), crawler.stats)
+        _dedups[crawler] = pipeline
+        return pipeline
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        for field in self.key_fields:
+            value = adapter.get(field)
+            if value:
+                break
+        else:
+            return item  # Nothing to key on
+
+        digest = hashlib.blake2b(f'{field}\x1f{value}'.encode('utf-8'), digest_size=8).digest()
+        ids = {self._category_id(category) for category in adapter.get('categories') or ()}
+        if digest not in self.seen:
+            self.seen[digest] = self._compact(ids)
+            return item
+
+        self.duplicates += 1
+        known = self._expand(self.seen[digest])
+        if not ids <= known:
+            self.seen[digest] = frozenset(known | ids)
+            self.merged[digest] = (field, value)
+            if self.stats:
+                self.stats.inc_value('dedup/categories_merged')
+        raise DropItem(f"Duplicate product {field}={value}", log_level='DEBUG')
+
+    def close_spider(self, spider):
+        if self.stats:
+            unique = len(self.seen)
+            self.stats.set_value('dedup/unique', unique)
+            self.stats.set_value('dedup/duplicates', self.duplicates)
+            if unique:
+                self.stats.set_value('dedup/ratio', round(self.duplicates / (unique + self.duplicates), 4))
+
+    def category_merges(self):
+        """(key field, value, categories) of every emitted product that picked up more categories."""
+        for digest, (field, value) in self.merged.items():
+            yield field, value, sorted(self.categories[i] for i in self._expand(self.seen[digest]))
+
+    def _category_id(self, category):
+        category_id = self.category_ids.get(category)
+        if category_id is None:
+            category_id = self.category_ids[category] = len(self.categories)
+            self.categories.append(category)
+        return category_id
+
+    @staticmethod
+    def _compact(ids):
+        # Most products sit in one category: a bare int is far smaller than a frozenset
+        if not ids:
+            return None
+        return next(iter(ids)) if len(ids) == 1 else frozenset(ids)
+
+    @staticmethod
+    def _expand(value):
+        if value is None:
+            return frozenset()
+        return value if isinstance(value, frozenset) else frozenset((value,))
@@ -0,0 +1,204 @@
+"""
+Runs every registered spider across a pool of worker processes.
+
+Spiders are bin-packed onto workers by their historical duration (longest first,
+each onto the least loaded worker), so a nightly full refresh takes about as long
+as the slowest retailer rather than the sum of all of them. Each worker runs its
+spiders one after another in a single reactor and shares one Mongo client/writer
+between them (MONGO_SHARED_WRITER). When everything is done, a combined stats
+summary is printed and saved, and the duration history is updated.
+
+Usage: python -m retail_spiders.runall [--workers 3] [spider ...]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from datetime import datetime
+
+from scrapy.spiderloader import SpiderLoader
+from scrapy.utils.project import get_project_settings
+
+# Stats summed across spiders in the combined summary
+SUMMARY_STATS = (
+    'item_scraped_count',
+    'item_dropped_count',
+    'downloader/request_count',
+    'downloader/response_count',
+    'log_count/ERROR',
+    'mongo/documents_written',
+    'mongo/write_errors',
+)
+
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(path, history, results):
+    """Keeps the last few durations of each spider that finished cleanly."""
+    for name, result in results.items():
+        if result.get('finish_reason') == 'finished' and result.get('elapsed_time_seconds'):
+            runs = history.setdefault(name, [])
+            runs.append(round(result['elapsed_time_seconds'], 1))
+            del runs[:-5]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+
+
+def estimate(history, name, default):
+    runs = history.get(name)
+    return sum(runs) / len(runs) if runs else default
+
+
+def plan(spiders, workers, history, default_duration):
+    """
+    Longest-processing-time-first bin packing.
+    Returns one list of spider names per worker (empty workers are dropped).
+    """
+    bins = [[0.0, []] for _ in range(max(1, workers))]
+    for name in sorted(spiders, key=lambda n: estimate(history, n, default_duration), reverse=True):
+        target = min(bins, key=lambda b: b[0])
+        target[0] += estimate(history, name, default_duration)
+        target[1].append(name)
+    return [names for _, names in bins if names]
+
+
+def _run_worker(worker_id, spider_names, settings, results):
+    # Each worker owns its reactor, so everything Twisted is imported after the fork/spawn
+    from scrapy.crawler import AsyncCrawlerRunner
+    from scrapy.settings import Settings
+    from scrapy.utils.defer import deferred_from_coro
+    from scrapy.utils.log import configure_logging
+    from scrapy.utils.reactor import install_reactor
+
+    from retail_spiders.pipelines import close_shared_mongo
+
+    settings = Settings(settings)
+    install_reactor(settings['TWISTED_REACTOR'])
+    from twisted.internet import reactor
+
+    configure_logging(settings)
+    runner = AsyncCrawlerRunner(settings)
+
+    async def crawl_all():
+        for name in spider_names:
+            crawler = runner.create_crawler(name)
+            try:
+                await runner.crawl(crawler)
+            except Exception:
+                logging.exception(f"❌ [RUNALL] Spider '{name}' crashed")
+            stats = crawler.stats.get_stats() if crawler.stats else {}
+            summary = {k: v for k, v in stats.items() if isinstance(v, (int, float))}
+            summary['finish_reason'] = stats.get('finish_reason', 'crashed')
+            results.put((name, worker_id, summary))
+
+    def start():
+        d = deferred_from_coro(crawl_all())
+        d.addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(start)
+    reactor.run()
+    # Last spider is done: flush and close this process's shared Mongo writer
+    close_shared_mongo()
+
+
+def run_all(settings, spiders=None, workers=None):
+    """
+    Runs the given spiders (default: all registered) and returns
+    ({spider: stats summary}, {spider: worker id}, wall time in seconds).
+    """
+    spiders = spiders or SpiderLoader.from_settings(settings).list()
+    workers = workers or settings.getint('RUNALL_WORKERS') or os.cpu_count()
+    history_path = settings.get('RUNALL_HISTORY')
+    history = load_history(history_path)
+    default_duration = settings.getfloat('RUNALL_DEFAULT_DURATION', 1800)
+    bins = plan(spiders, workers, history, default_duration)
+
+    for worker_id, names in enumerate(bins):
+        expected = sum(estimate(history, n, default_duration) for n in names)
+        logging.info(f"📋 [RUNALL] Worker {worker_id}: {', '.join(names)} (~{expected / 60:.0f} min)")
+
+    worker_settings = settings.copy()
+    worker_settings.set('MONGO_SHARED_WRITER', True, priority='cmdline')
+    worker_settings = worker_settings.copy_to_dict()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start = time.monotonic()
+    processes = [ctx.Process(target=_run_worker, args=(i, names, worker_settings, results), name=f'runall-{i}')
+                 for i, names in enumerate(bins)]
+    for process in processes:
+        process.start()
+
+    summaries, assignment = {}, {}
+    expected = sum(len(names) for names in bins)
+    while len(summaries) < expected:
+        try:
+            name, worker_id, summary = results.get(timeout=5)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break  # A worker died; its remaining spiders are reported as missing
+            continue
+        summaries[name] = summary
+        assignment[name] = worker_id
+    for process in processes:
+        process.join()
+    elapsed = time.monotonic() - start
+
+    for name in spiders:
+        summaries.setdefault(name, {'finish_reason': 'missing'})
+    save_history(history_path, history, summaries)
+    return summaries, assignment, elapsed
+
+
+def format_summary(summaries, assignment, elapsed):
+    lines = [f"{'spider':<14} {'worker':>6} {'minutes':>8} {'items':>8} {'pages':>8} {'errors':>7}  finish_reason"]
+    for name, s in sorted(summaries.items()):
+        lines.append(
+            f"{name:<14} {assignment.get(name, '-'):>6} {s.get('elapsed_time_seconds', 0) / 60:>8.1f} "
+            f"{s.get('item_scraped_count', 0):>8} {s.get('downloader/response_count', 0):>8} "
+            f"{s.get('log_count/ERROR', 0):>7}  {s.get('finish_reason')}"
+        )
+    serial = sum(s.get('elapsed_time_seconds', 0) for s in summaries.values())
+    lines.append(f"🏁 Wall time {elapsed / 60:.1f} min vs {serial / 60:.1f} min run one after another")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all retailer spiders across a process pool.')
+    parser.add_argument('spiders', nargs='*', help='Spiders to run (default: all registered)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: RUNALL_WORKERS or CPU count)')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    logging.basicConfig(level=settings.get('LOG_LEVEL'), format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    summaries, assignment, elapsed = run_all(settings, args.spiders, args.workers)
+
+    totals = {key: sum(s.get(key, 0) for s in summaries.values()) for key in SUMMARY_STATS}
+    report = {
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'wall_time_seconds': round(elapsed, 1),
+        'totals': totals,
+        'spiders': {name: dict(s, worker=assignment.get(name)) for name, s in summaries.items()},
+    }
+    summary_path = settings.get('RUNALL_SUMMARY') % {'time': datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}
+    os.makedirs(os.path.dirname(summary_path) or '.', exist_ok=True)
+    with open(summary_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+
+    print(format_summary(summaries, assignment, elapsed))
+    print(f"📊 Totals: {totals}")
+    print(f"💾 Summary saved to {summary_path}")
+
+
+if __name__ == '__main__':
+    main()
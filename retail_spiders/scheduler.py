@@ -0,0 +1,116 @@
+"""
+Memory-bounded scheduler for exploded pagination.
+
+Exploding a listing queues every remaining page at once, so a crawl over many
+sub-categories can hold thousands of pending requests (each with its meta dict)
+in memory. `SpillingScheduler` keeps at most SCHEDULER_MEMORY_WINDOW requests in
+memory and spills the rest to Scrapy's disk queue: JOBDIR/requests.queue when a
+job directory is set, a temporary directory otherwise.
+
+Pagination pages (requests planned by PaginationPlanner) get a priority boost, so
+categories that have started are finished before new ones are opened: items
+keep flowing and the queue stays short instead of holding page 2..N of every
+category at once.
+"""
+import logging
+import shutil
+import tempfile
+
+from scrapy.core.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class SpillingScheduler(Scheduler):
+    """
+    Scrapy's scheduler with a bounded in-memory window in front of the disk queue.
+
+    * Requests go to memory while fewer than SCHEDULER_MEMORY_WINDOW are held there,
+      and spill to disk after that. Requests that can't be serialized stay in memory.
+    * next_request serves whichever queue's next request has the highest priority
+      (memory on ties).
+    * With JOBDIR, the memory window is written to the disk queue on close so a
+      resumed crawl picks it up.
+    * Stats: scheduler/spilled, scheduler/depth/{memory,disk} and their max_ peaks.
+    """
+
+    def __init__(self, dupefilter, jobdir=None, *args, crawler=None, **kwargs):
+        super().__init__(dupefilter, jobdir, *args, crawler=crawler, **kwargs)
+        settings = crawler.settings
+        self.window = settings.getint('SCHEDULER_MEMORY_WINDOW', 2000)
+        self.pagination_priority = settings.getint('SCHEDULER_PAGINATION_PRIORITY', 10)
+        self.persistent = self.dqdir is not None
+        if not self.persistent:
+            # No JOBDIR: spill to a scratch directory removed when the crawl closes
+            self.dqdir = tempfile.mkdtemp(prefix='scheduler-spill-')
+        self.held = None
+
+    def close(self, reason):
+        if self.persistent:
+            if self.held is not None:
+                self._dqpush(self.held)
+                self.held = None
+            moved = 0
+            while (request := self.mqs.pop()) is not None:
+                moved += self._dqpush(request)
+            if moved:
+                logger.info(f"💾 [SCHEDULER] Saved {moved} in-memory requests to {self.dqdir} for resume")
+            return super().close(reason)
+        self.dqs.close()
+        shutil.rmtree(self.dqdir, ignore_errors=True)
+        return self.df.close(reason)
+
+    def enqueue_request(self, request):
+        if not request.dont_filter and self.df.request_seen(request):
+            self.df.log(request, self.spider)
+            return False
+        if self.pagination_priority and request.meta.get('pagination_mode') and not request.meta.get('pagination_boosted'):
+            # Once per request: retries and redirects keep their (already boosted) priority
+            request.priority += self.pagination_priority
+            request.meta['pagination_boosted'] = True
+
+        if len(self.mqs) >= self.window and self._dqpush(request):
+            self.stats.inc_value('scheduler/enqueued/disk')
+            self.stats.inc_value('scheduler/spilled')
+        else:
+            self._mqpush(request)
+            self.stats.inc_value('scheduler/enqueued/memory')
+        self.stats.inc_value('scheduler/enqueued')
+        self._record_depth()
+        return True
+
+    def next_request(self):
+        # The disk queue's next request is held aside (deserialized once) until it
+        # outranks the head of the memory queue
+        if self.held is None and self.dqs:
+            self.held = self._dqpop()
+        if self.held is not None and self._disk_first():
+            request, self.held = self.held, None
+            self.stats.inc_value('scheduler/dequeued/disk')
+        else:
+            request = self.mqs.pop()
+            if request is not None:
+                self.stats.inc_value('scheduler/dequeued/memory')
+        if request is not None:
+            self.stats.inc_value('scheduler/dequeued')
+            self._record_depth()
+        return request
+
+    def _disk_first(self):
+        if not len(self.mqs):
+            return True
+        try:
+            head = self.mqs.peek()
+        except NotImplementedError:  # Memory queue without peek: memory first, like Scrapy's scheduler
+            return False
+        return head is None or self.held.priority > head.priority
+
+    def __len__(self):
+        return super().__len__() + (self.held is not None)
+
+    def _record_depth(self):
+        memory, disk = len(self.mqs), len(self.dqs)
+        self.stats.set_value('scheduler/depth/memory', memory)
+        self.stats.set_value('scheduler/depth/disk', disk)
+        self.stats.max_value('scheduler/depth/max_memory', memory)
+        self.stats.max_value('scheduler/depth/max_disk', disk)
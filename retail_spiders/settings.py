@@ -23,6 +23,18 @@ DOWNLOAD_HANDLERS = {
     "https": "scrapy_impersonate.ImpersonateDownloadHandler",
 }
 
+# Session pool for 'retail_spiders.handlers.CurlCffiDownloadHandler' (when enabled)
+# Sessions are keyed by (impersonation profile, host, proxy) and reused for keep-alive/HTTP2
+CURL_CFFI_SESSION_ISOLATION = 'pooled'  # 'pooled' or 'request' (fresh session per request)
+CURL_CFFI_POOL_SIZE = 16                # Max sessions kept open at once
+CURL_CFFI_MAX_CLIENTS = 16              # Max concurrent transfers per session
+CURL_CFFI_SESSION_IDLE_TIMEOUT = 120    # Close sessions unused for this many seconds
+CURL_CFFI_SESSION_KEEP_COOKIES = False  # Clear the session cookie jar after each response
+# Streaming: read bodies chunk by chunk, cap their size and stop once the needed data has arrived
+CURL_CFFI_STREAMING = True
+CURL_CFFI_MAXSIZE_BY_DOMAIN = {}        # e.g. {'bunnings.com.au': 8 * 1024 * 1024}, others use DOWNLOAD_MAXSIZE
+CURL_CFFI_STOP_MARKERS = {}             # e.g. {'www.bunnings.com.au': ['id="__NEXT_DATA__"', '</script>']}
+
 # =============================================================================
 # 3. CONCURRENCY & POLITENESS
 # =============================================================================
@@ -32,14 +44,72 @@ CONCURRENT_REQUESTS_PER_DOMAIN = 16
 DOWNLOAD_DELAY = 1  # 1s delay to be polite but fast
 COOKIES_ENABLED = False  # Disable to avoid tracking/sessions
 
+# Adaptive Concurrency: AIMD per-domain window driven by p95 latency, 429s and soft bans
+# Treats CONCURRENT_REQUESTS_PER_DOMAIN as a ceiling and DOWNLOAD_DELAY as a starting point
+ADAPTIVE_CONCURRENCY_ENABLED = False
+ADAPTIVE_CONCURRENCY_INTERVAL = 5           # Seconds between adjustments
+ADAPTIVE_CONCURRENCY_START = 2              # Initial window for a new domain
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = CONCURRENT_REQUESTS_PER_DOMAIN
+ADAPTIVE_CONCURRENCY_DECREASE = 0.5         # Window multiplier on congestion
+ADAPTIVE_CONCURRENCY_TARGET_LATENCY = 2.0   # p95 download latency (seconds) considered healthy
+ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE = 0.05  # Share of 429/503/soft-ban responses tolerated
+ADAPTIVE_CONCURRENCY_MIN_SAMPLES = 10       # Responses needed before growing the window
+ADAPTIVE_CONCURRENCY_MIN_DELAY = 0.25
+ADAPTIVE_CONCURRENCY_MAX_DELAY = 10
+ADAPTIVE_CONCURRENCY_BACKOFF_CODES = [429, 503]
+
 # =============================================================================
 # 4. SAFETY & LIMITS (FAIL-SAFES)
 # =============================================================================
 DOWNLOAD_TIMEOUT = 30       # Drop request if proxy hangs for >30s
 CLOSESPIDER_TIMEOUT = 14400 # Hard kill after 4 hours (4 * 3600)
 
-# Circuit Breaker: Stop spider if failure rate exceeds 35%
+# Circuit Breaker: Pause a domain if its failure rate exceeds 35% over a sliding window
 CIRCUIT_BREAKER_THRESHOLD = 0.35 
+CIRCUIT_BREAKER_WINDOW = 300        # Sliding window length (seconds)...
+CIRCUIT_BREAKER_BUCKET = 10         # ...kept in buckets of this many seconds
+CIRCUIT_BREAKER_INTERVAL = 10       # How often the breaker evaluates every domain
+CIRCUIT_BREAKER_MIN_REQUESTS = 50   # Minimum sample in the window before tripping
+CIRCUIT_BREAKER_COOLDOWN = 120      # Seconds a domain stays open before probing (half-open)
+CIRCUIT_BREAKER_PROBES = 5          # Requests let through while half-open
+CIRCUIT_BREAKER_MAX_TRIPS = 5       # Stop the spider after a domain trips this many times
+CIRCUIT_BREAKER_FAILURE_CODES = [403, 429, 500, 502, 503, 504]
+
+# Shared Frontier: run one spider as several worker processes / nodes
+# Usage: python -m retail_spiders.frontier bunnings --workers 4
+FRONTIER_URL = 'sqlite:///.scrapy/frontier/%(name)s.sqlite'  # or 'redis://host:6379/0#%(name)s'
+FRONTIER_BACKENDS = {
+    'sqlite': 'retail_spiders.frontier.SQLiteFrontier',
+    'redis': 'retail_spiders.frontier.RedisFrontier',
+}
+FRONTIER_LEASE_TIMEOUT = 300  # Requests leased by a worker that dies are reissued after this many seconds
+FRONTIER_BATCH_SIZE = 16      # Requests pushed / leased / acknowledged per round-trip
+
+# Scheduler: bounded in-memory queue, overflow spilled to disk (JOBDIR/requests.queue or a temp dir)
+SCHEDULER = 'retail_spiders.scheduler.SpillingScheduler'
+SCHEDULER_MEMORY_WINDOW = 2000        # Requests kept in memory before spilling
+SCHEDULER_PAGINATION_PRIORITY = 10    # Boost for pagination pages: finish started categories first (0 = off)
+
+# Dedup: Bloom filter over request fingerprints (memory-mapped under JOBDIR/requests.bloom when set)
+# JSON POST bodies (Algolia queries) are fingerprinted key-order independently
+DUPEFILTER_CLASS = 'retail_spiders.dupefilter.BloomDupeFilter'
+REQUEST_FINGERPRINTER_CLASS = 'retail_spiders.dupefilter.CanonicalJsonFingerprinter'
+DUPEFILTER_BLOOM_CAPACITY = 1_000_000   # Requests in the first filter; each further one holds twice as many
+DUPEFILTER_BLOOM_ERROR_RATE = 0.001     # Upper bound on the chance of dropping a request never seen
+
+# Extraction: read listings from schema.org JSON-LD/microdata/OpenGraph when the page has it,
+# the spider's card selectors otherwise (ExtractionSpec.extract_listing)
+STRUCTURED_DATA_ENABLED = True
+
+# Parse Pool: listing/search pages are parsed in worker processes instead of on the reactor thread,
+# so one crawl uses every core and downloads keep flowing while big pages parse
+PARSE_POOL_ENABLED = False
+PARSE_POOL_WORKERS = 0                # Worker processes (0 = one per CPU)
+PARSE_POOL_MIN_BYTES = 64 * 1024      # Smaller bodies are parsed inline: shipping them costs more than parsing
+PARSE_POOL_MAX_TASKS_PER_CHILD = 0    # Recycle a worker after this many pages (0 = never)
+# Scrapy stops feeding responses once SCRAPER_SLOT_MAX_ACTIVE_SIZE bytes (5MB) are being parsed:
+# with multi-MB pages raise it to about workers x page size to keep every worker busy
 
 # Persistence: Resume crawls from this directory if stopped
 # Usage: scrapy crawl bunnings -s JOBDIR=crawls/bunnings-1
@@ -49,42 +119,143 @@ JOBDIR = None  # Default to None, override via CLI when needed
 # 5. MIDDLEWARE PIPELINE (THE NETWORK LAYER)
 # =============================================================================
 DOWNLOADER_MIDDLEWARES = {
+    # Acknowledges frontier leases of requests that fail or are dropped (FrontierScheduler only)
+    'retail_spiders.frontier.FrontierMiddleware': 10,
     'retail_spiders.middlewares.SoftBanMiddleware': 550,
+    # Parks requests for domains whose circuit breaker is open; above Retry/SoftBan (550)
+    # so it records every attempt, not just the last retry
+    'retail_spiders.middlewares.CircuitBreakerMiddleware': 555,
+    # Conditional requests + replay of cached output for unchanged pages (after decompression)
+    'retail_spiders.middlewares.PageCacheMiddleware': 560,
 }
 
+# Soft Ban Detection: extra signatures on top of SoftBanMiddleware.BAN_SIGNATURES
+SOFT_BAN_SIGNATURES = []
+SOFT_BAN_DOMAIN_SIGNATURES = {}  # e.g. {'bunnings.com.au': ['px-captcha']}
+SOFT_BAN_SCAN_WINDOW = 0         # Only scan the first/last N bytes of the body (0 = whole body)
+
 SPIDER_MIDDLEWARES = {
+   # Acknowledges frontier leases once a callback has finished (FrontierScheduler only)
+   'retail_spiders.frontier.FrontierSpiderMiddleware': 10,
    # Lifecycle monitoring (Logs start/stop stats)
    'retail_spiders.middlewares.RetailSpidersSpiderMiddleware': 500,
+   # Records callback output for the page cache (closest to the spider)
+   'retail_spiders.middlewares.PageCacheSpiderMiddleware': 950,
+   # Times each callback for TimingExtension (closer to the spider than anything else)
+   'retail_spiders.middlewares.TimingSpiderMiddleware': 990,
 }
 
 EXTENSIONS = {
-    # Monitors error rates and kills job if too high
+    # Monitors per-domain error rates and pauses failing domains
     'retail_spiders.extensions.CircuitBreakerExtension': 500,
+    # Tunes per-domain concurrency/delay (enable with ADAPTIVE_CONCURRENCY_ENABLED)
+    'retail_spiders.extensions.AdaptiveConcurrencyExtension': 510,
+    # Persistent page cache shared by the PageCache middlewares (enable with PAGE_CACHE_ENABLED)
+    'retail_spiders.extensions.PageCacheExtension': 520,
+    # Records raw responses for offline re-extraction (enable with ARCHIVE_ENABLED)
+    'retail_spiders.extensions.ResponseArchiveExtension': 530,
+    # Latency histograms for downloads, callbacks, middlewares and pipelines
+    'retail_spiders.extensions.TimingExtension': 540,
+    # Worker processes for CPU-heavy parsing (enable with PARSE_POOL_ENABLED)
+    'retail_spiders.parsepool.ParsePool': 550,
+    # Feed exports with size-based rotation (FEED_EXPORT_BATCH_MAX_BYTES)
+    'scrapy.extensions.feedexport.FeedExporter': None,
+    'retail_spiders.feeds.RotatingFeedExporter': 0,
 }
 
+# Page Cache: skip re-parsing listing pages that did not change since the last run
+# Stores ETag/Last-Modified, a body hash and the callback output per request fingerprint
+PAGE_CACHE_ENABLED = False
+PAGE_CACHE_DIR = 'page_cache'             # Under the project's .scrapy data dir, one SQLite file per spider
+PAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # LRU eviction once cached output exceeds this
+
+# Response Archive: keep every raw response so selectors can be fixed without a recrawl
+# Replay: python -m retail_spiders.archive bunnings archive/bunnings/<time> --workers 4
+ARCHIVE_ENABLED = False
+ARCHIVE_URI = 'archive/%(name)s/%(time)s'      # One directory per run
+ARCHIVE_SEGMENT_BYTES = 256 * 1024 * 1024      # Start a new segment file after this many bytes
+ARCHIVE_COMPRESSION_LEVEL = 6                  # gzip level of each record
+ARCHIVE_MAX_PENDING = 1000                     # Responses queued for the writer thread before downloads pause
+
+# Hot-path Timing: histograms in stats (timing/<stage>/<name>/p50|p95|p99|...) and Prometheus text
+TIMING_ENABLED = True
+TIMING_STATS_INTERVAL = 30                # Seconds between stats summaries
+TIMING_PROMETHEUS_ENABLED = True          # Serve /metrics while the crawl runs
+TIMING_PROMETHEUS_HOST = '127.0.0.1'
+TIMING_PROMETHEUS_PORT = [9410, 9450]     # First free port in this range (one per running crawl)
+
 # =============================================================================
 # 6. DATA PIPELINE (THE PROCESSING LAYER)
 # =============================================================================
 ITEM_PIPELINES = {
+   # Parses prices into integer cents (+ currency / sale flags)
+   'retail_spiders.pipelines.PriceNormalizationPipeline': 100,
+
    # Validates price/integrity
    'retail_spiders.pipelines.QualityAssurancePipeline': 200,
-   
+
+   # Drops products already seen this run, merging their categories (after QA: only valid copies count)
+   'retail_spiders.pipelines.DedupPipeline': 250,
+
    # Saves to MongoDB
    'retail_spiders.pipelines.MongoPipeline': 300,
 }
 
+PRICE_CURRENCY = 'AUD'  # Currency assigned to normalized prices
+DEDUP_KEY_FIELDS = ['sku', 'url']  # A product's identity within a run: the first of these it has
+
 # MongoDB Config (Loaded from Env)
 MONGO_URI = os.getenv('MONGO_URI')
 MONGO_DATABASE = os.getenv('MONGO_DATABASE', 'shopgrok_test')
+MONGO_CLIENT_CLASS = os.getenv('MONGO_CLIENT_CLASS', 'pymongo.MongoClient')  # e.g. 'mongomock.MongoClient' for local runs
+
+# Buffered writes: batch inserts on a background thread instead of insert_one per item
+MONGO_WRITE_MODE = 'buffered'  # 'buffered' or 'single'
+MONGO_BATCH_SIZE = 500         # Flush once this many documents are buffered...
+MONGO_FLUSH_INTERVAL = 5.0     # ...or after this many seconds, whichever comes first
+MONGO_MAX_PENDING = 5000       # Bounded queue: the crawl waits when Mongo falls behind
+
+MONGO_SHARED_WRITER = False    # One client + writer per process for all its spiders (set by runall)
+
+# Storage: 'append' inserts every scrape; 'changes' only writes history when name/price moved
+# and keeps '<spider>_latest' up to date via bulk upserts
+MONGO_STORAGE_MODE = 'append'
+
+# Run-All Orchestrator: python -m retail_spiders.runall
+RUNALL_WORKERS = 0                            # Worker processes (0 = CPU count)
+RUNALL_DEFAULT_DURATION = 1800                # Seconds assumed for spiders without history
+RUNALL_HISTORY = '.scrapy/runall_history.json'  # Recent durations used for bin-packing
+RUNALL_SUMMARY = 'data/runall_%(time)s.json'  # Combined stats of each run
 
 # =============================================================================
 # 7. EXPORTS & ARTIFACTS
 # =============================================================================
-# Save a local JSONL backup automatically for every run
+# Save a local gzipped JSONL backup automatically for every run
+# Large runs are split into files of at most FEED_EXPORT_BATCH_MAX_BYTES (compressed)
 FEEDS = {
-    'data/%(name)s_%(time)s.jsonl': {  # Added timestamp to filename
+    'data/%(name)s_%(time)s_%(batch_id)03d.jsonl.gz': {  # Added timestamp to filename
         'format': 'jsonlines',
-        'encoding': 'utf8', 
-        'overwrite': True
-    }
-}
\ No newline at end of file
+        'encoding': 'utf8',
+        'overwrite': True,
+        'postprocessing': ['scrapy.extensions.postprocessing.GzipPlugin'],
+        'gzip_compresslevel': 6,  # Level 9 costs ~3x the CPU for ~2% smaller files
+    },
+    # zstd instead of gzip (pip install zstandard):
+    # 'data/%(name)s_%(time)s_%(batch_id)03d.jsonl.zst': {
+    #     'format': 'jsonlines',
+    #     'postprocessing': ['retail_spiders.feeds.ZstdPlugin'],
+    #     'zstd_level': 3,
+    # },
+    # Typed columns for analysis tools (pip install pyarrow):
+    # 'data/%(name)s_%(time)s_%(batch_id)03d.parquet': {
+    #     'format': 'parquet',
+    #     'item_export_kwargs': {'batch_size': 10000, 'compression': 'zstd'},
+    # },
+}
+FEED_EXPORT_BATCH_MAX_BYTES = 256 * 1024 * 1024  # Start a new file past this size (0 = one file per run)
+
+# Parquet: one row group per batch_size items; Arrow: IPC (Feather v2) file
+FEED_EXPORTERS = {
+    'parquet': 'retail_spiders.feeds.ParquetItemExporter',
+    'arrow': 'retail_spiders.feeds.ArrowItemExporter',
+}
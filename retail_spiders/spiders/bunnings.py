@@ -1,8 +1,10 @@
 import math
-from scrapy.loader import ItemLoader
-from retail_spiders.items import ProductItem
+from retail_spiders.extraction import ExtractionSpec, Field
+from retail_spiders.items import ProductItem, parse_price_cents, remove_currency_symbol
+from retail_spiders.hydration import FlightPayload, HydrationState
+from retail_spiders.pagination import PaginationPlanner
+from retail_spiders.parsepool import offload
 import scrapy
-import json
 
 class BunningsSpider(scrapy.Spider):
     name = "impersonate"
@@ -13,6 +15,18 @@ class BunningsSpider(scrapy.Spider):
         'IMPERSONATE': 'firefox135',  # Use the latest Firefox profile for impersonation
     }
 
+    pagination = PaginationPlanner(page_param='page')
+
+    # Compiled once: maps a raw search result to a ProductItem
+    spec = ExtractionSpec(ProductItem, {
+        'name': Field(path=('title',)),
+        'price': Field(path=('price',), convert=lambda price: remove_currency_symbol(str(price)), default='0'),
+        # Price arrives as a JSON number (dollars), so cents are derived straight from it
+        'price_cents': Field(path=('price',), convert=parse_price_cents),
+        'url': Field(path=('productroutingurl',), urljoin=True, default=''),
+        'retailer': Field(value='Bunnings'),
+    })
+
     async def start(self):
         """        
         Initiates the crawl at a high-level category page (Garden).
@@ -23,13 +37,11 @@ class BunningsSpider(scrapy.Spider):
                              meta={'impersonate': self.custom_settings['IMPERSONATE'], 'page': 1})
     
     def get_next_data(self, response):
-        """Helper to safely extract the __NEXT_DATA__ blob."""
-        # Extract the hydration state (Raw JSON)
-        raw_json = response.xpath('//script[@id="__NEXT_DATA__"]/text()').get()
-        if not raw_json:
+        """Helper to safely extract the __NEXT_DATA__ blob (or its App Router equivalent)."""
+        state = next_data(response)
+        if state is None:
             self.logger.error(f"Missing __NEXT_DATA__ on {response.url}")
-            return None
-        return json.loads(raw_json)
+        return state
     
     def get_sub_categories(self, response):
         """   
@@ -38,9 +50,10 @@ class BunningsSpider(scrapy.Spider):
         hardcoding URLs.
         """
         data = self.get_next_data(response)
+        if not data: return
         # Navigate JSON Path
         try:
-            root_categories_levels = data['props']['pageProps']['initialState']['global']['globalData']['navigation']['levels']
+            root_categories_levels = data.get('props', 'pageProps', 'initialState', 'global', 'globalData', 'navigation', 'levels')
         except KeyError:
             self.logger.error(f"Failed to extract navigation levels from __NEXT_DATA__ on {response.url}")
             return
@@ -57,56 +70,69 @@ class BunningsSpider(scrapy.Spider):
                                          callback=self.parse, 
                                          meta={'impersonate': self.custom_settings['IMPERSONATE'], 'page': 1, 'category': sub_category['displayName']})
 
-    def parse(self, response):
+    async def parse(self, response):
         """        
         This method handles both extracting products from the current page's JSON
         and calculating if further pages need to be crawled.
         """
-        data = self.get_next_data(response)
-        if not data: return
-        try:
-            # Locate search results
-            props = data['props']['pageProps']['initialState']['global']
-            search_data = props['searchResults']['data']
-            product_data = search_data['results']
-            
-            # Pagination Logic
-            total_count = search_data['totalCount']
-            items_per_page = int(props['globalData']['globalConfigData']['searchConfig']['global']['numberOfSearchResults'])
-            total_pages = math.ceil(total_count / items_per_page)
-        except KeyError:
-             return self.logger.error("JSON structure changed for Search Results")
-        
-        self.logger.info(f"{response.meta.get('category')} - Page {response.meta['page']}/{total_pages} - {total_count} items")
+        category = response.meta.get('category')
+        # Decoding multi-MB states runs in the parse pool when enabled (PARSE_POOL_ENABLED)
+        page = await offload(self.crawler, extract_search_page, response, category)
+        if 'error' in page:
+            self.logger.error(page['error'])
+            return
+        total_pages = page['total_pages']
 
-        for product in product_data:
-            yield self.parse_product(product['raw'], response)
+        self.logger.info(f"{category} - Page {response.meta['page']}/{total_pages} - {page['total_count']} items")
+
+        for values in page['items']:
+            yield ProductItem(values)
         
         current_page = response.meta.get('page', 1)
         # If we are on Page 1, we calculate ALL future pages and fire requests immediately
         if current_page == 1:
             self.logger.info(f"Exploding pagination: Generating requests for {total_pages-1} pages.")
 
-            base_url = response.url.split('?')[0]
-            for page in range(2, total_pages + 1):
-                # Reconstruct URL for specific page
-                next_url = f"{base_url}?page={page}"
-                
-                yield scrapy.Request(next_url, 
-                                     callback=self.parse, 
-                                     meta={'impersonate': self.custom_settings['IMPERSONATE'], 'page': page, 'category': response.meta.get('category')}
-                                     )
-                                     
-    
-    def parse_product(self, product, response):
-        """
-        Helper method to map raw JSON product data to the Scrapy Item.
-        """
-        l = ItemLoader(item=ProductItem())
-        l.add_value('name', product.get('title', ''))
-        l.add_value('price', '$' + str(product.get('price', 0)))
-        l.add_value('url', response.urljoin(product.get('productroutingurl', '')))
-        l.add_value('retailer', 'Bunnings')
-        return l.load_item()
+        for request in self.pagination.plan(
+            response, self.parse, self.crawler.stats, category,
+            meta={'impersonate': self.custom_settings['IMPERSONATE'], 'category': category},
+            total_pages=total_pages,
+            items_on_page=len(page['items']),
+        ):
+            yield request
+
+
+def next_data(response):
+    """The page's __NEXT_DATA__ state (or its App Router equivalent), None when absent."""
+    # Locate the hydration state by byte search (no DOM is built) and decode lazily
+    state = HydrationState.from_response(response, '__NEXT_DATA__')
+    if state is None:
+        # App Router pages stream the same state as React Flight chunks
+        state = FlightPayload.from_response(response)
+    return state
+
+
+def extract_search_page(response, stats, category=None):
+    """
+    Pure extraction of one search results page (safe to run in a parse pool worker):
+    the products as plain dicts and the result counts, or an 'error' message.
+    """
+    data = next_data(response)
+    if data is None:
+        return {'error': f"Missing __NEXT_DATA__ on {response.url}"}
+    try:
+        # Locate search results (only this subtree is decoded, not the whole state)
+        props = ('props', 'pageProps', 'initialState', 'global')
+        search_data = data.get(*props, 'searchResults', 'data')
+        product_data = search_data['results']
+        
+        # Pagination Logic
+        total_count = search_data['totalCount']
+        items_per_page = int(data.get(*props, 'globalData', 'globalConfigData', 'searchConfig', 'global', 'numberOfSearchResults'))
+        total_pages = math.ceil(total_count / items_per_page)
+    except KeyError:
+        return {'error': "JSON structure changed for Search Results"}
 
-        
\ No newline at end of file
+    items = BunningsSpider.spec.extract_records([product['raw'] for product in product_data], response,
+                                                values={'categories': [category]} if category else None)
+    return {'items': [dict(item) for item in items], 'total_count': total_count, 'total_pages': total_pages}
@@ -1,6 +1,6 @@
 from urllib.parse import urlencode, urlparse
-from scrapy.loader import ItemLoader
-from retail_spiders.items import ProductItem
+from retail_spiders.extraction import ExtractionSpec, Field
+from retail_spiders.items import ProductItem, format_cents, to_cents
 import scrapy
 import json
 
@@ -21,9 +21,23 @@ class OfficeworksSpider(scrapy.Spider):
             'x-algolia-agent': ALGOLIA_AGENT,
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         },
+        # Number of (category, page) queries packed into one Algolia multi-query POST
+        'ALGOLIA_BATCH_SIZE': 5,
     }
 
     INDEX_NAME = "prod-product-wc-bestmatch-personal" 
+
+    # Compiled once: maps an Algolia hit to a ProductItem
+    spec = ExtractionSpec(ProductItem, {
+        'retailer': Field(value='Officeworks'),
+        'name': Field(path=('name',)),
+        # Algolia already returns cents (sometimes as a float): validate them, format dollars without a float round-trip
+        'price_cents': Field(path=('price',), convert=to_cents),
+        'price': Field(path=('price',), convert=format_cents, default='0.00'),
+        'url': Field(path=('urlKeyword',), convert=lambda slug: f"https://www.officeworks.com.au/shop/officeworks/p/{slug}"),
+        # Algolia objectID is the product code, shared by every listing the product appears in
+        'sku': Field(path=('objectID',), convert=str),
+    })
     
     """Phase 0: Navigate to the main category page (Mobile Phones) to find all brand tiles"""
     async def start(self):
@@ -84,53 +98,59 @@ class OfficeworksSpider(scrapy.Spider):
              self.logger.info(f"No 'phones' sub-tile found. Using base: {base_seo_path}")
 
         # Switch to API Mode
-        yield self.create_algolia_request(final_seo_path, page=0)
+        yield self.create_algolia_request([(final_seo_path, 0)])
 
-    def create_algolia_request(self, seo_path, page):
-        """Helper to build the complex Algolia POST request."""
+    def create_algolia_request(self, queries):
+        """
+        Helper to build the complex Algolia POST request.
+        The multi-query endpoint accepts a 'requests' array, so several
+        (seo_path, page) queries travel in one round-trip.
+        """
         url = f"https://{self.ALGOLIA_APP_ID}-dsn.algolia.net/1/indexes/*/queries"
         
-        params = {
-            "hitsPerPage": "100", 
-            "page": str(page),
-            "filters": f'categorySeoPaths:"{seo_path}"'
-        }
+        requests = []
+        for seo_path, page in queries:
+            params = {
+                "hitsPerPage": "100", 
+                "page": str(page),
+                "filters": f'categorySeoPaths:"{seo_path}"'
+            }
+            requests.append({"indexName": self.INDEX_NAME, "params": urlencode(params)})
         
-        payload = {"requests": [{"indexName": self.INDEX_NAME, "params": urlencode(params)}]}
+        payload = {"requests": requests}
         return scrapy.Request(
             url,
             method="POST",
             body=json.dumps(payload),
             callback=self.parse_api,
-            meta={'seo_path': seo_path, 'page': page}
+            meta={'queries': queries}
         )
     
     def parse_api(self, response):
         """
-        Process API Response and paginate if needed
+        Process API Response and fan out the remaining pages if needed
         """
         data= json.loads(response.body)
-        # Algolia returns a list of results (one per request). We sent 1 request.
-        try:
-            results = data.get("results", [])[0]
-        except IndexError:
+        # Algolia returns a list of results, one per query in the same order we sent them.
+        results_list = data.get("results", [])
+        queries = response.meta.get('queries', [])
+        if not results_list:
             return self.logger.error("Empty results list from Algolia")
 
-        hits = results.get('hits', [])
-        current_page = response.meta.get('page', 0)
-        nb_pages = results.get('nbPages', 0)
+        remaining_pages = []
+        for (seo_path, current_page), results in zip(queries, results_list):
+            hits = results.get('hits', [])
+            nb_pages = results.get('nbPages', 0)
+            self.logger.info(f"API ({seo_path} | Pg {current_page}): Found {len(hits)} items")
 
-        seo_path = response.meta.get('seo_path', 'unknown-category')
-        self.logger.info(f"API ({seo_path} | Pg {current_page}): Found {len(hits)} items")
+            yield from self.spec.extract_records(hits, response, values={'categories': [seo_path]})
 
-        for hit in hits:
-            l = ItemLoader(item=ProductItem())
-            l.add_value('retailer', 'Officeworks')
-            l.add_value('name', hit.get('name'))
-            l.add_value('price', str(hit.get('price', 0) / 100)) # Convert cents to dollars
-            l.add_value('url', f"https://www.officeworks.com.au/shop/officeworks/p/{hit.get('urlKeyword')}")
-            yield l.load_item()
+            # Once page 0 tells us nbPages, queue every remaining page at once
+            if current_page == 0:
+                remaining_pages.extend((seo_path, page) for page in range(1, nb_pages))
 
-        # Recursively fetch next pages
-        if (current_page + 1) < nb_pages:
-            yield self.create_algolia_request(seo_path, current_page + 1)
\ No newline at end of file
+        if remaining_pages:
+            batch_size = self.settings.getint('ALGOLIA_BATCH_SIZE', 5)
+            self.logger.info(f"Fanning out {len(remaining_pages)} pages in batches of {batch_size}")
+            for i in range(0, len(remaining_pages), batch_size):
+                yield self.create_algolia_request(remaining_pages[i:i + batch_size])
@@ -1,6 +1,7 @@
 import scrapy
-from scrapy.loader import ItemLoader
-from retail_spiders.items import ProductItem
+from retail_spiders.extraction import ExtractionSpec, Field
+from retail_spiders.items import ProductItem, remove_currency_symbol
+from retail_spiders.parsepool import offload
 
 class PLEComputers(scrapy.Spider):
     name = "ple"
@@ -13,6 +14,17 @@ class PLEComputers(scrapy.Spider):
         'IMPERSONATE': 'firefox135',  # Use the latest Firefox profile for impersonation
     }
 
+    # Compiled once: the product tiles of a category grid and how to read each field
+    spec = ExtractionSpec(ProductItem, cards_css='div.itemGrid2TileStandard', fields={
+        # Name: Inside the description div -> anchor tag
+        'name': Field(css='div.itemGrid2TileStandardDescription a::text'),
+        # Price: Directly inside the price div
+        'price': Field(css='div.itemGrid2TileStandardPrice::text', convert=remove_currency_symbol),
+        # URL: Extracted from the href of the description link, made absolute
+        'url': Field(css='div.itemGrid2TileStandardDescription a::attr(href)', urljoin=True),
+        'retailer': Field(value='PLE Computers'), # Static value since we know the retailer
+    })
+
     async def start(self):
         """
         Initiates the crawl at the 'All Categories' hub page. This approach ensures 
@@ -44,32 +56,23 @@ class PLEComputers(scrapy.Spider):
                 meta={'impersonate': self.custom_settings['IMPERSONATE']}
             )
     
-    def parse_category(self, response):
+    async def parse_category(self, response):
         """
         Parses a specific category page to extract product details using CSS selectors.
         """
         self.logger.info(f"Scanning PLE: {response.url}")
 
-        # Locate the specific product tiles in the grid
-        products = response.css('div.itemGrid2TileStandard ')
+        # Parsing runs in the parse pool when enabled (PARSE_POOL_ENABLED), inline otherwise
+        items = await offload(self.crawler, extract_category_page, response,
+                              self.settings.getbool('STRUCTURED_DATA_ENABLED', True))
 
-        self.logger.info(f"Found {len(products)} products.")
+        self.logger.info(f"Found {len(items)} products.")
 
-        for card in products:
-            l = ItemLoader(item=ProductItem(), selector=card)
-            # Name: Inside the description div -> anchor tag
-            l.add_css('name', 'div.itemGrid2TileStandardDescription a::text') 
-            # Price: Directly inside the price div
-            l.add_css('price', 'div.itemGrid2TileStandardPrice::text')
-            # URL: Extracted from the href of the description link
-            l.add_css('url', 'div.itemGrid2TileStandardDescription a::attr(href)')
+        for values in items:
+            yield ProductItem(values)
 
-            l.add_value('retailer', 'PLE Computers') # Static value since we know the retailer
-            
-            # Handle URL joining
-            item = l.load_item()
-            if 'url' in item:
-                # Convert relative path (/products/...) to absolute URL (https://ple.com.au/...)
-                item['url'] = response.urljoin(item['url'])
 
-            yield item
\ No newline at end of file
+def extract_category_page(response, stats, structured=True):
+    """Pure extraction of one category grid (safe to run in a parse pool worker), as plain dicts."""
+    # Extract every product in one pass: schema.org data when the page has it, else the grid tiles
+    return [dict(item) for item in PLEComputers.spec.extract_listing(response, None, stats, structured)]
@@ -1,5 +1,7 @@
-from scrapy.loader import ItemLoader
-from retail_spiders.items import ProductItem
+from retail_spiders.extraction import ExtractionSpec, Field
+from retail_spiders.items import ProductItem, remove_currency_symbol
+from retail_spiders.pagination import PaginationPlanner, max_page_number
+from retail_spiders.parsepool import offload
 import scrapy
 
 class ScaSpider(scrapy.Spider):
@@ -13,16 +15,31 @@ class ScaSpider(scrapy.Spider):
         'IMPERSONATE': 'firefox135',  # Use the latest Firefox profile for impersonation
     }
 
+    # Salesforce Commerce Cloud paginates with an item offset ('start') and page size ('sz')
+    pagination = PaginationPlanner(page_param='start', size_param='sz', max_page_size=120, offset=True)
+
+    # Compiled once: the product tiles of a listing and how to read each field
+    spec = ExtractionSpec(ProductItem, cards='//li[contains(@class, "grid-tile")]', fields={
+        # Name: Found in <div class="product-name">
+        # Clean the title by removing "Go to Product: " prefix if it exists.
+        'name': Field(xpath='.//div[@class="product-name"]/a/@title', convert=lambda title: title.replace("Go to Product: ", "")),
+        # Price: Found in <span class="the-price">
+        'price': Field(xpath='.//span[@class="the-price"]/text()', convert=remove_currency_symbol),
+        # URL: Find the link in the product-name div, made absolute
+        'url': Field(xpath='.//div[@class="product-name"]/a/@href', urljoin=True),
+        'retailer': Field(value='Supercheap Auto'),
+    })
+
     async def start(self):
         """
         We target the 4wd Recovery category page directly to find all products. 
         :param self: Description
         """
         # We start at the main PC Parts hub to find all sub-categories.
-        url = "https://www.supercheapauto.com.au/4wd-recovery?sz=60"
-        yield scrapy.Request(url, callback=self.parse_category, meta={'impersonate': self.custom_settings['IMPERSONATE']})
+        url = self.pagination.with_page_size("https://www.supercheapauto.com.au/4wd-recovery")
+        yield scrapy.Request(url, callback=self.parse_category, meta={'impersonate': self.custom_settings['IMPERSONATE'], 'category': '4WD Recovery'})
 
-    def parse_category(self, response):
+    async def parse_category(self, response):
         """
         This handles both extracting product data 
         and determining if there are more pages to crawl.
@@ -34,36 +51,41 @@ class ScaSpider(scrapy.Spider):
         # category = response.meta.get('category', 'Unknown')
         # self.logger.info(f"Scanning Category: {category} | URL: {response.url}")
         
-        # Find all product tiles
-        product_links = response.xpath('//li[contains(@class, "grid-tile")]')
-        if not product_links:
+        # Parsing runs in the parse pool when enabled (PARSE_POOL_ENABLED), inline otherwise
+        category = response.meta.get('category', 'Unknown')
+        page = await offload(self.crawler, extract_category_page, response, category,
+                             self.settings.getbool('STRUCTURED_DATA_ENABLED', True))
+        items = page['items']
+        if not items:
              self.logger.warning(f"No products found. Check selectors.")
 
-        self.logger.info(f"Found {len(product_links)} products.")
-        
-        for card in product_links:
-            l = ItemLoader(item=ProductItem(), selector=card)
-            
-            # Name: Found in <div class="product-name">
-            # Clean the title by removing "Go to Product: " prefix if it exists.
-            title = card.xpath('.//div[@class="product-name"]/a/@title').get()
-            title = title.replace("Go to Product: ", "") if title else None
-            l.add_value('name', title)
-            # Price: Found in <span class="the-price">
-            l.add_xpath('price', './/span[@class="the-price"]/text()')
-            # URL: Find the link in the product-name div
-            l.add_xpath('url', './/div[@class="product-name"]/a/@href')
-            l.add_value('retailer', 'Supercheap Auto')
-            
-            # Handle URL joining
-            item = l.load_item()
-            if 'url' in item:
-                item['url'] = response.urljoin(item['url'])
-                
-            yield item
+        self.logger.info(f"Found {len(items)} products.")
         
+        for values in items:
+            yield ProductItem(values)
+
+        # Explode all pages from page 1, or fall back to following 'page-next'
+        for request in self.pagination.plan(
+            response, self.parse_category, self.crawler.stats, category,
+            meta={'impersonate': self.custom_settings['IMPERSONATE'], 'category': category},
+            total_pages=page['total_pages'],
+            items_on_page=len(items),
+            next_page=page['next_page'],
+        ):
+            yield request
+
+
+def extract_category_page(response, stats, category, structured=True):
+    """
+    Pure extraction of one listing page (safe to run in a parse pool worker):
+    the products as plain dicts and the pagination bar's hints.
+    """
+    # Extract all products in one pass: schema.org data when the page has it, else the tiles
+    items = ScaSpider.spec.extract_listing(response, {'categories': [category]}, stats, structured)
+    return {
+        'items': [dict(item) for item in items],
         # Looks for next page link in the pagination bar using page-next a class
-        next_page = response.xpath('//a[@class="page-next"]/@href').get()
-        if next_page:
-             # Recursive call to scrape the next page.
-             yield response.follow(next_page, callback=self.parse_category, meta=response.meta)
+        'next_page': response.xpath('//a[@class="page-next"]/@href').get(),
+        # The highest numbered link in the pagination bar is the page count
+        'total_pages': max_page_number(response.xpath('//a[@class="page-next"]/ancestor::ul[1]//a/text()').getall()),
+    }
@@ -1,5 +1,7 @@
-from scrapy.loader import ItemLoader
-from retail_spiders.items import ProductItem
+from retail_spiders.extraction import ExtractionSpec, Field
+from retail_spiders.items import ProductItem, remove_currency_symbol
+from retail_spiders.pagination import PaginationPlanner, max_page_number
+from retail_spiders.parsepool import offload
 import scrapy
 
 class UmartSpider(scrapy.Spider):
@@ -12,6 +14,20 @@ class UmartSpider(scrapy.Spider):
         'DOWNLOAD_DELAY': 1.5,
     }
 
+    # Ask for big pages and explode the rest once page 1 shows the page count
+    pagination = PaginationPlanner(page_param='page', size_param='pagesize', max_page_size=100)
+
+    # Compiled once: the product tiles of a listing and how to read each field
+    spec = ExtractionSpec(ProductItem, cards='//li[contains(@class, "goods_info")]', fields={
+        # Name: Found in <span itemprop="name">
+        'name': Field(xpath='.//span[@itemprop="name"]/text()'),
+        # Price: Found in <span itemprop="price">
+        'price': Field(xpath='.//span[@itemprop="price"]/text()', convert=remove_currency_symbol),
+        # URL: Find the link in the goods_name div, made absolute
+        'url': Field(xpath='.//div[@class="goods_name"]/a/@href', urljoin=True),
+        'retailer': Field(value='Umart'),
+    })
+
     async def start(self):
         """
         We target the main 'Computer Parts' hub page rather than individual categories.
@@ -42,11 +58,11 @@ class UmartSpider(scrapy.Spider):
             self.logger.info(f"Found Category: {category_name} | URL: {url}")
             if url:
                 # Use response.urljoin to ensure the domain is attached.
-                url = response.urljoin(url) + '?mystock=1-7-6&sort=salenum&order=ASC&pagesize=3'
+                url = self.pagination.with_page_size(response.urljoin(url) + '?mystock=1-7-6&sort=salenum&order=ASC')
                 # Pass the category name down to the next parser
                 yield response.follow(url, callback=self.parse_category, meta={'category': category_name})
 
-    def parse_category(self, response):
+    async def parse_category(self, response):
         """
         This handles both extracting product data 
         and determining if there are more pages to crawl.
@@ -58,33 +74,40 @@ class UmartSpider(scrapy.Spider):
         category = response.meta.get('category', 'Unknown')
         self.logger.info(f"Scanning Category: {category} | URL: {response.url}")
         
-        # Find all product tiles
-        product_links = response.xpath('//li[contains(@class, "goods_info")]')
-        if not product_links:
+        # Parsing runs in the parse pool when enabled (PARSE_POOL_ENABLED), inline otherwise
+        page = await offload(self.crawler, extract_category_page, response, category,
+                             self.settings.getbool('STRUCTURED_DATA_ENABLED', True))
+        items = page['items']
+        if not items:
              self.logger.warning(f"No products found for {category}. Check selectors.")
 
-        self.logger.info(f"Found {len(product_links)} products.")
-        
-        for card in product_links:
-            l = ItemLoader(item=ProductItem(), selector=card)
-            
-            # Name: Found in <span itemprop="name">
-            l.add_xpath('name', './/span[@itemprop="name"]/text()') 
-            # Price: Found in <span itemprop="price">
-            l.add_xpath('price', './/span[@itemprop="price"]/text()')
-            # URL: Find the link in the goods_name div
-            l.add_xpath('url', './/div[@class="goods_name"]/a/@href')
-            l.add_value('retailer', 'Umart')
-            
-            # Handle URL joining
-            item = l.load_item()
-            if 'url' in item:
-                item['url'] = response.urljoin(item['url'])
-                
-            yield item
+        self.logger.info(f"Found {len(items)} products.")
         
+        for values in items:
+            yield ProductItem(values)
+
+        # Explode all pages from page 1, or fall back to following '>'
+        for request in self.pagination.plan(
+            response, self.parse_category, self.crawler.stats, category,
+            meta={'category': category},
+            total_pages=page['total_pages'],
+            items_on_page=len(items),
+            next_page=page['next_page'],
+        ):
+            yield request
+
+
+def extract_category_page(response, stats, category, structured=True):
+    """
+    Pure extraction of one category page (safe to run in a parse pool worker):
+    the products as plain dicts and the pagination bar's hints.
+    """
+    # Extract all products in one pass: schema.org data when the page has it, else the tiles
+    items = UmartSpider.spec.extract_listing(response, {'categories': [category]}, stats, structured)
+    return {
+        'items': [dict(item) for item in items],
         # Looks for the specific '>' text in the pagination bar
-        next_page = response.xpath('//ul[contains(@class, "page")]//li/a[contains(text(), ">")]/@href').get()
-        if next_page:
-             # Recursive call to scrape the next page.
-             yield response.follow(next_page, callback=self.parse_category, meta=response.meta)
+        'next_page': response.xpath('//ul[contains(@class, "page")]//li/a[contains(text(), ">")]/@href').get(),
+        # The highest numbered link in the pagination bar is the page count
+        'total_pages': max_page_number(response.xpath('//ul[contains(@class, "page")]//li/a/text()').getall()),
+    }
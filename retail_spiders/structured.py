@@ -0,0 +1,181 @@
+"""
+Schema.org products embedded in listing pages: JSON-LD, microdata and OpenGraph.
+
+A retailer that publishes its listings as structured data describes every tile in
+one place and in a stable vocabulary (name, url, sku, offers.price), so reading it
+is a single pass over the page that keeps working when the layout classes targeted
+by the spiders' selectors are renamed. ExtractionSpec.extract_listing reads
+JSON-LD ahead of the spider's card selectors, and microdata/OpenGraph when the
+selectors find no card.
+
+* `detect`: the syntaxes a page carries, from a byte scan of the body (no parsing).
+* `extract_products`: every schema.org Product of one syntax, as plain dicts.
+* `product_values`: the ProductItem values of one Product, None when incomplete.
+
+JSON-LD and OpenGraph are read with extruct. Microdata is read by a single walk of
+the tree: extruct's W3C microdata extractor (itemref resolution, one XPath per
+property) costs about three times the compiled card selectors, the walk about 1.3x.
+"""
+from extruct.jsonld import JsonLdExtractor
+from extruct.opengraph import OpenGraphExtractor
+from lxml import etree
+
+from retail_spiders.items import remove_currency_symbol
+
+# Syntax -> bytes present in any page that uses it, in the order syntaxes are tried
+MARKERS = {
+    'json-ld': b'application/ld+json',
+    'microdata': b'itemscope',
+    'opengraph': b'price:amount',
+}
+
+# Read before the card selectors; the other syntaxes cost more than the selectors
+# they would replace and only stand in when no card is found
+PREFERRED = ('json-ld',)
+
+PRODUCT_TYPES = {'Product', 'IndividualProduct', 'ProductModel'}
+
+# Microdata: elements whose value is an attribute rather than their text
+VALUE_ATTRIBUTES = {'a': 'href', 'area': 'href', 'link': 'href', 'img': 'src', 'source': 'src',
+                    'audio': 'src', 'video': 'src', 'meta': 'content', 'time': 'datetime',
+                    'data': 'value', 'meter': 'value', 'object': 'data'}
+
+_jsonld = JsonLdExtractor()
+_opengraph = OpenGraphExtractor()
+
+
+def detect(body):
+    """Syntaxes whose marker appears in the raw body; a cheap pre-check before any parsing."""
+    return [syntax for syntax, marker in MARKERS.items() if marker in body]
+
+
+def extract_products(syntax, root):
+    """Every schema.org Product described in `syntax` on the page rooted at `root` (lxml)."""
+    if syntax == 'json-ld':
+        nodes = _jsonld.extract_items(root)
+    elif syntax == 'microdata':
+        nodes = read_microdata(root)
+    elif syntax == 'opengraph':
+        nodes = [_opengraph_product(dict(og['properties'])) for og in _opengraph.extract_items(root)]
+    else:
+        raise ValueError(f'Unknown structured data syntax: {syntax}')
+    products = []
+    _collect_products(nodes, products)
+    return products
+
+
+def _collect_products(node, products):
+    # Products can sit anywhere: top level, @graph, ItemList.itemListElement[].item, ...
+    if isinstance(node, list):
+        for child in node:
+            _collect_products(child, products)
+    elif isinstance(node, dict):
+        if _is_product(node.get('@type')):
+            products.append(node)
+            return
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                _collect_products(value, products)
+
+
+def _is_product(types):
+    if isinstance(types, str):
+        return types.rpartition('/')[2] in PRODUCT_TYPES
+    if isinstance(types, list):
+        return any(isinstance(t, str) and t.rpartition('/')[2] in PRODUCT_TYPES for t in types)
+    return False
+
+
+def read_microdata(root):
+    """
+    Top-level microdata items of a page, nested items as dicts (first value of each
+    property wins). One iterwalk over the tree; itemref is not supported.
+    """
+    items = []
+    scopes = []  # (element, item) of the open itemscopes, innermost last
+    current = None
+    for event, element in etree.iterwalk(root, events=('start', 'end')):
+        if event == 'end':
+            if element is current:
+                scopes.pop()
+                current = scopes[-1][0] if scopes else None
+            continue
+        get = element.get
+        prop = get('itemprop')
+        if get('itemscope') is None:
+            if prop is None or current is None:
+                continue
+            attribute = VALUE_ATTRIBUTES.get(element.tag)
+            value = get('content') or (get(attribute) if attribute else None)
+            if value is None:
+                value = element.text_content().strip()
+            item = scopes[-1][1]
+            for name in prop.split():
+                item.setdefault(name, value)
+            continue
+        item = {'@type': (get('itemtype') or '').split()}
+        if current is None:
+            items.append(item)
+        elif prop:
+            for name in prop.split():
+                scopes[-1][1].setdefault(name, item)
+        scopes.append((element, item))
+        current = element
+    return items
+
+
+def _opengraph_product(properties):
+    # Only product pages (og:type product / product.item) describe a product
+    if not str(properties.get('og:type', '')).startswith('product'):
+        return {}
+    return {
+        '@type': 'Product',
+        'name': properties.get('og:title'),
+        'url': properties.get('og:url'),
+        'sku': properties.get('product:retailer_item_id'),
+        'offers': {
+            'price': properties.get('product:price:amount') or properties.get('og:price:amount'),
+            'priceCurrency': properties.get('product:price:currency') or properties.get('og:price:currency'),
+        },
+    }
+
+
+def product_values(product, response):
+    """
+    ProductItem values (name, url, price, and currency/sku when given) of one
+    schema.org Product. None unless it has a name, a url and a price.
+    """
+    name, url = _first(product.get('name')), _first(product.get('url'))
+    if not isinstance(name, str) or not isinstance(url, str):
+        return None
+    offer = _first(product.get('offers'))
+    if not isinstance(offer, dict):
+        return None
+    price = _first(offer.get('price'))
+    if price is None:
+        price = _first(offer.get('lowPrice'))  # AggregateOffer
+    currency = offer.get('priceCurrency')
+    if price is None:
+        specification = _first(offer.get('priceSpecification'))
+        if isinstance(specification, dict):
+            price, currency = _first(specification.get('price')), specification.get('priceCurrency')
+    if price is None or isinstance(price, (dict, list, bool)):
+        return None
+    name, price = name.strip(), remove_currency_symbol(str(price))
+    if not name or not price:
+        return None
+    url = url.strip()
+    if '://' not in url:
+        url = response.urljoin(url)
+    values = {'name': name, 'url': url, 'price': price}
+    currency = _first(currency)
+    if currency and isinstance(currency, str):
+        values['currency'] = currency
+    sku = _first(product.get('sku'))
+    if sku is not None and not isinstance(sku, (dict, list)):
+        values['sku'] = str(sku)
+    return values
+
+
+def _first(value):
+    return (value[0] if value else None) if isinstance(value, list) else value
@@ -0,0 +1,134 @@
+import multiprocessing
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import scrapy
+from scrapy.settings import Settings
+
+
+class FlakyServer(ThreadingHTTPServer):
+    """Answers 503 to the first `failures` requests (all of them when None), then 200."""
+
+    def __init__(self, failures=None):
+        super().__init__(('127.0.0.1', 0), FlakyHandler)
+        self.failures = failures
+        self.served = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.served += 1
+            failing = server.failures is None or server.served <= server.failures
+        self.send_response(503 if failing else 200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class BreakerSpider(scrapy.Spider):
+    name = 'circuit_breaker_test'
+
+    async def start(self):
+        for i in range(20):
+            yield scrapy.Request(f'http://127.0.0.1:{self.port}/page-{i}', errback=self.errback,
+                                 meta={'handle_httpstatus_all': True})
+
+    def parse(self, response):
+        self.crawler.stats.inc_value(f'test/responses/{response.status}')
+
+    def errback(self, failure):
+        self.crawler.stats.inc_value('test/errbacks')
+
+
+def _crawl(overrides, port, results):
+    # Runs in a spawned process: each crawl needs a fresh reactor
+    from scrapy.crawler import CrawlerProcess
+
+    settings = Settings()
+    settings.setmodule('retail_spiders.settings')
+    settings.update(overrides)
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(BreakerSpider)
+    process.crawl(crawler, port=port)
+    process.start()
+    results.put(crawler.stats.get_stats())
+
+
+def crawl(server, **overrides):
+    settings = {
+        # The project's middleware order, with plain HTTP and no storage
+        'DOWNLOAD_HANDLERS': {'http': 'scrapy.core.downloader.handlers.http.HTTPDownloadHandler'},
+        'ITEM_PIPELINES': {},
+        'FEEDS': {},
+        'ROBOTSTXT_OBEY': False,
+        'DOWNLOAD_DELAY': 0.05,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
+        'CIRCUIT_BREAKER_MIN_REQUESTS': 5,
+        'CIRCUIT_BREAKER_INTERVAL': 0.2,
+        'CIRCUIT_BREAKER_COOLDOWN': 0.5,
+        'CIRCUIT_BREAKER_WINDOW': 10,
+        'CIRCUIT_BREAKER_BUCKET': 1,
+        'CIRCUIT_BREAKER_PROBES': 2,
+        # Guard: a breaker waiting on probes that never come back would hang the crawl
+        'CLOSESPIDER_TIMEOUT': 30,
+        'TELNETCONSOLE_ENABLED': False,
+        'LOG_LEVEL': 'ERROR',
+    }
+    settings.update(overrides)
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    start = time.monotonic()
+    process = context.Process(target=_crawl, args=(settings, server.server_address[1], results))
+    process.start()
+    stats = results.get(timeout=60)
+    process.join()
+    return stats, time.monotonic() - start
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_failing_domain_trips_despite_retries(self):
+        server = FlakyServer()
+        try:
+            # Every attempt is recorded before RetryMiddleware retries it, and failed probes reopen it
+            stats, elapsed = crawl(server, RETRY_TIMES=10, CIRCUIT_BREAKER_MAX_TRIPS=2)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(stats['finish_reason'], 'high_failure_rate')
+        self.assertEqual(stats['circuit_breaker/127.0.0.1/trips'], 2)
+        self.assertGreater(stats.get('circuit_breaker/parked', 0), 0)
+        self.assertLess(server.served, 100)
+        self.assertLess(elapsed, 20)
+
+    def test_recovered_domain_closes_and_releases_parked_requests(self):
+        server = FlakyServer(failures=10)
+        try:
+            stats, elapsed = crawl(server, RETRY_TIMES=2, CIRCUIT_BREAKER_MAX_TRIPS=0)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(stats['finish_reason'], 'finished')
+        self.assertGreaterEqual(stats['circuit_breaker/127.0.0.1/trips'], 1)
+        self.assertEqual(stats['circuit_breaker/127.0.0.1/state'], 'closed')
+        # Parking neither ran errbacks nor lost requests
+        self.assertNotIn('test/errbacks', stats)
+        responses = sum(count for key, count in stats.items() if key.startswith('test/responses/'))
+        self.assertEqual(responses, 20)
+        self.assertLess(elapsed, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import scrapy
+from scrapy.exceptions import IgnoreRequest
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.request import RequestFingerprinter
+
+from retail_spiders.frontier import FrontierScheduler, run_workers
+
+
+class DropMiddleware:
+    def process_request(self, request):
+        if 'drop' in request.url:
+            raise IgnoreRequest('dropped by test')
+        return None
+
+
+class DropSpider(scrapy.Spider):
+    name = 'frontier_drop'
+
+    async def start(self):
+        for i in range(6):
+            yield scrapy.Request(f'data:,keep-{i}')
+            yield scrapy.Request(f'data:,drop-{i}')
+
+    def parse(self, response):
+        yield {'body': response.text}
+
+
+class FrontierAckTest(unittest.TestCase):
+
+    def test_dropped_requests_are_acknowledged(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = Settings({
+                'FRONTIER_URL': f'sqlite:///{tmp}/%(name)s.sqlite',
+                'FRONTIER_BACKENDS': {'sqlite': 'retail_spiders.frontier.SQLiteFrontier'},
+                'FRONTIER_LEASE_TIMEOUT': 2,
+                'DOWNLOADER_MIDDLEWARES': {
+                    'retail_spiders.frontier.FrontierMiddleware': 10,
+                    'tests.test_frontier.DropMiddleware': 20,
+                },
+                'SPIDER_MIDDLEWARES': {'retail_spiders.frontier.FrontierSpiderMiddleware': 10},
+                # Guard: a crawl waiting on unacknowledged leases would otherwise never end
+                'CLOSESPIDER_TIMEOUT': 20,
+                'TELNETCONSOLE_ENABLED': False,
+                'LOG_LEVEL': 'WARNING',
+            })
+            totals, counts, elapsed = run_workers(DropSpider, 1, settings)
+
+        self.assertEqual(totals.get('item_scraped_count'), 6)
+        self.assertEqual((counts['queued'], counts['leased'], counts['done']), (0, 0, 12))
+        self.assertNotIn('frontier/reissued', totals)
+        self.assertNotIn('frontier/acked_idle', totals)
+        self.assertLess(elapsed, 20)
+
+
+class FrontierHoldTest(unittest.TestCase):
+
+    def test_held_lease_survives_the_idle_acknowledgement(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = Settings({
+                'FRONTIER_URL': f'sqlite:///{tmp}/%(name)s.sqlite',
+                'FRONTIER_BACKENDS': {'sqlite': 'retail_spiders.frontier.SQLiteFrontier'},
+            })
+            # An idle engine: nothing downloading or being parsed
+            engine = SimpleNamespace(downloader=SimpleNamespace(active=()),
+                                     scraper=SimpleNamespace(slot=SimpleNamespace(is_idle=lambda: True)))
+            crawler = SimpleNamespace(settings=settings, engine=engine, request_fingerprinter=RequestFingerprinter())
+            crawler.stats = StatsCollector(crawler)
+            scheduler = FrontierScheduler(crawler)
+            scheduler.open(SimpleNamespace(name='frontier_hold'))
+            try:
+                for i in range(2):
+                    scheduler.enqueue_request(scrapy.Request(f'https://example.com/{i}'))
+                parked, finished = scheduler.next_request(), scheduler.next_request()
+                # e.g. parked by the circuit breaker until its domain recovers
+                scheduler.hold(parked)
+                scheduler.has_pending_requests()
+                counts = scheduler.frontier.counts()
+                self.assertEqual((counts['leased'], counts['done']), (1, 1))
+                self.assertEqual(crawler.stats.get_value('frontier/acked_idle'), 1)
+
+                # Released: crawled again as a new entry, the held lease is finished
+                scheduler.enqueue_request(parked.replace(dont_filter=True))
+                scheduler.flush()
+                counts = scheduler.frontier.counts()
+                self.assertEqual((counts['queued'], counts['leased'], counts['done']), (1, 0, 2))
+            finally:
+                scheduler.close('finished')
+
+
+if __name__ == '__main__':
+    unittest.main()
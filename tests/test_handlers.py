@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+
+from retail_spiders.handlers import CurlCffiDownloadHandler
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a pooled session can reuse its connection
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/declared-large':
+            # Announces more than the max size; the body is never needed
+            self.send_response(200)
+            self.send_header('Content-Length', '5000')
+            self.end_headers()
+            self.write_slowly([b'x' * 1000] * 5)
+            return
+        if self.path == '/streamed-large':
+            self.send_chunked([b'x' * 300] * 10)
+            return
+        if self.path == '/next-data':
+            # The first stop marker is split across the first two chunks
+            self.send_chunked([b'<html><head><script id="__NEXT', b'_DATA__">{"props": {}}</script>',
+                               b'<body>' + b'y' * 500, b'</body></html>'])
+            return
+        body = b'<html>ok</html>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunked(self, chunks):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.write_slowly([b'%x\r\n%s\r\n' % (len(chunk), chunk) for chunk in chunks] + [b'0\r\n\r\n'])
+
+    def write_slowly(self, pieces):
+        # Separate writes, so curl hands them to the handler as separate chunks
+        try:
+            for piece in pieces:
+                self.wfile.write(piece)
+                self.wfile.flush()
+                time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The handler aborted the transfer
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer:
+
+    def __init__(self, handler):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_handler(**settings):
+    settings = Settings(settings)
+    stats = StatsCollector(SimpleNamespace(settings=settings))
+    return CurlCffiDownloadHandler(settings, stats), stats
+
+
+async def download(handler, *requests):
+    try:
+        return [await handler.download_request(request) for request in requests]
+    finally:
+        await handler.close()
+
+
+class CurlCffiDownloadHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalServer(PageHandler)
+        self.addCleanup(self.server.close)
+
+    def test_pooled_session_reuses_its_connection(self):
+        handler, stats = make_handler()
+        responses = asyncio.run(download(handler, Request(f'{self.server.url}/a'), Request(f'{self.server.url}/b')))
+
+        self.assertEqual([response.status for response in responses], [200, 200])
+        self.assertEqual(responses[1].text, '<html>ok</html>')
+        self.assertEqual(stats.get_value('curl_cffi/session/created'), 1)
+        self.assertEqual(stats.get_value('curl_cffi/session/reused'), 1)
+        self.assertEqual(stats.get_value('curl_cffi/connection/reused'), 1)
+
+    def test_declared_length_over_maxsize_is_cancelled(self):
+        handler, stats = make_handler(DOWNLOAD_MAXSIZE=1000)
+        with self.assertRaises(IgnoreRequest):
+            asyncio.run(download(handler, Request(f'{self.server.url}/declared-large')))
+        self.assertEqual(stats.get_value('curl_cffi/response/maxsize_exceeded'), 1)
+
+    def test_streamed_body_over_maxsize_is_aborted(self):
+        handler, stats = make_handler(DOWNLOAD_MAXSIZE=1000)
+
+        async def run():
+            with self.assertRaises(IgnoreRequest):
+                await handler.download_request(Request(f'{self.server.url}/streamed-large'))
+            # The aborted transfer doesn't break the pooled session
+            return await download(handler, Request(f'{self.server.url}/after'))
+
+        start = time.monotonic()
+        response, = asyncio.run(run())
+        self.assertEqual(stats.get_value('curl_cffi/response/maxsize_exceeded'), 1)
+        self.assertEqual(response.status, 200)
+        # Aborted after about 4 of the 10 chunks, not read to the end
+        self.assertLess(time.monotonic() - start, 0.45)
+
+    def test_stop_markers_split_across_chunks_cut_the_download(self):
+        handler, stats = make_handler(CURL_CFFI_STOP_MARKERS={'127.0.0.1': ['id="__NEXT_DATA__"', '</script>']})
+        response, = asyncio.run(download(handler, Request(f'{self.server.url}/next-data')))
+
+        self.assertEqual(response.flags, ['download_stopped'])
+        self.assertTrue(response.body.endswith(b'</script>'))
+        self.assertNotIn(b'<body>', response.body)
+        self.assertEqual(stats.get_value('curl_cffi/response/stopped_early'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from retail_spiders.hydration import FlightPayload, HydrationState
+
+
+def state(document):
+    return HydrationState(json.dumps(document, separators=(',', ':')).encode('utf-8'))
+
+
+class HydrationStateTest(unittest.TestCase):
+
+    def test_get_decodes_the_requested_subtree(self):
+        data = state({'props': {'pageProps': {'note': 'braces { [ and "quotes"', 'search': {'data': [1, 2]}}}})
+        self.assertEqual(data.get('props', 'pageProps', 'search', 'data'), [1, 2])
+        self.assertIsNone(data._data)  # Answered without decoding the whole document
+
+    def test_missing_path_with_the_key_elsewhere_raises(self):
+        data = state({'props': {'pageProps': {}, 'other': {'search': {'data': [1, 2]}}}})
+        with self.assertRaises(KeyError):
+            data.get('props', 'pageProps', 'search', 'data')
+
+    def test_key_under_a_list_does_not_match_an_object_path(self):
+        data = state({'props': [{'search': {'data': 1}}]})
+        with self.assertRaises(KeyError):
+            data.get('props', 'search', 'data')
+
+    def test_distant_ancestors_fall_back_to_a_full_decode(self):
+        data = state({'props': {'filler': ['x' * 100] * 400, 'search': {'data': 3}}})
+        self.assertEqual(data.get('props', 'search', 'data'), 3)
+        with self.assertRaises(KeyError):
+            data.get('props', 'missing', 'data')
+
+
+class FlightPayloadTest(unittest.TestCase):
+
+    def payload(self, *rows):
+        payload = FlightPayload()
+        payload.feed(''.join(f'{i:x}:{json.dumps(row)}\n' for i, row in enumerate(rows)).encode('utf-8'))
+        return payload
+
+    def test_suffix_match(self):
+        payload = self.payload(['$', 'div', None, {'searchResults': '$1'}], {'data': {'results': [1]}})
+        self.assertEqual(payload.get('props', 'pageProps', 'searchResults', 'data'), {'results': [1]})
+
+    def test_last_key_alone_does_not_match(self):
+        payload = self.payload(['$', 'div', None, {'navigation': {'data': ['unrelated']}}])
+        with self.assertRaises(KeyError):
+            payload.get('props', 'pageProps', 'searchResults', 'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
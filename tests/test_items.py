@@ -0,0 +1,33 @@
+import unittest
+
+from retail_spiders.items import format_cents, parse_price_cents, to_cents
+
+
+class PriceParsingTest(unittest.TestCase):
+
+    def test_parse_price_cents(self):
+        self.assertEqual(parse_price_cents('$1,299.95'), 129995)
+        self.assertEqual(parse_price_cents('19.9'), 1990)
+        self.assertEqual(parse_price_cents(0.29), 29)
+        self.assertIsNone(parse_price_cents('N/A'))
+
+    def test_parse_price_cents_keeps_the_sign(self):
+        self.assertEqual(parse_price_cents('-5.00'), -500)
+        self.assertEqual(parse_price_cents('$-12.50'), -1250)
+        self.assertEqual(parse_price_cents(-3), -300)
+
+    def test_format_cents_accepts_json_floats(self):
+        self.assertEqual(format_cents(129995), '1299.95')
+        self.assertEqual(format_cents(1299.0), '12.99')
+        self.assertEqual(format_cents(-5), '-0.05')
+        self.assertIsNone(format_cents('n/a'))
+
+    def test_to_cents(self):
+        self.assertEqual(to_cents(1299.0), 1299)
+        self.assertEqual(to_cents('1299'), 1299)
+        self.assertIsNone(to_cents(float('nan')))
+        self.assertIsNone(to_cents(True))
+
+
+if __name__ == '__main__':
+    unittest.main()